@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, DocumentChunk, ChatMessage
+from .models import Document, DocumentChunk, ChatMessage, IngestionJob, UploadBatch, UploadSession, ExtractedText, VectorCleanupTask
 
 # Register your models here.
 @admin.register(Document)
@@ -10,7 +10,7 @@ class DocumentAdmin(admin.ModelAdmin):
 
 @admin.register(DocumentChunk)
 class DocumentChunkAdmin(admin.ModelAdmin):
-    list_display = ['document', 'chunk_index', 'page_number', 'token_count']
+    list_display = ['document', 'chunk_index', 'page_start', 'page_end', 'token_count']
     list_filter = ['document']
     search_fields = ['content', 'document__title']
 
@@ -22,4 +22,34 @@ class ChatMessageAdmin(admin.ModelAdmin):
     
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
-    content_preview.short_description = 'Content'
\ No newline at end of file
+    content_preview.short_description = 'Content'
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ['document', 'status', 'attempts', 'locked_by', 'locked_until', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['document__title', 'locked_by']
+
+@admin.register(UploadBatch)
+class UploadBatchAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'file_count', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['user__email']
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'user', 'status', 'total_size', 'created_at', 'expires_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['filename', 'user__email']
+
+@admin.register(ExtractedText)
+class ExtractedTextAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'extractor_version', 'page_count', 'complete', 'created_at']
+    list_filter = ['extractor_version', 'complete']
+    search_fields = ['content_hash']
+
+@admin.register(VectorCleanupTask)
+class VectorCleanupTaskAdmin(admin.ModelAdmin):
+    list_display = ['document_id', 'user_id', 'attempts', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['last_error']
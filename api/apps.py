@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Vector cleanup of deleted documents, keyword index triggers after migrations
+        from . import signals
+
+        post_migrate.connect(signals.restore_keyword_index, sender=self)
+
+        # Load the embedding model at start up instead of on the first request,
+        # with gunicorn preload_app this runs in the master and workers share it after fork.
+        # Skipped when queries go to the embedding server (loaded on fallback only)
+        if settings.EMBEDDING_PRELOAD and not settings.EMBEDDING_SERVER_URL:
+            from .services.embedding_service import EmbeddingService
+            EmbeddingService.warm_up(encode=False)
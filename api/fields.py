@@ -0,0 +1,81 @@
+import struct
+from base64 import b64encode
+import numpy as np
+from django.conf import settings
+from django.db import models
+
+
+# Header written in front of every vector: magic, dtype code, dimension
+VECTOR_HEADER = struct.Struct('<ccH')
+VECTOR_MAGIC = b'V'
+VECTOR_DTYPES = {
+    b'f': np.dtype('<f4'),  # float32
+    b'e': np.dtype('<f2'),  # float16
+}
+DTYPE_CODES = {dtype: code for code, dtype in VECTOR_DTYPES.items()}
+
+
+def encode_vector(vector, dtype=None):
+    """
+    Pack a vector as header + raw little endian values
+    Args:
+        vector : list or numpy array of floats
+        dtype : 'float32' or 'float16' (defaults to EMBEDDING_STORAGE_DTYPE)
+    Return:
+        bytes : Encoded vector
+    """
+    dtype = np.dtype(dtype or getattr(settings, 'EMBEDDING_STORAGE_DTYPE', 'float32')).newbyteorder('<')
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported vector dtype : {dtype}")
+
+    array = np.asarray(vector, dtype=dtype).reshape(-1)
+    return VECTOR_HEADER.pack(VECTOR_MAGIC, DTYPE_CODES[dtype], array.shape[0]) + array.tobytes()
+
+
+def decode_vector(data):
+    """
+    Read an encoded vector without copying the values
+    Args:
+        data : bytes / memoryview produced by encode_vector()
+    Return:
+        numpy.ndarray : Read only 1-d view over the stored values
+    """
+    magic, code, dim = VECTOR_HEADER.unpack_from(data)
+    if magic != VECTOR_MAGIC or code not in VECTOR_DTYPES:
+        raise ValueError("Invalid vector data")
+    return np.frombuffer(data, dtype=VECTOR_DTYPES[code], count=dim, offset=VECTOR_HEADER.size)
+
+
+class VectorField(models.BinaryField):
+    """
+    Embedding stored as compact binary (float32 or float16 with dtype/dim header)
+    that reads back as a zero-copy numpy array
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decode_vector(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, str):
+            # Serialized (dumpdata) values are base64 strings
+            value = super().to_python(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decode_vector(value)
+        return np.asarray(value, dtype=np.float32)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return encode_vector(value)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        if value is None:
+            return None
+        if not isinstance(value, (bytes, bytearray, memoryview)):
+            value = encode_vector(value)
+        return b64encode(value).decode('ascii')
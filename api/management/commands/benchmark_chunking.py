@@ -0,0 +1,60 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Document
+from api.services.chunking_service import ChunkingService
+from api.services.pdf_service import PDFservice
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and chunk sizes of the token chunker against the character splitter'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--file', help='Path of a pdf file')
+        source.add_argument('--document', type=int, help='ID of an uploaded document')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per engine, the best run is reported')
+
+    def handle(self, *args, **options):
+        content_hash = None
+        if options['file']:
+            file_path = options['file']
+        else:
+            try:
+                document = Document.objects.get(id=options['document'])
+                file_path, content_hash = document.file.path, document.content_hash
+            except Document.DoesNotExist:
+                raise CommandError(f"Document with id {options['document']} not found")
+
+        encoding = ChunkingService.get_encoding()
+        if encoding is None:
+            raise CommandError(f"Tokenizer {ChunkingService.ENCODING_NAME} is not available")
+
+        # Extract once so only chunking is measured
+        pages = list(PDFservice.iter_pages(file_path, content_hash))
+        characters = sum(len(page['text']) for page in pages)
+        self.stdout.write(f"{len(pages)} pages, {characters} characters\n")
+
+        engines = [
+            ('character splitter', lambda: ChunkingService.iter_character_chunks(None, pages)),
+            ('token chunker', lambda: ChunkingService.iter_token_chunks(None, pages, encoding)),
+        ]
+
+        for name, run in engines:
+            best = None
+            for _ in range(max(1, options['repeat'])):
+                started = time.perf_counter()
+                chunks = list(run())
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+            token_counts = [chunk.token_count for chunk in chunks]
+            over_budget = sum(count > ChunkingService.CHUNK_TOKENS for count in token_counts)
+
+            self.stdout.write(name)
+            self.stdout.write(f"  time        : {best * 1000:.1f} ms")
+            self.stdout.write(f"  throughput  : {len(chunks) / best:.0f} chunks/s, {len(pages) / best:.0f} pages/s, {characters / best / 1e6:.2f} MB/s")
+            self.stdout.write(f"  chunks      : {len(chunks)}")
+            self.stdout.write(
+                f"  tokens      : min {min(token_counts)}, mean {sum(token_counts) / len(token_counts):.0f}, "
+                f"max {max(token_counts)}, over {ChunkingService.CHUNK_TOKENS}: {over_budget}"
+            )
@@ -0,0 +1,84 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from api.models import DocumentChunk
+from api.services.embedding_service import EmbeddingService
+
+
+def _normalize(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and cosine agreement of the torch and onnx embedding backends on stored chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Number of stored chunks to embed')
+        parser.add_argument('--document', type=int, help='Only chunks of this document')
+        parser.add_argument('--batch-size', type=int, default=32, help='Encode batch size')
+        parser.add_argument('--top-k', type=int, default=10, help='Neighbours compared for retrieval agreement')
+
+    def handle(self, *args, **options):
+        chunks = DocumentChunk.objects.order_by('id')
+        if options['document']:
+            chunks = chunks.filter(document_id=options['document'])
+        chunks = list(chunks.only('content', 'embedding')[:options['limit']])
+        if not chunks:
+            raise CommandError("No stored chunks to benchmark on")
+
+        texts = [chunk.content for chunk in chunks]
+        characters = sum(len(text) for text in texts)
+        self.stdout.write(f"{len(texts)} chunks, {characters} characters, batch size {options['batch_size']}\n")
+
+        results = {}
+        for backend in ['torch', 'onnx']:
+            try:
+                model = EmbeddingService.load_backend(backend)
+            except Exception as e:
+                raise CommandError(f"Could not load the {backend} backend: {e}")
+
+            # First call pays for lazy initialisation, keep it out of the timing
+            model.encode(texts[:options['batch_size']], batch_size=options['batch_size'], show_progress_bar=False)
+
+            started = time.perf_counter()
+            embeddings = model.encode(texts, batch_size=options['batch_size'], convert_to_numpy=True, show_progress_bar=False)
+            elapsed = time.perf_counter() - started
+
+            results[backend] = _normalize(embeddings.astype(np.float32))
+            self.stdout.write(backend)
+            self.stdout.write(f"  time        : {elapsed:.2f} s")
+            self.stdout.write(f"  throughput  : {len(texts) / elapsed:.1f} chunks/s, {characters / elapsed / 1e3:.1f} K chars/s")
+
+        torch_embeddings, onnx_embeddings = results['torch'], results['onnx']
+        self._report_agreement('onnx vs torch', onnx_embeddings, torch_embeddings)
+
+        # Vectors already indexed were produced by the configured backend
+        stored = [chunk.embedding for chunk in chunks]
+        if all(vector is not None for vector in stored):
+            stored = _normalize(np.vstack(stored).astype(np.float32))
+            if stored.shape == torch_embeddings.shape:
+                self._report_agreement('torch vs stored', torch_embeddings, stored)
+                self._report_agreement('onnx vs stored', onnx_embeddings, stored)
+
+        # Same neighbours for the same query is what matters for search
+        top_k = min(options['top_k'], len(texts) - 1)
+        if top_k > 0:
+            queries = min(100, len(texts))
+            overlaps = []
+            for index in range(queries):
+                torch_top = self._top_k(torch_embeddings, index, top_k)
+                onnx_top = self._top_k(onnx_embeddings, index, top_k)
+                overlaps.append(len(torch_top & onnx_top) / top_k)
+            self.stdout.write(f"\ntop-{top_k} neighbour overlap over {queries} chunk queries : {np.mean(overlaps) * 100:.1f}%")
+
+    def _report_agreement(self, label, a, b):
+        cosine = np.sum(a * b, axis=1)
+        self.stdout.write(
+            f"\ncosine {label:<16}: mean {cosine.mean():.5f}, p1 {np.percentile(cosine, 1):.5f}, min {cosine.min():.5f}"
+        )
+
+    def _top_k(self, embeddings, index, top_k):
+        scores = embeddings @ embeddings[index]
+        scores[index] = -np.inf
+        return set(np.argpartition(-scores, top_k)[:top_k].tolist())
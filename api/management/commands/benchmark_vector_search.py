@@ -0,0 +1,82 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Document
+from api.services.numpy_vector_store import NumpyVectorStore
+from api.services.vector_db_service import VectorDBService
+
+
+class Command(BaseCommand):
+    help = 'Compare search latency (p50 / p99) and results of the chroma and numpy vector backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, action='append', help='Document id to search (repeatable, default: completed documents)')
+        parser.add_argument('--limit', type=int, default=20, help='Documents benchmarked when --document is not given')
+        parser.add_argument('--queries', type=int, default=200, help='Searches per document and backend')
+        parser.add_argument('--top-k', type=int, default=5, help='Results per search')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(status='completed').order_by('id')
+        if options['document']:
+            documents = documents.filter(id__in=options['document'])
+        else:
+            documents = documents[:options['limit']]
+        documents = list(documents)
+        if not documents:
+            raise CommandError("No completed documents to benchmark on")
+
+        rng = np.random.default_rng(0)
+        timings = {'chroma': [], 'numpy': []}
+        overlaps = []
+        sizes = []
+
+        for document in documents:
+            chunks = document.chunks.exclude(embedding=None)
+            if not NumpyVectorStore.exists(document.id):
+                vectors = VectorDBService.build_numpy_index(document.id, chunks)
+                self.stdout.write(f"  built numpy index of document {document.id} ({vectors} vectors)")
+            stored = np.vstack([embedding for embedding in chunks.values_list('embedding', flat=True)]).astype(np.float32)
+            sizes.append(len(stored))
+
+            # Stored chunks plus noise stand in for user questions
+            picks = rng.integers(0, len(stored), options['queries'])
+            queries = stored[picks] + rng.normal(0, 0.02, (options['queries'], stored.shape[1])).astype(np.float32)
+            queries = [query.tolist() for query in queries]
+
+            # Warm both paths (client, collection lookup, memory map) before timing
+            self._chroma_search(document.id, queries[0], options['top_k'])
+            NumpyVectorStore.search(document.id, queries[0], options['top_k'])
+
+            for query in queries:
+                started = time.perf_counter()
+                chroma_results = self._chroma_search(document.id, query, options['top_k'])
+                timings['chroma'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                numpy_results = NumpyVectorStore.search(document.id, query, options['top_k'])
+                timings['numpy'].append(time.perf_counter() - started)
+
+                chroma_ids = {result['chunk_id'] for result in chroma_results}
+                numpy_ids = {result['chunk_id'] for result in numpy_results}
+                overlaps.append(len(chroma_ids & numpy_ids) / max(len(chroma_ids), 1))
+
+        self.stdout.write(
+            f"{len(documents)} documents ({min(sizes)}-{max(sizes)} chunks), "
+            f"{options['queries']} queries each, top-{options['top_k']}\n"
+        )
+        for backend, samples in timings.items():
+            samples = np.array(samples) * 1000
+            self.stdout.write(
+                f"{backend:<7}: p50 {np.percentile(samples, 50):.3f} ms, p99 {np.percentile(samples, 99):.3f} ms, "
+                f"mean {samples.mean():.3f} ms"
+            )
+        self.stdout.write(f"\ntop-{options['top_k']} overlap numpy vs chroma : {np.mean(overlaps) * 100:.1f}%")
+
+    def _chroma_search(self, document_id, query, top_k):
+        # Same path as a search request on the chroma backend (collection lookup included)
+        backend = VectorDBService.BACKEND
+        VectorDBService.BACKEND = 'chroma'
+        try:
+            return VectorDBService.search_similar_chunks(document_id, query, top_k)
+        finally:
+            VectorDBService.BACKEND = backend
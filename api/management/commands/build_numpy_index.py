@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from api.models import Document
+from api.services.numpy_vector_store import NumpyVectorStore
+from api.services.vector_db_service import VectorDBService
+
+
+class Command(BaseCommand):
+    help = 'Write the numpy exact-search files of documents indexed before VECTOR_DB_BACKEND was numpy / auto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, action='append', help='Only this document id (repeatable)')
+        parser.add_argument('--force', action='store_true', help='Rewrite files that already exist')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(status='completed').order_by('id')
+        if options['document']:
+            documents = documents.filter(id__in=options['document'])
+
+        built = skipped = 0
+        for document in documents.iterator():
+            if NumpyVectorStore.exists(document.id) and not options['force']:
+                skipped += 1
+                continue
+
+            chunk_count = document.chunks.count()
+            if not options['document'] and not VectorDBService.uses_numpy(chunk_count):
+                skipped += 1
+                continue
+
+            vectors = VectorDBService.build_numpy_index(document.id, document.chunks.all())
+            self.stdout.write(f"  document {document.id} : {vectors} vectors")
+            built += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} numpy indexes, skipped {skipped} documents"))
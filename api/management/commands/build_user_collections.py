@@ -0,0 +1,84 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from api.models import Document
+from api.services.vector_db_service import VectorDBService
+
+
+class Command(BaseCommand):
+    help = 'Copy the vectors of per document collections into the per user collections used by search_all'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only documents of this user id')
+        parser.add_argument('--document', type=int, action='append', help='Only this document id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=VectorDBService.BATCH_SIZE, help='Vectors copied per request')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(status='completed').order_by('user_id', 'id')
+        if options['user']:
+            documents = documents.filter(user_id=options['user'])
+        if options['document']:
+            documents = documents.filter(id__in=options['document'])
+
+        total = documents.count()
+        self.stdout.write(f"Copying {total} documents into user collections ...")
+
+        started = time.perf_counter()
+        vectors = 0
+        user_collections = {}
+        for position, document in enumerate(documents.iterator(), start=1):
+            user_collection = user_collections.get(document.user_id)
+            if user_collection is None:
+                user_collection = VectorDBService.get_or_create_user_collection(document.user_id)
+                user_collections = {document.user_id: user_collection}
+
+            # Re-running the command replaces what an earlier run copied
+            VectorDBService.remove_from_user_collection(document.user_id, document.id, collection=user_collection)
+
+            try:
+                copied = self._copy_collection(document, user_collection, options['batch_size'])
+            except ValueError:
+                # No per document collection, rebuild both from the stored chunk embeddings
+                copied = VectorDBService.upsert_chunks(
+                    document.id,
+                    document.chunks.exclude(embedding=None).order_by('chunk_index'),
+                    batch_size=options['batch_size'],
+                    user_collection=user_collection,
+                )
+            # Web processes reopen a user collection when a document's version changes
+            Document.objects.filter(id=document.id).update(index_version=F('index_version') + 1)
+            vectors += copied
+            self.stdout.write(f"  [{position}/{total}] document {document.id} (user {document.user_id}) : {copied} vectors")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Copied {vectors} vectors of {total} documents in {elapsed:.1f}s"))
+
+    def _copy_collection(self, document, user_collection, batch_size):
+        """
+        Page through the document collection and upsert it, tagged with document_id, into the user collection
+        Return:
+            int : Number of vectors copied
+        """
+        client = VectorDBService.get_client()
+        try:
+            collection = client.get_collection(name=VectorDBService.get_collection_name(document.id))
+        except Exception:
+            raise ValueError(f"Collection not found : {document.id}")
+
+        copied = 0
+        while True:
+            page = collection.get(
+                limit=batch_size,
+                offset=copied,
+                include=['embeddings', 'documents', 'metadatas'],
+            )
+            if not page['ids']:
+                return copied
+
+            user_collection.upsert(
+                ids=page['ids'],
+                embeddings=page['embeddings'],
+                documents=page['documents'],
+                metadatas=[dict(metadata, document_id=document.id) for metadata in page['metadatas']],
+            )
+            copied += len(page['ids'])
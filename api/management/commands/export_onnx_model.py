@@ -0,0 +1,41 @@
+import glob
+import os
+from django.core.management.base import BaseCommand, CommandError
+from api.services.embedding_service import EmbeddingService
+
+
+class Command(BaseCommand):
+    help = 'Export the embedding model to ONNX and write an int8 dynamically quantized copy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=EmbeddingService.ONNX_MODEL_PATH, help='Directory of the exported model')
+        parser.add_argument(
+            '--quantization', default='avx2', choices=['arm64', 'avx2', 'avx512', 'avx512_vnni'],
+            help='Target CPU instruction set of the quantized model',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+        except ImportError:
+            raise CommandError("sentence_transformers with ONNX support is required: pip install -r requirements-onnx.txt")
+
+        output = options['output']
+        quantization = options['quantization']
+
+        # Loading with the onnx backend exports the PyTorch weights to onnx/model.onnx
+        self.stdout.write(f"Exporting {EmbeddingService.MODEL_NAME} to ONNX ...")
+        model = SentenceTransformer(EmbeddingService.MODEL_NAME, backend='onnx')
+        model.save_pretrained(output)
+
+        self.stdout.write(f"Quantizing for {quantization} ...")
+        export_dynamic_quantized_onnx_model(model, quantization_config=quantization, model_name_or_path=output)
+
+        # avx2 is quantized to unsigned int8 (quint8), the other targets to qint8
+        written = glob.glob(os.path.join(output, 'onnx', f'model_*int8_{quantization}.onnx'))
+        if not written:
+            raise CommandError(f"Quantized model was not written to {os.path.join(output, 'onnx')}")
+        file_name = os.path.relpath(written[0], output)
+
+        self.stdout.write(self.style.SUCCESS(f"Saved {os.path.join(output, file_name)}"))
+        self.stdout.write(f"Use it with EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_MODEL_PATH={output} EMBEDDING_ONNX_FILE={file_name}")
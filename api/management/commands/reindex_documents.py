@@ -0,0 +1,267 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from api.models import Document, IngestionJob
+
+
+def _lower_priority(nice, threads):
+    """Leave CPU to the web and ingest processes"""
+    if nice:
+        os.nice(nice)
+
+    import torch
+    torch.set_num_threads(threads)
+
+
+_worker_ready = False
+
+
+def _prepare_document(document_id, nice, threads):
+    """
+    Extract, chunk and embed a document (runs in a worker process), nothing is written
+    Args:
+        document_id : ID of the document
+        nice : Niceness added to the worker process
+        threads : Torch threads of the worker process
+    Return:
+        tuple : (document id, page count, list of unsaved embedded DocumentChunk)
+    """
+    from api.services.chunking_service import ChunkingService
+    from api.services.dedup_service import DeduplicationService
+    from api.services.embedding_service import EmbeddingService
+    from api.services.pdf_service import PDFservice
+
+    global _worker_ready
+    if not _worker_ready:
+        _lower_priority(nice, threads)
+        # One process per document already, don't start pools inside the pool
+        PDFservice.MAX_WORKERS = 1
+        EmbeddingService.ENCODE_PROCESSES = 1
+        _worker_ready = True
+
+    close_old_connections()
+    document = Document.objects.get(id=document_id)
+
+    content_hash = document.content_hash or DeduplicationService.hash_file(document.file)
+    page_count = PDFservice.get_page_count(document.file.path, content_hash)
+    pages = PDFservice.iter_pages(document.file.path, content_hash, page_count)
+
+    chunks = list(ChunkingService.iter_chunks(document, pages))
+    EmbeddingService.embed_chunks(chunks)
+
+    return document_id, page_count, chunks
+
+
+class Command(BaseCommand):
+    help = 'Rebuild chunks, embeddings and vector collections of existing documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only documents of this user (id or email)')
+        parser.add_argument(
+            '--status', action='append', choices=[choice for choice, _ in Document.status_choice],
+            help='Only documents with this status, repeatable (default: completed and failed)',
+        )
+        parser.add_argument('--since', help='Only documents uploaded on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only documents uploaded before this date (YYYY-MM-DD)')
+        parser.add_argument('--document', type=int, action='append', help='Only this document id, repeatable')
+        parser.add_argument(
+            '--processes', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+            help='Worker processes extracting, chunking and embedding documents',
+        )
+        parser.add_argument('--threads', type=int, default=1, help='Torch threads per worker process')
+        parser.add_argument(
+            '--checkpoint', default=os.path.join(settings.BASE_DIR, 'reindex_checkpoint.json'),
+            help='File recording finished documents, an interrupted run resumes from it',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between documents')
+        parser.add_argument('--nice', type=int, default=10, help='Niceness added to the worker processes')
+        parser.add_argument(
+            '--ignore-queue', action='store_true',
+            help="Don't pause while uploads are waiting in the ingest queue",
+        )
+        parser.add_argument(
+            '--max-queue-wait', type=float, default=600,
+            help='Seconds to wait for the ingest queue before each document, then go on anyway',
+        )
+
+    def handle(self, *args, **options):
+        documents = self._filter_documents(options)
+        filters = {key: options[key] for key in ['user', 'status', 'since', 'until', 'document']}
+
+        checkpoint = self._load_checkpoint(options['checkpoint'], filters, options['restart'])
+        done = set(checkpoint['done'])
+
+        document_ids = [document_id for document_id in documents.values_list('id', flat=True) if document_id not in done]
+        if not document_ids:
+            self.stdout.write("Nothing to reindex")
+            return
+
+        processes = max(1, options['processes'])
+        self.stdout.write(
+            f"Reindexing {len(document_ids)} documents with {processes} processes"
+            + (f" ({len(done)} already done, resuming)" if done else "")
+        )
+
+        stats = {'documents': 0, 'chunks': 0, 'failed': 0}
+        started = time.perf_counter()
+
+        def record(document_id, result=None, error=None):
+            if error is None:
+                stats['documents'] += 1
+                stats['chunks'] += result['chunk_count']
+                checkpoint['done'].append(document_id)
+                checkpoint['failed'].pop(str(document_id), None)
+            else:
+                stats['failed'] += 1
+                checkpoint['failed'][str(document_id)] = error
+                self.stderr.write(f"Document {document_id} failed: {error}")
+            self._save_checkpoint(options['checkpoint'], checkpoint)
+            self._report(stats, len(document_ids), time.perf_counter() - started)
+
+        if processes == 1:
+            self._run_in_process(document_ids, options, record)
+        else:
+            self._run_in_pool(document_ids, processes, options, record)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Reindexed {stats['documents']} documents, {stats['chunks']} chunks in {elapsed:.1f}s "
+            f"({stats['documents'] / elapsed:.2f} docs/s, {stats['chunks'] / elapsed:.1f} chunks/s), "
+            f"{stats['failed']} failed"
+        ))
+
+        if not stats['failed']:
+            os.remove(options['checkpoint'])
+
+    def _run_in_process(self, document_ids, options, record):
+        from api.services.ingestion_service import IngestionService
+
+        _lower_priority(options['nice'], max(1, options['threads']))
+
+        for document_id in document_ids:
+            self._throttle(options)
+            document = Document.objects.get(id=document_id)
+            try:
+                record(document_id, IngestionService.process_document(document))
+            except Exception as e:
+                document.mark_as_failed(str(e))
+                record(document_id, error=str(e))
+
+    def _run_in_pool(self, document_ids, processes, options, record):
+        from api.services.ingestion_service import IngestionService
+
+        threads = max(1, options['threads'])
+        remaining = iter(document_ids)
+        pending = {}  # future -> document id
+
+        # Workers load Django first, this module imports models and is only unpickled afterwards
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=django.setup) as executor:
+            while True:
+                # Keep one document queued per worker, results are written by this process only
+                while len(pending) < processes * 2:
+                    document_id = next(remaining, None)
+                    if document_id is None:
+                        break
+                    self._throttle(options)
+                    pending[executor.submit(_prepare_document, document_id, options['nice'], threads)] = document_id
+
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    document_id = pending.pop(future)
+                    try:
+                        _, page_count, chunks = future.result()
+                    except Exception as e:
+                        # Nothing was written, the document keeps its current index
+                        record(document_id, error=str(e))
+                        continue
+
+                    document = Document.objects.get(id=document_id)
+                    try:
+                        record(document_id, IngestionService.index_chunks(document, chunks, page_count))
+                    except Exception as e:
+                        document.mark_as_failed(str(e))
+                        record(document_id, error=str(e))
+
+    def _filter_documents(self, options):
+        documents = Document.objects.all()
+
+        if options['user']:
+            user = options['user']
+            documents = documents.filter(user_id=int(user)) if user.isdigit() else documents.filter(user__email=user)
+
+        documents = documents.filter(status__in=options['status'] or ['completed', 'failed'])
+
+        for option, lookup in [('since', 'uploaded_at__gte'), ('until', 'uploaded_at__lt')]:
+            if options[option]:
+                try:
+                    date = timezone.make_aware(datetime.strptime(options[option], '%Y-%m-%d'))
+                except ValueError:
+                    raise CommandError(f"--{option} must be a date like 2025-12-30")
+                documents = documents.filter(**{lookup: date})
+
+        if options['document']:
+            documents = documents.filter(id__in=options['document'])
+
+        # Documents the ingest worker is handling are left alone
+        busy = IngestionJob.objects.filter(status__in=['queued', 'processing']).values('document_id')
+        return documents.exclude(id__in=busy).order_by('id')
+
+    def _throttle(self, options):
+        if options['pause']:
+            time.sleep(options['pause'])
+
+        if options['ignore_queue']:
+            return
+
+        # New uploads go first. A job whose lease expired belongs to a worker that died,
+        # it is left for lease recovery instead of blocking the reindex
+        deadline = time.monotonic() + options['max_queue_wait']
+        waited = False
+        while IngestionJob.objects.filter(
+            Q(status='queued') | Q(status='processing', locked_until__gt=timezone.now())
+        ).exists():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stdout.write(f"Ingest queue still busy after {options['max_queue_wait']:.0f}s, going on")
+                return
+            if not waited:
+                self.stdout.write("Ingest queue busy, waiting ...")
+                waited = True
+            time.sleep(min(settings.INGEST_POLL_INTERVAL, remaining))
+
+    def _load_checkpoint(self, path, filters, restart):
+        if not restart and os.path.exists(path):
+            with open(path) as file:
+                checkpoint = json.load(file)
+            if checkpoint.get('filters') == filters:
+                return checkpoint
+            self.stdout.write("Checkpoint is from a run with other filters, starting over")
+        return {'filters': filters, 'done': [], 'failed': {}}
+
+    def _save_checkpoint(self, path, checkpoint):
+        # Write then rename so an interrupt never leaves a half written file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(temp_path, path)
+
+    def _report(self, stats, total, elapsed):
+        finished = stats['documents'] + stats['failed']
+        self.stdout.write(
+            f"[{finished}/{total}] {stats['documents'] / elapsed:.2f} docs/s, "
+            f"{stats['chunks'] / elapsed:.1f} chunks/s, {stats['failed']} failed"
+        )
@@ -0,0 +1,27 @@
+from urllib.parse import urlparse
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.services.embedding_server import serve
+
+
+class Command(BaseCommand):
+    help = 'Serve query embeddings over local HTTP, batching concurrent requests into one model call'
+
+    def add_arguments(self, parser):
+        url = urlparse(settings.EMBEDDING_SERVER_URL or 'http://127.0.0.1:8765')
+        parser.add_argument('--host', default=url.hostname, help='Interface to bind')
+        parser.add_argument('--port', type=int, default=url.port, help='Port to listen on')
+        parser.add_argument(
+            '--max-batch', type=int, default=settings.EMBEDDING_SERVER_MAX_BATCH,
+            help='Most texts encoded in one model call',
+        )
+        parser.add_argument(
+            '--max-wait-ms', type=float, default=settings.EMBEDDING_SERVER_MAX_WAIT_MS,
+            help='How long a request waits for others to join its batch',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            serve(options['host'], options['port'], max(1, options['max_batch']), options['max_wait_ms'] / 1000)
+        except KeyboardInterrupt:
+            self.stdout.write("Embedding server stopped")
@@ -0,0 +1,115 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from api.models import IngestionJob
+from api.services.ingestion_service import IngestionService
+from api.services.upload_service import ChunkedUploadService
+from api.services.vector_cleanup_service import VectorCleanupService
+
+
+def _run_job(job_id):
+    """Run a single claimed job inside a worker thread"""
+    close_old_connections()
+    try:
+        job = IngestionJob.objects.select_related('document').get(id=job_id)
+        return IngestionService.run_job(job)
+    finally:
+        # Each thread owns its own connection, close it when the job is done
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Process queued document uploads (extract, chunk, embed, index) in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.INGEST_WORKER_CONCURRENCY,
+            help='Number of documents processed at the same time',
+        )
+        parser.add_argument(
+            '--visibility-timeout', type=int, default=settings.INGEST_VISIBILITY_TIMEOUT,
+            help='Seconds before a job held by an unresponsive worker is requeued',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.INGEST_POLL_INTERVAL,
+            help='Seconds to wait between queue polls when idle',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is empty instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        visibility_timeout = options['visibility_timeout']
+        poll_interval = options['poll_interval']
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        self.stdout.write(f"Ingest worker {worker_id} started (concurrency={concurrency}, visibility timeout={visibility_timeout}s)")
+
+        # Jobs left in processing by a crashed worker become visible again here
+        IngestionService.recover_stale_jobs()
+
+        in_flight = {}  # future -> job id
+        last_recovery = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ingest') as executor:
+            while True:
+                # Reap finished jobs
+                for future in [f for f in in_flight if f.done()]:
+                    job_id = in_flight.pop(future)
+                    status = 'completed' if future.exception() is None and future.result() is not None else 'failed'
+                    self.stdout.write(f"Job {job_id} {status}")
+
+                if self._stopping:
+                    if not in_flight:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                # Keep the claims of running jobs alive
+                if in_flight:
+                    IngestionService.extend_lease(in_flight.values(), worker_id, visibility_timeout)
+
+                # Periodically requeue jobs abandoned by other workers and drop expired uploads
+                if time.monotonic() - last_recovery > visibility_timeout / 2:
+                    IngestionService.recover_stale_jobs()
+                    ChunkedUploadService.purge_expired()
+                    last_recovery = time.monotonic()
+
+                # Fill free slots
+                claimed = False
+                while len(in_flight) < concurrency:
+                    job = IngestionService.claim_next_job(worker_id, visibility_timeout)
+                    if job is None:
+                        break
+                    claimed = True
+                    self.stdout.write(f"Job {job.id} claimed for document {job.document_id}")
+                    in_flight[executor.submit(_run_job, job.id)] = job.id
+
+                if options['once'] and not in_flight and not claimed:
+                    break
+
+                if not claimed:
+                    # Idle: remove the vectors of deleted documents
+                    try:
+                        VectorCleanupService.process_pending()
+                    except Exception as e:
+                        self.stderr.write(f"Vector cleanup failed : {e}")
+                    time.sleep(poll_interval)
+
+        self.stdout.write("Ingest worker stopped")
+
+    def _request_stop(self, signum, frame):
+        """Stop claiming new jobs and exit once in-flight jobs finish"""
+        self.stdout.write("Shutdown requested, waiting for in-flight jobs ...")
+        self._stopping = True
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from api.models import VectorCleanupTask
+from api.services.vector_cleanup_service import VectorCleanupService
+
+
+class Command(BaseCommand):
+    help = 'Remove the vectors of deleted documents from chroma and the numpy store, optionally compact storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be removed without deleting anything')
+        parser.add_argument(
+            '--compact', action='store_true',
+            help='Also remove orphan chroma segment directories and vacuum chroma, stop the web and ingest processes first',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        size_before = VectorCleanupService.storage_size()
+
+        if dry_run:
+            self.stdout.write(f"Pending cleanup tasks : {VectorCleanupTask.objects.count()}")
+        else:
+            cleaned = VectorCleanupService.process_pending(limit=None)
+            failed = VectorCleanupTask.objects.count()
+            self.stdout.write(f"Cleanup tasks : {cleaned} processed, {failed} failing")
+
+        removed = VectorCleanupService.collect_garbage(dry_run=dry_run)
+        self.stdout.write(
+            f"Orphans : {removed['collections']} collections, {removed['user_vectors']} user collection vectors, "
+            f"{removed['numpy_files']} numpy files"
+        )
+
+        if options['compact']:
+            compacted = VectorCleanupService.compact(dry_run=dry_run)
+            self.stdout.write(
+                f"Compaction : {compacted['segment_dirs']} segment directories, {compacted['temp_files']} temp files"
+                + (", chroma vacuumed" if compacted['vacuumed'] else "")
+            )
+            for error in compacted['errors']:
+                self.stderr.write(error)
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Dry run, vector storage is {size_before / 1e6:.1f} MB"))
+            return
+
+        size_after = VectorCleanupService.storage_size()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reclaimed {(size_before - size_after) / 1e6:.1f} MB ({size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB)"
+        ))
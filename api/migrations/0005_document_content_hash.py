@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 05:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_ingestionjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the file content', max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['content_hash', 'status'], name='api_documen_content_62e5af_idx'),
+        ),
+    ]
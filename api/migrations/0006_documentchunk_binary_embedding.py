@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-18 06:05
+
+import api.fields
+from django.db import migrations
+
+
+BATCH_SIZE = 500
+
+
+def json_to_binary(apps, schema_editor):
+    DocumentChunk = apps.get_model('api', 'DocumentChunk')
+    chunks = DocumentChunk.objects.exclude(embedding=None).only('id', 'embedding')
+
+    batch = []
+    for chunk in chunks.iterator(chunk_size=BATCH_SIZE):
+        chunk.embedding_vector = api.fields.encode_vector(chunk.embedding)
+        batch.append(chunk)
+        if len(batch) >= BATCH_SIZE:
+            DocumentChunk.objects.bulk_update(batch, ['embedding_vector'])
+            batch = []
+    if batch:
+        DocumentChunk.objects.bulk_update(batch, ['embedding_vector'])
+
+
+def binary_to_json(apps, schema_editor):
+    DocumentChunk = apps.get_model('api', 'DocumentChunk')
+    chunks = DocumentChunk.objects.exclude(embedding_vector=None).only('id', 'embedding_vector')
+
+    batch = []
+    for chunk in chunks.iterator(chunk_size=BATCH_SIZE):
+        chunk.embedding = chunk.embedding_vector.astype(float).tolist()
+        batch.append(chunk)
+        if len(batch) >= BATCH_SIZE:
+            DocumentChunk.objects.bulk_update(batch, ['embedding'])
+            batch = []
+    if batch:
+        DocumentChunk.objects.bulk_update(batch, ['embedding'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='embedding_vector',
+            field=api.fields.VectorField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='documentchunk',
+            name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='documentchunk',
+            old_name='embedding_vector',
+            new_name='embedding',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 05:55
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_page_number(apps, schema_editor):
+    # Existing chunks were attributed to a single page
+    DocumentChunk = apps.get_model('api', 'DocumentChunk')
+    DocumentChunk.objects.update(page_start=F('page_number'), page_end=F('page_number'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_documentchunk_binary_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='page_end',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='page_start',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_page_number, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 06:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the file content', max_length=64)),
+                ('extractor_version', models.CharField(max_length=64)),
+                ('page_count', models.IntegerField(default=0)),
+                ('complete', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('content_hash', 'extractor_version')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ExtractedPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField()),
+                ('text', models.BinaryField()),
+                ('char_count', models.IntegerField(default=0)),
+                ('extracted', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='api.extractedtext')),
+            ],
+            options={
+                'ordering': ['page_number'],
+                'unique_together': {('extracted', 'page_number')},
+            },
+        ),
+    ]
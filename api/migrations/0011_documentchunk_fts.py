@@ -0,0 +1,64 @@
+from django.db import migrations
+
+
+# External content FTS5 index over DocumentChunk.content, kept in sync by triggers.
+# document_id is indexed too, so a search ANDs the terms with the document's posting list
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS api_documentchunk_fts USING fts5(
+        content, document_id,
+        content='api_documentchunk', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_documentchunk_fts_insert AFTER INSERT ON api_documentchunk BEGIN
+        INSERT INTO api_documentchunk_fts(rowid, content, document_id) VALUES (new.id, new.content, new.document_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_documentchunk_fts_delete AFTER DELETE ON api_documentchunk BEGIN
+        INSERT INTO api_documentchunk_fts(api_documentchunk_fts, rowid, content, document_id) VALUES ('delete', old.id, old.content, old.document_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_documentchunk_fts_update AFTER UPDATE OF content, document_id ON api_documentchunk BEGIN
+        INSERT INTO api_documentchunk_fts(api_documentchunk_fts, rowid, content, document_id) VALUES ('delete', old.id, old.content, old.document_id);
+        INSERT INTO api_documentchunk_fts(rowid, content, document_id) VALUES (new.id, new.content, new.document_id);
+    END
+    """,
+    # Index the chunks that already exist
+    "INSERT INTO api_documentchunk_fts(api_documentchunk_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS api_documentchunk_fts_insert",
+    "DROP TRIGGER IF EXISTS api_documentchunk_fts_delete",
+    "DROP TRIGGER IF EXISTS api_documentchunk_fts_update",
+    "DROP TABLE IF EXISTS api_documentchunk_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 is SQLite only, other databases keep vector search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_extracted_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_documentchunk_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='index_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped every time the chunks are (re)indexed, keys the search cache'),
+        ),
+    ]
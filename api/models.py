@@ -1,10 +1,26 @@
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from .fields import VectorField
 
 User = get_user_model()
 # Create your models here.
 
+class UploadBatch(models.Model):
+    """Group of documents uploaded together through bulk upload"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_batches')
+    file_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Batch {self.id} - {self.file_count} files - {self.user.email}'
+
+
 class Document(models.Model):
 
     status_choice = [
@@ -23,32 +39,62 @@ class Document(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, help_text='SHA-256 of the file content')
+    batch = models.ForeignKey(UploadBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='documents')
+    index_version = models.PositiveIntegerField(default=0, help_text='Bumped every time the chunks are (re)indexed, keys the search cache')
 
 
     class Meta:
         ordering = ['-uploaded_at']
         indexes = [
             models.Index(fields=['user', 'status']),
-            models.Index(fields=['uploaded_at'])
+            models.Index(fields=['uploaded_at']),
+            models.Index(fields=['content_hash', 'status']),
         ]
 
     def __str__(self):
         return f'{self.title} - {self.user.email}'
     
+    def _update(self, **fields):
+        """
+        Write fields with a single UPDATE: concurrent changes to other fields are kept,
+        and a document deleted while it was processed is not inserted again
+        Return:
+            bool : False if the document no longer exists
+        """
+        updated = Document.objects.filter(pk=self.pk).update(**fields)
+        for name, value in fields.items():
+            if not hasattr(value, 'resolve_expression'):
+                setattr(self, name, value)
+        if updated and 'index_version' in fields:
+            self.refresh_from_db(fields=['index_version'])
+        return bool(updated)
+
     def mark_as_processing(self):
-        self.status = 'processing'
-        self.save()
+        return self._update(status='processing')
+
+    def mark_as_indexing(self):
+        # The old chunks and vectors are about to be replaced: searches stop until completion,
+        # and results cached under the previous version are never served again
+        return self._update(status='processing', index_version=F('index_version') + 1)
 
-    def mark_as_completed(self):
-        self.status = 'completed'
-        self.process_at = timezone.now()
-        self.save()
+    def mark_as_pending(self):
+        return self._update(status='pending')
 
+    def mark_as_completed(self, page_count=None):
+        fields = {
+            'status': 'completed',
+            'processed_at': timezone.now(),
+            'error_message': None,
+            # Results cached while the index was being rebuilt don't apply either
+            'index_version': F('index_version') + 1,
+        }
+        if page_count is not None:
+            fields['page_count'] = page_count
+        return self._update(**fields)
 
     def mark_as_failed(self, error):
-        self.status = 'failed'
-        self.error_message = error
-        self.save()
+        return self._update(status='failed', error_message=error)
 
         
 
@@ -57,8 +103,10 @@ class DocumentChunk(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
     content = models.TextField()
     chunk_index = models.IntegerField()
-    page_number = models.IntegerField(null=True, blank=True)
-    embedding = models.JSONField(null=True, blank=True) # store data as json array 
+    page_number = models.IntegerField(null=True, blank=True) # same as page_start, kept for existing clients
+    page_start = models.IntegerField(null=True, blank=True)
+    page_end = models.IntegerField(null=True, blank=True)
+    embedding = VectorField(null=True, blank=True) # float32/float16 bytes, read back as numpy array
     token_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -94,4 +142,141 @@ class ChatMessage(models.Model):
         ]
 
     def __str__(self):
-        return f'{self.role} - {self.content[:50]} ...'
\ No newline at end of file
+        return f'{self.role} - {self.content[:50]} ...'
+
+
+class VectorCleanupTask(models.Model):
+    """Vectors of a deleted document, removed in the background by the ingest worker"""
+
+    # Plain ids, the document (and maybe its user) no longer exist
+    document_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f'Cleanup of document {self.document_id} (attempt {self.attempts})'
+
+
+class IngestionJob(models.Model):
+    """Queued background processing of an uploaded document"""
+
+    STATUS_CHOICES = [
+        ('queued', 'queued'),
+        ('processing', 'processing'),
+        ('completed', 'completed'),
+        ('failed', 'failed'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    locked_by = models.CharField(max_length=255, null=True, blank=True) # worker that claimed the job
+    locked_until = models.DateTimeField(null=True, blank=True) # visibility timeout of the claim
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f'{self.document_id} - {self.status} (attempt {self.attempts})'
+
+
+
+class UploadSession(models.Model):
+    """Resumable upload of a large file sent in fixed size parts"""
+
+    STATUS_CHOICES = [
+        ('active', 'active'),
+        ('completed', 'completed'),
+        ('aborted', 'aborted'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    part_size = models.IntegerField()
+    expected_hash = models.CharField(max_length=64, null=True, blank=True, help_text='SHA-256 announced by the client')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.filename} - {self.status} - {self.user.email}'
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.total_size // self.part_size))
+
+    def part_range(self, part_number):
+        """Byte offset and length of a part (numbered from 1)"""
+        offset = (part_number - 1) * self.part_size
+        return offset, min(self.part_size, self.total_size - offset)
+
+
+class UploadPart(models.Model):
+    """Part of an upload session already written to the staging file"""
+
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='parts')
+    part_number = models.IntegerField()
+    size = models.IntegerField()
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['part_number']
+        unique_together = ['session', 'part_number']
+
+    def __str__(self):
+        return f'Part {self.part_number} of upload {self.session_id}'
+
+
+class ExtractedText(models.Model):
+    """Extracted page texts of a pdf, shared by every document with the same content"""
+
+    content_hash = models.CharField(max_length=64, help_text='SHA-256 of the file content')
+    extractor_version = models.CharField(max_length=64)
+    page_count = models.IntegerField(default=0)
+    complete = models.BooleanField(default=False) # all pages written
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['content_hash', 'extractor_version']
+
+    def __str__(self):
+        return f'{self.content_hash[:12]} - {self.extractor_version} - {self.page_count} pages'
+
+
+class ExtractedPage(models.Model):
+    """zlib compressed text of one page"""
+
+    extracted = models.ForeignKey(ExtractedText, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.IntegerField()
+    text = models.BinaryField()
+    char_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['page_number']
+        unique_together = ['extracted', 'page_number']
+
+    def __str__(self):
+        return f'Page {self.page_number} of {self.extracted_id}'
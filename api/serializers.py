@@ -1,6 +1,9 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Document, ChatMessage, DocumentChunk
+from .models import Document, ChatMessage, DocumentChunk, UploadBatch, UploadSession
+from .services.dedup_service import DeduplicationService
+from .services.upload_service import ChunkedUploadService
 
 User = get_user_model()
 
@@ -10,7 +13,7 @@ class DocumentChunkSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = DocumentChunk
-        fields = ['id', 'content', 'chunk_index', 'page_number', 'token_count', 'created_at']
+        fields = ['id', 'content', 'chunk_index', 'page_number', 'page_start', 'page_end', 'token_count', 'created_at']
         read_only_fields = ['id', 'created_at']
 
 
@@ -48,9 +51,9 @@ class DocumentSerializer(serializers.ModelSerializer):
         if not file.name.lower().endswith('.pdf'):
             raise serializers.ValidationError('Only PDF files are allowed')
         
-        max_size = 10 * 1024 * 1024  # 10MB
+        max_size = settings.MAX_UPLOAD_SIZE
         if file.size > max_size:
-            raise serializers.ValidationError("File size cannot exceed 10MB")
+            raise serializers.ValidationError(f"File size cannot exceed {max_size // (1024 * 1024)}MB")
         
         return file 
     
@@ -62,15 +65,18 @@ class DocumentSerializer(serializers.ModelSerializer):
         file = validated_data['file']
         title = file.name.rsplit('.', 1)[0]
 
-        # Create document
-        document = Document.objects.create(
+        document = Document(
             user=user,
             title=title,
-            file=file,
             file_size=file.size,
+            batch=validated_data.get('batch'),
             status='pending'
         )
-        
+
+        # Store the file, the content hash detects re-uploads of the same file
+        DeduplicationService.save_file(document, file)
+        document.save()
+
         return document
     
 
@@ -97,6 +103,91 @@ class DocumentListSerializer(serializers.ModelSerializer):
         return obj.status == 'completed'
     
 
+class UploadBatchSerializer(serializers.ModelSerializer):
+    """Serializer for a bulk upload with the progress of its documents"""
+
+    documents = serializers.SerializerMethodField()
+    status_counts = serializers.SerializerMethodField()
+    is_complete = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadBatch
+        fields = ['id', 'file_count', 'created_at', 'status_counts', 'is_complete', 'documents']
+        read_only_fields = fields
+
+    def get_documents(self, obj):
+        """Get per document progress"""
+        return [
+            {
+                'id': document.id,
+                'title': document.title,
+                'status': document.status,
+                'page_count': document.page_count,
+                'error_message': document.error_message,
+            }
+            for document in sorted(obj.documents.all(), key=lambda document: document.id)
+        ]
+
+    def get_status_counts(self, obj):
+        """Count documents per status"""
+        counts = {status: 0 for status, _ in Document.status_choice}
+        for document in obj.documents.all():
+            counts[document.status] = counts.get(document.status, 0) + 1
+        return counts
+
+    def get_is_complete(self, obj):
+        """Check if every document finished processing"""
+        return all(document.status in ('completed', 'failed') for document in obj.documents.all())
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for resumable uploads, lists the parts already received"""
+
+    part_count = serializers.IntegerField(read_only=True)
+    received_parts = serializers.SerializerMethodField()
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', source='expected_hash', required=False, allow_null=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'total_size', 'sha256', 'part_size', 'part_count',
+            'status', 'received_parts', 'document', 'created_at', 'expires_at'
+        ]
+        read_only_fields = ['id', 'part_size', 'part_count', 'status', 'received_parts', 'document', 'created_at', 'expires_at']
+
+    def get_received_parts(self, obj):
+        """Get parts already written, so a client can resume"""
+        return [
+            {'part_number': part.part_number, 'size': part.size, 'sha256': part.sha256}
+            for part in obj.parts.all()
+        ]
+
+    def validate_filename(self, filename):
+        """Validate the upload is a PDF file"""
+        if not filename.lower().endswith('.pdf'):
+            raise serializers.ValidationError('Only PDF files are allowed')
+        return filename
+
+    def validate_total_size(self, total_size):
+        """Validate the announced file size"""
+        if total_size <= 0:
+            raise serializers.ValidationError('File is empty')
+
+        max_size = ChunkedUploadService.MAX_SIZE
+        if total_size > max_size:
+            raise serializers.ValidationError(f"File size cannot exceed {max_size // (1024 * 1024)}MB")
+        return total_size
+
+    def create(self, validated_data):
+        """Start the upload session and its staging file"""
+        return ChunkedUploadService.create_session(
+            user=self.context['request'].user,
+            filename=validated_data['filename'],
+            total_size=validated_data['total_size'],
+            expected_hash=validated_data.get('expected_hash'),
+        )
+
+
 class ChatMessageSerializer(serializers.ModelSerializer):
     """Serializer for chat messages with source chunks"""
     
@@ -121,6 +212,8 @@ class ChatMessageSerializer(serializers.ModelSerializer):
             {
                 'chunk_index': chunk.chunk_index,
                 'page_number': chunk.page_number,
+                'page_start': chunk.page_start,
+                'page_end': chunk.page_end,
                 'content_preview': chunk.content[:100] + '...' if len(chunk.content) > 100 else chunk.content
             }
             for chunk in chunks
@@ -0,0 +1,123 @@
+import os
+import zipfile
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from .ingestion_service import IngestionService
+from ..models import UploadBatch
+
+
+class BulkUploadService:
+    """
+    Service for uploading many documents in one request
+    """
+
+    MAX_FILES = getattr(settings, 'BULK_UPLOAD_MAX_FILES', 500)
+
+    @staticmethod
+    def _open_archive(archive):
+        try:
+            return zipfile.ZipFile(archive)
+        except zipfile.BadZipFile:
+            raise ValueError("Archive is not a valid zip file")
+
+    @staticmethod
+    def _file_members(zip_file):
+        for info in zip_file.infolist():
+            name = os.path.basename(info.filename)
+
+            # Skip folders and OS metadata (__MACOSX/, ._file.pdf)
+            if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            yield info, name
+
+    @staticmethod
+    def count_archive_files(archive):
+        """
+        Count the files of a zip archive from its directory, nothing is extracted
+        Args:
+            archive : Uploaded zip file
+        Return:
+            int : Number of files iter_archive_files yields
+        """
+        zip_file = BulkUploadService._open_archive(archive)
+        with zip_file:
+            count = sum(1 for _ in BulkUploadService._file_members(zip_file))
+        archive.seek(0)
+        return count
+
+    @staticmethod
+    def iter_archive_files(archive):
+        """
+        Yield the pdf members of a zip archive as files that stream from the archive
+        Args:
+            archive : Uploaded zip file
+        Yield:
+            django.core.files.File : One pdf member
+        """
+        zip_file = BulkUploadService._open_archive(archive)
+
+        with zip_file:
+            for info, name in BulkUploadService._file_members(zip_file):
+                with zip_file.open(info) as member:
+                    file = File(member, name=name)
+                    # Size from the zip directory, the member stream can't report it cheaply
+                    file.size = info.file_size
+                    yield file
+
+    @staticmethod
+    def create_batch(request, files, serializer_class):
+        """
+        Validate and store every file, creating all documents in one transaction.
+        Files saved to storage are deleted again if the transaction is rolled back
+        Args:
+            request : Current request (owner of the documents)
+            files : Iterable of uploaded files
+            serializer_class : Serializer used to validate and create each document
+        Return:
+            tuple : (UploadBatch or None, list of rejected files with errors)
+        """
+        accepted = []
+        rejected = []
+
+        try:
+            with transaction.atomic():
+                batch = UploadBatch.objects.create(user=request.user)
+
+                for file in files:
+                    # Callers count the files first, this only guards against an unchecked iterable
+                    if len(accepted) + len(rejected) >= BulkUploadService.MAX_FILES:
+                        raise ValueError(f"A bulk upload can contain at most {BulkUploadService.MAX_FILES} files")
+
+                    serializer = serializer_class(data={'file': file}, context={'request': request})
+                    if not serializer.is_valid():
+                        rejected.append({'file': file.name, 'errors': serializer.errors})
+                        continue
+
+                    document = serializer.save(batch=batch)
+                    accepted.append(document)
+
+                if not accepted:
+                    transaction.set_rollback(True)
+                    return None, rejected
+
+                batch.file_count = len(accepted)
+                batch.save()
+
+                for document in accepted:
+                    IngestionService.enqueue(document)
+        except BaseException:
+            # The rows are rolled back, the files already written to storage are not
+            BulkUploadService._delete_files(accepted)
+            raise
+
+        print(f"Bulk upload {batch.id}: {len(accepted)} files queued, {len(rejected)} rejected")
+        return batch, rejected
+
+    @staticmethod
+    def _delete_files(documents):
+        for document in documents:
+            try:
+                document.file.delete(save=False)
+            except Exception as e:
+                print(f"Could not delete {document.file.name}: {e}")
@@ -1,76 +1,332 @@
+from bisect import bisect_right
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import tiktoken
+from django.conf import settings
 from ..models import Document, DocumentChunk
 
 class ChunkingService:
 
+    # Token native chunking (default)
+    ENCODING_NAME = 'cl100k_base'
+    CHUNK_TOKENS = getattr(settings, 'CHUNK_TOKENS', 250) # tokens per chunk
+    CHUNK_OVERLAP_TOKENS = getattr(settings, 'CHUNK_OVERLAP_TOKENS', 50) # Overlap between chunks in tokens
+    BOUNDARY_LOOKBACK = 0.2 # fraction of a chunk searched backwards for a clean cut
+    ENCODE_BATCH_PAGES = 16 # pages encoded together with encode_ordinary_batch
+
+    # Character chunking (fallback when the tokenizer is unavailable)
     CHUNK_SIZE = 1000 # characters per chunk
     CHUNK_OVERLAP = 200 # Overlap between chunks
-    
-    @staticmethod
-    def chunk_deocument(document, pdf_data):
+    STREAM_WINDOW = 8 # chunks worth of text buffered before splitting while streaming
 
+    # Preferred cut points, best first
+    BOUNDARIES = [b"\n\n", b"\n", b".", b"?", b"!"]
 
-        # Delete the existing chunk of document if available
-        DocumentChunk.objects.filter(document=document).delete()
+    _encoding = None
+    _encoding_failed = False
 
+    @classmethod
+    def get_encoding(cls):
+        """
+        Load the tiktoken encoder once per process
+        Return:
+            tiktoken.Encoding or None : None when the encoder can't be loaded
+        """
+        if cls._encoding is None and not cls._encoding_failed:
+            try:
+                cls._encoding = tiktoken.get_encoding(cls.ENCODING_NAME)
+            except Exception as e:
+                print(f"Could not load tokenizer {cls.ENCODING_NAME}: {e}, falling back to character chunking")
+                cls._encoding_failed = True
+        return cls._encoding
+
+    @staticmethod
+    def _get_text_splitter():
         # Initialize text splitter
-        text_splitter = RecursiveCharacterTextSplitter(
+        return RecursiveCharacterTextSplitter(
             chunk_size = ChunkingService.CHUNK_SIZE,
             chunk_overlap = ChunkingService.CHUNK_OVERLAP,
             length_function = len,
-            separators = ["\n\n", "\n", ".", " ", ""]
+            separators = ["\n\n", "\n", ".", " ", ""],
+            add_start_index = True,
         )
+    
+    @staticmethod
+    def iter_chunks(document, pages):
+        """
+        Split a stream of pages into chunks without holding the whole text
+        Args:
+            document : Document instance
+            pages : Iterable of page dicts (page_number, text)
+        Yield:
+            DocumentChunk : Unsaved chunk with index, page span and token count
+        """
+        encoding = ChunkingService.get_encoding()
+        if encoding is None:
+            return ChunkingService.iter_character_chunks(document, pages)
+        return ChunkingService.iter_token_chunks(document, pages, encoding)
 
-        # Split text into chunks
-        text_chunk = text_splitter.split_text(pdf_data['text'])
-
-        # Create chunk report
-        chunk_object = []
-        for index, chunk_text in enumerate(text_chunk):
-            # Finding which page this chunk belongs to 
-            page_number = ChunkingService._find_page_number(
-                chunk_text,
-                pdf_data.get('pages', [])
-            )
-            # Count token
-            token_count = ChunkingService._count_tokens(chunk_text)
-
-            chunk_object.append(
-                DocumentChunk(
-                    document=document,
-                    content=chunk_text,
-                    chunk_index=index,
-                    page_number=page_number,
-                    token_count=token_count,
-                )
-            )
-        
-        # Bulk create all chunks 
-        DocumentChunk.objects.bulk_create(chunk_object)
+    @staticmethod
+    def iter_token_chunks(document, pages, encoding):
+        """
+        Split a stream of pages into chunks of CHUNK_TOKENS tokens. Pages are
+        encoded in batches and chunks are cut directly from the token stream, so
+        token counts come from the split itself and nothing is encoded twice.
+        Args:
+            document : Document instance
+            pages : Iterable of page dicts (page_number, text)
+            encoding : tiktoken.Encoding
+        Yield:
+            DocumentChunk : Unsaved chunk with index, page span and token count
+        """
+        size = ChunkingService.CHUNK_TOKENS
+        overlap = min(ChunkingService.CHUNK_OVERLAP_TOKENS, size // 2)
+
+        tokens = [] # buffered tokens
+        token_offset = 0 # position of tokens[0] in the token stream
+        start = 0 # stream position where the next chunk begins
+        emitted_until = 0 # stream position after the last emitted chunk
+        page_starts = [] # stream positions where the pages still buffered begin (page marker)
+        text_starts = [] # stream positions where their text begins (after the marker)
+        page_numbers = []
+        chunk_index = 0
+
+        for page_batch in ChunkingService._batched(pages, ChunkingService.ENCODE_BATCH_PAGES):
+            # Marker and text encoded apart to know where the text starts. The separator
+            # ends the page, so a cut after it doesn't count as reaching the next page
+            segments = []
+            for page in page_batch:
+                segments.append(f"---- page {page['page_number']} ----\n\n")
+                segments.append(f"{page['text']}\n\n")
+            encoded = encoding.encode_ordinary_batch(segments)
+
+            for i, page in enumerate(page_batch):
+                marker_tokens, text_tokens = encoded[2 * i], encoded[2 * i + 1]
+                page_starts.append(token_offset + len(tokens))
+                text_starts.append(page_starts[-1] + len(marker_tokens))
+                page_numbers.append(page['page_number'])
+                tokens.extend(marker_tokens)
+                tokens.extend(text_tokens)
+
+            # Emit every full chunk available in the buffer
+            while token_offset + len(tokens) - start >= size:
+                end = ChunkingService._find_cut(encoding, tokens, start - token_offset, start - token_offset + size) + token_offset
+                chunk = ChunkingService._token_chunk(document, encoding, tokens[start - token_offset:end - token_offset], chunk_index, start, page_starts, text_starts, page_numbers)
+                if chunk is not None:
+                    yield chunk
+                    chunk_index += 1
+                emitted_until = end
+                start = ChunkingService._find_overlap_start(encoding, tokens, max(end - overlap, start + 1) - token_offset, end - token_offset) + token_offset
+
+            # Drop tokens and pages no longer needed
+            drop = start - token_offset
+            if drop > 0:
+                del tokens[:drop]
+                token_offset = start
+                first = max(bisect_right(page_starts, start) - 1, 0)
+                page_starts = page_starts[first:]
+                text_starts = text_starts[first:]
+                page_numbers = page_numbers[first:]
+
+        # Flush the tail after the last page
+        end = token_offset + len(tokens)
+        if end > emitted_until:
+            chunk = ChunkingService._token_chunk(document, encoding, tokens[start - token_offset:], chunk_index, start, page_starts, text_starts, page_numbers)
+            if chunk is not None:
+                yield chunk
+
+    @staticmethod
+    def _find_cut(encoding, tokens, start, end):
+        """
+        Pick where a chunk ends, preferring paragraph, line and sentence boundaries
+        near the size limit over cutting mid sentence
+        Args:
+            encoding : tiktoken.Encoding
+            tokens : Buffered tokens
+            start : Index of the first token of the chunk
+            end : Index after the last token allowed in the chunk
+        Return:
+            int : Index after the last token of the chunk
+        """
+        lowest = max(end - int((end - start) * ChunkingService.BOUNDARY_LOOKBACK), start + 1)
+        token_bytes = [encoding.decode_single_token_bytes(token) for token in tokens[lowest - 1:end]]
+
+        # Cut right after a token ending a paragraph, line or sentence
+        for boundary in ChunkingService.BOUNDARIES:
+            for i in range(len(token_bytes) - 1, -1, -1):
+                if token_bytes[i].endswith(boundary):
+                    return lowest + i
+
+        # Otherwise cut before a word (tokens carry their leading space)
+        for i in range(len(token_bytes) - 1, 0, -1):
+            if token_bytes[i].startswith(b" "):
+                return lowest - 1 + i
+
+        # Never split a multi byte character across chunks
+        while end > lowest and end < len(tokens) and not ChunkingService._starts_character(encoding, tokens[end]):
+            end -= 1
+        return end
 
-        return len(chunk_object)
+    @staticmethod
+    def _find_overlap_start(encoding, tokens, start, end):
+        """
+        Move the start of the overlap forward to the beginning of a word
+        Args:
+            encoding : tiktoken.Encoding
+            tokens : Buffered tokens
+            start : Earliest index the next chunk may start at
+            end : End of the previous chunk
+        Return:
+            int : Index where the next chunk starts
+        """
+        for i in range(start, end):
+            token_bytes = encoding.decode_single_token_bytes(tokens[i])
+            if token_bytes[:1] in (b" ", b"\n"):
+                return i
+        for i in range(start, end):
+            if ChunkingService._starts_character(encoding, tokens[i]):
+                return i
+        return start
 
+    @staticmethod
+    def _starts_character(encoding, token):
+        # UTF-8 continuation bytes look like 0b10xxxxxx
+        token_bytes = encoding.decode_single_token_bytes(token)
+        return not token_bytes or (token_bytes[0] & 0xC0) != 0x80
 
+    @staticmethod
+    def _token_chunk(document, encoding, chunk_tokens, chunk_index, start, page_starts, text_starts, page_numbers):
+        # Trim whitespace tokens, the page span and token count cover the stored text only
+        first, last = 0, len(chunk_tokens)
+        while first < last and not encoding.decode_single_token_bytes(chunk_tokens[first]).strip():
+            first += 1
+        while last > first and not encoding.decode_single_token_bytes(chunk_tokens[last - 1]).strip():
+            last -= 1
 
+        chunk_text = encoding.decode(chunk_tokens[first:last]).strip()
+        if not chunk_text:
+            return None
+        return ChunkingService._build_chunk(
+            document, chunk_text, chunk_index, start + first, start + last,
+            page_starts, page_numbers, token_count=last - first, text_starts=text_starts,
+        )
 
+    @staticmethod
+    def _batched(iterable, size):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
     @staticmethod
-    def _find_page_number(chunk_text, pages):
-        chunk_start = chunk_text[:100].strip()
+    def iter_character_chunks(document, pages):
+        """
+        Split a stream of pages into chunks of CHUNK_SIZE characters
+        (previous engine, used when the tokenizer can't be loaded)
+        Args:
+            document : Document instance
+            pages : Iterable of page dicts (page_number, text)
+        Yield:
+            DocumentChunk : Unsaved chunk with index, page span and token count
+        """
+        text_splitter = ChunkingService._get_text_splitter()
+        window = ChunkingService.CHUNK_SIZE * ChunkingService.STREAM_WINDOW
+
+        buffer = ""
+        buffer_offset = 0 # offset of the buffer start in the streamed text
+        page_starts = [] # offsets where the pages still in the buffer begin (page marker)
+        text_starts = [] # offsets where their text begins (after the marker)
+        page_numbers = []
+        chunk_index = 0
+
         for page in pages:
-            if chunk_start in page['text']:
-                return page['page_number']
-        return None
+            if buffer:
+                buffer += "\n\n"
+            marker = f"---- page {page['page_number']} ----\n\n"
+            page_starts.append(buffer_offset + len(buffer))
+            text_starts.append(page_starts[-1] + len(marker))
+            page_numbers.append(page['page_number'])
+            buffer += f"{marker}{page['text']}"
+
+            if len(buffer) < window:
+                continue
+
+            documents = text_splitter.create_documents([buffer])
+
+            # Keep the last chunk buffered, the next page may continue it
+            for doc in documents[:-1]:
+                start = buffer_offset + ChunkingService._start_index(doc, buffer)
+                end = start + len(doc.page_content)
+                yield ChunkingService._build_chunk(document, doc.page_content, chunk_index, start, end, page_starts, page_numbers, text_starts=text_starts)
+                chunk_index += 1
+
+            tail_start = ChunkingService._start_index(documents[-1], buffer) if documents else len(buffer)
+            buffer = buffer[tail_start:]
+            buffer_offset += tail_start
+
+            # Forget pages that end before the buffer
+            first = max(bisect_right(page_starts, buffer_offset) - 1, 0)
+            page_starts = page_starts[first:]
+            text_starts = text_starts[first:]
+            page_numbers = page_numbers[first:]
+
+        # Flush whatever is left after the last page
+        if buffer:
+            for doc in text_splitter.create_documents([buffer]):
+                start = buffer_offset + ChunkingService._start_index(doc, buffer)
+                end = start + len(doc.page_content)
+                yield ChunkingService._build_chunk(document, doc.page_content, chunk_index, start, end, page_starts, page_numbers, text_starts=text_starts)
+                chunk_index += 1
+
+    @staticmethod
+    def _build_chunk(document, chunk_text, chunk_index, start, end, page_starts, page_numbers, token_count=None, text_starts=None):
+        page_start, page_end = ChunkingService._page_span(start, end, page_starts, page_numbers, text_starts)
+        return DocumentChunk(
+            document=document,
+            content=chunk_text,
+            chunk_index=chunk_index,
+            page_number=page_start,
+            page_start=page_start,
+            page_end=page_end,
+            token_count=token_count if token_count is not None else ChunkingService._count_tokens(chunk_text),
+        )
+
+    @staticmethod
+    def _start_index(doc, text):
+        # Splitter offset of the chunk, it reports -1 when it could not locate it
+        start = doc.metadata.get('start_index', -1)
+        return start if start >= 0 else max(text.rfind(doc.page_content), 0)
+
+    @staticmethod
+    def _page_span(start, end, page_starts, page_numbers, text_starts=None):
+        """
+        Find the first and last page of a chunk by binary search on page offsets
+        Args:
+            start : Offset (character or token) of the start of the chunk
+            end : Offset after the end of the chunk
+            page_starts : Sorted offsets where each page (including its marker) begins
+            page_numbers : Page number of each offset
+            text_starts : Sorted offsets where the text of each page begins, a chunk
+                ending inside the marker of the next page doesn't reach that page
+        Return:
+            tuple : (page_start, page_end), None when there are no pages
+        """
+        if not page_starts:
+            return None, None
+        first = max(bisect_right(page_starts, start) - 1, 0)
+        last = max(bisect_right(text_starts or page_starts, max(end - 1, start)) - 1, first)
+        return page_numbers[first], page_numbers[last]
 
 
     @staticmethod
     def _count_tokens(text):
         try:
             # Use tiktoken for accurate token counting
-            encoding = tiktoken.get_encoding('cl100k_base')
-            tokens = encoding.encode(text)
-            return len(tokens)
+            encoding = ChunkingService.get_encoding()
+            return len(encoding.encode_ordinary(text))
         except:
             # Rough estimate of token length 
             return len(text) // 4
@@ -89,7 +345,10 @@ class ChunkingService:
             }
         
         total_tokens = sum(chunk.token_count for chunk in chunks)
-        pages = set(chunk.page_number for chunk in chunks if chunk.page_number)
+        pages = set()
+        for chunk in chunks:
+            if chunk.page_start:
+                pages.update(range(chunk.page_start, (chunk.page_end or chunk.page_start) + 1))
 
         return {
             'total_chunks':chunks.count(),   
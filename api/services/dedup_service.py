@@ -0,0 +1,173 @@
+import hashlib
+from django.conf import settings
+from django.core.files import File
+from .vector_db_service import VectorDBService
+from ..models import Document, DocumentChunk
+
+
+class HashingFile(File):
+    """
+    File that hashes its content as storage reads it, for files that did not come
+    through the hashing upload handlers (zip members of a bulk upload)
+    """
+
+    def __init__(self, file, name=None):
+        super().__init__(file, name)
+        self.digest = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size):
+            self.digest.update(chunk)
+            yield chunk
+
+
+class DeduplicationService:
+    """
+    Service for detecting re-uploaded files and reusing their processed data
+    """
+
+    # Chunks copied per batch when cloning a document
+    BATCH_SIZE = getattr(settings, 'INGEST_BATCH_SIZE', 64)
+
+    @staticmethod
+    def hash_file(file):
+        """
+        Compute the SHA-256 of an uploaded file chunk by chunk
+        Args:
+            file : Django File / UploadedFile
+        Return:
+            str : Hex digest
+        """
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+
+        # Rewind so the file can still be saved to storage
+        file.seek(0)
+        return digest.hexdigest()
+
+    @staticmethod
+    def save_file(document, file):
+        """
+        Write an uploaded file to the document's storage and set its content_hash,
+        without reading the file again: multipart uploads were hashed by the upload
+        handler (api/upload_handlers.py), other files are hashed while they are written
+        Args:
+            document : Unsaved Document instance
+            file : UploadedFile or File
+        """
+        content_hash = getattr(file, 'content_hash', None)
+        if content_hash is None:
+            file = HashingFile(file, name=file.name)
+
+        document.file.save(file.name, file, save=False)
+        document.content_hash = content_hash or file.digest.hexdigest()
+
+    @staticmethod
+    def find_processed_duplicate(content_hash, user_id, exclude_id=None):
+        """
+        Find the latest completed document of a user with the same content. Only the
+        user's own documents are reused, a document never gets chunks or vectors that
+        were produced for another account
+        Args:
+            content_hash : SHA-256 hex digest
+            user_id : Owner of the new upload
+            exclude_id : Document ID to ignore (the new upload itself)
+        Return:
+            Document or None : Processed document with identical content
+        """
+        if not content_hash:
+            return None
+
+        duplicates = Document.objects.filter(content_hash=content_hash, user_id=user_id, status='completed')
+        if exclude_id is not None:
+            duplicates = duplicates.exclude(id=exclude_id)
+        return duplicates.order_by('-processed_at').first()
+
+    @staticmethod
+    def reuse_processed(document):
+        """
+        Complete a document from an identical processed one when there is one (ingest worker),
+        skipping extraction and embedding
+        Args:
+            document : Document instance with content_hash set
+        Return:
+            dict or None : page and chunk counts, None if there is no usable duplicate
+        """
+        source = DeduplicationService.find_processed_duplicate(document.content_hash, document.user_id, exclude_id=document.id)
+        if source is None:
+            return None
+
+        try:
+            chunk_count = DeduplicationService.clone_document(source, document)
+        except Exception as e:
+            # Fall back to the normal processing path, it starts from a clean state
+            print(f"Reusing document {source.id} failed: {e}")
+            return None
+
+        return {
+            'page_count': source.page_count,
+            'chunk_count': chunk_count,
+            'embedded_chunks': 0,
+        }
+
+    @staticmethod
+    def clone_document(source, document):
+        """
+        Copy chunks and vectors of an already processed document, skipping the pipeline.
+        This is a copy, not a reference: searches, keyword index and cleanup all work per
+        document collection and chunk rows, so the new document gets its own
+        Args:
+            source : Completed Document with the same content
+            document : New Document instance
+        Return:
+            int : Number of chunks copied
+        """
+        print(f"Duplicate of document {source.id}, reusing its chunks and vectors ...")
+
+        document.mark_as_indexing()
+        DocumentChunk.objects.filter(document=document).delete()
+        collection = VectorDBService.create_collection(document.id)
+        user_collection = VectorDBService.get_or_create_user_collection(document.user_id)
+        VectorDBService.remove_from_user_collection(document.user_id, document.id, collection=user_collection)
+
+        chunk_count = 0
+        last_index = -1
+        while True:
+            # Pages rather than one open cursor: a SQLite read held across the writes
+            # deadlocks with the worker's lease updates
+            page = list(
+                source.chunks.filter(chunk_index__gt=last_index).order_by('chunk_index')[:DeduplicationService.BATCH_SIZE]
+            )
+            if not page:
+                break
+            last_index = page[-1].chunk_index
+
+            chunk_count += DeduplicationService._write_batch(document, collection, user_collection, [
+                DocumentChunk(
+                    document=document,
+                    content=chunk.content,
+                    chunk_index=chunk.chunk_index,
+                    page_number=chunk.page_number,
+                    page_start=chunk.page_start,
+                    page_end=chunk.page_end,
+                    embedding=chunk.embedding,
+                    token_count=chunk.token_count,
+                )
+                for chunk in page
+            ])
+
+        if VectorDBService.uses_numpy(chunk_count):
+            VectorDBService.build_numpy_index(document.id, document.chunks.all())
+
+        document.mark_as_completed(page_count=source.page_count)
+
+        print(f"Reused {chunk_count} chunks from document {source.id}")
+        return chunk_count
+
+    @staticmethod
+    def _write_batch(document, collection, user_collection, chunks):
+        if not chunks:
+            return 0
+        DocumentChunk.objects.bulk_create(chunks)
+        return VectorDBService.upsert_chunks(document.id, chunks, collection=collection, user_collection=user_collection)
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from django.conf import settings
+
+
+class EmbeddingCache:
+    """
+    Persistent content addressed cache of embeddings
+
+    Vectors are stored as raw float32 blobs in a small SQLite file, keyed by
+    sha256(model name + normalized text), and evicted least recently used first
+    """
+
+    CACHE_PATH = getattr(settings, 'EMBEDDING_CACHE_PATH', os.path.join(settings.BASE_DIR, 'embedding_cache.sqlite3'))
+    MAX_ENTRIES = getattr(settings, 'EMBEDDING_CACHE_MAX_ENTRIES', 200000)
+    ENABLED = getattr(settings, 'EMBEDDING_CACHE_ENABLED', True)
+
+    # SQLite limits the number of bound parameters per statement
+    QUERY_BATCH = 500
+    # Lookups don't write: the last_used time of hits is buffered and written with the
+    # next insert, or on its own once this many keys are pending
+    TOUCH_BATCH = 256
+    # Rows this process inserts between two checks of the table size for eviction
+    EVICT_CHECK_INTERVAL = 1000
+
+    _local = threading.local()
+    _touched = {}
+    _touched_lock = threading.Lock()
+    _inserted_since_check = 0
+
+    @staticmethod
+    def normalize(text):
+        """Collapse whitespace so formatting differences don't miss the cache"""
+        return " ".join(text.split())
+
+    @staticmethod
+    def make_key(model_name, text):
+        """
+        Build the cache key of a text
+        Args:
+            model_name : Embedding model identifier
+            text : Text that was embedded
+        Return:
+            bytes : sha256 digest
+        """
+        normalized = EmbeddingCache.normalize(text)
+        return hashlib.sha256(f"{model_name}\0{normalized}".encode('utf-8')).digest()
+
+    @classmethod
+    def get_connection(cls):
+        """
+        Get the SQLite connection of the current thread (and process)
+        Return:
+            sqlite3.Connection : Open connection
+        """
+        local = cls._local
+        if getattr(local, 'connection', None) is None or local.pid != os.getpid():
+            os.makedirs(os.path.dirname(cls.CACHE_PATH), exist_ok=True)
+
+            connection = sqlite3.connect(cls.CACHE_PATH, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            connection.commit()
+
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    @classmethod
+    def get_many(cls, model_name, texts):
+        """
+        Look up cached embeddings
+        Args:
+            model_name : Embedding model identifier
+            texts : list of texts
+        Return:
+            dict : index in texts -> float32 numpy vector, for cache hits only
+        """
+        if not cls.ENABLED or not texts:
+            return {}
+
+        keys = [cls.make_key(model_name, text) for text in texts]
+        positions = {}
+        for index, key in enumerate(keys):
+            positions.setdefault(key, []).append(index)
+
+        connection = cls.get_connection()
+        unique_keys = list(positions)
+        hits = {}
+        found = []
+
+        for start in range(0, len(unique_keys), cls.QUERY_BATCH):
+            batch = unique_keys[start:start + cls.QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(
+                f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, dim, vector in rows:
+                embedding = np.frombuffer(vector, dtype=np.float32, count=dim)
+                for index in positions[key]:
+                    hits[index] = embedding
+                found.append(key)
+
+        # Refresh recency of hits for LRU eviction
+        if found:
+            cls._touch(found)
+
+        return hits
+
+    @classmethod
+    def _touch(cls, keys):
+        """Buffer the last_used time of hits, writing them once TOUCH_BATCH are pending"""
+        now = time.time()
+        with cls._touched_lock:
+            for key in keys:
+                cls._touched[key] = now
+            if len(cls._touched) < cls.TOUCH_BATCH:
+                return
+
+        connection = cls.get_connection()
+        cls._write_touched(connection)
+        connection.commit()
+
+    @classmethod
+    def _write_touched(cls, connection):
+        """Write the buffered last_used times (the caller commits)"""
+        with cls._touched_lock:
+            touched, cls._touched = cls._touched, {}
+        if touched:
+            connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(used, key) for key, used in touched.items()]
+            )
+
+    @classmethod
+    def set_many(cls, model_name, texts, embeddings):
+        """
+        Store embeddings and evict the least recently used entries over the limit
+        Args:
+            model_name : Embedding model identifier
+            texts : list of texts
+            embeddings : matching list / array of vectors
+        """
+        if not cls.ENABLED or not texts:
+            return
+
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            rows.append((cls.make_key(model_name, text), vector.shape[0], vector.tobytes(), now))
+
+        connection = cls.get_connection()
+        connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, dim, vector, last_used) VALUES (?, ?, ?, ?)", rows
+        )
+        # Same transaction, and recent hits must be recorded before evicting
+        cls._write_touched(connection)
+
+        # Counting scans the table, so the size is only checked every EVICT_CHECK_INTERVAL
+        # inserted rows: the cache can go that far (per process) over MAX_ENTRIES
+        with cls._touched_lock:
+            cls._inserted_since_check += len(rows)
+            check = cls._inserted_since_check >= cls.EVICT_CHECK_INTERVAL
+            if check:
+                cls._inserted_since_check = 0
+
+        if check:
+            (count,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            overflow = count - cls.MAX_ENTRIES
+            if overflow > 0:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+        connection.commit()
+
+    @classmethod
+    def clear(cls):
+        """Remove every cached embedding"""
+        connection = cls.get_connection()
+        connection.execute("DELETE FROM embeddings")
+        connection.commit()
@@ -0,0 +1,95 @@
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlparse
+import numpy as np
+from django.conf import settings
+
+
+class EmbeddingClient:
+    """
+    Client of the local embedding server (python manage.py run_embedding_server)
+
+    Each thread keeps one keep-alive connection. When the server can't be reached
+    the client reports it as unavailable for a while, so callers fall back to
+    in process encoding without paying a connect timeout on every query
+    """
+
+    URL = getattr(settings, 'EMBEDDING_SERVER_URL', '')
+    TIMEOUT = getattr(settings, 'EMBEDDING_SERVER_TIMEOUT', 2)
+    # Seconds to skip the server after a failure
+    RETRY_AFTER = 30
+
+    _local = threading.local()
+    _down_until = 0
+
+    @classmethod
+    def is_enabled(cls):
+        return bool(cls.URL)
+
+    @classmethod
+    def embed(cls, texts):
+        """
+        Embed texts on the server
+        Args:
+            texts : list of text
+        Return:
+            numpy.ndarray or None : (len(texts), dimension) float32 array, None if the server is unavailable
+        """
+        if not cls.is_enabled() or time.monotonic() < cls._down_until:
+            return None
+
+        body = json.dumps({'texts': texts}).encode('utf-8')
+
+        # A kept alive connection may have been closed by the server, retry once on a new one
+        for attempt in range(2):
+            connection = cls._get_connection()
+            try:
+                connection.request('POST', '/embed', body=body, headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                data = response.read()
+                if response.status != 200:
+                    raise http.client.HTTPException(f"{response.status} {data[:200]!r}")
+
+                count = int(response.getheader('X-Embedding-Count'))
+                dimension = int(response.getheader('X-Embedding-Dim'))
+                return np.frombuffer(data, dtype='<f4').reshape(count, dimension)
+            except (OSError, http.client.HTTPException, ValueError, TypeError) as e:
+                cls._close_connection()
+                if attempt == 1:
+                    print(f"Embedding server unavailable ({e}), encoding in process for {cls.RETRY_AFTER}s")
+                    cls._down_until = time.monotonic() + cls.RETRY_AFTER
+        return None
+
+    @classmethod
+    def is_healthy(cls):
+        """Check the server is up and has its model loaded"""
+        if not cls.is_enabled():
+            return False
+
+        connection = cls._get_connection()
+        try:
+            connection.request('GET', '/health')
+            response = connection.getresponse()
+            response.read()
+            return response.status == 200
+        except (OSError, http.client.HTTPException):
+            cls._close_connection()
+            return False
+
+    @classmethod
+    def _get_connection(cls):
+        connection = getattr(cls._local, 'connection', None)
+        if connection is None:
+            url = urlparse(cls.URL)
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=cls.TIMEOUT)
+            cls._local.connection = connection
+        return connection
+
+    @classmethod
+    def _close_connection(cls):
+        connection = getattr(cls._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            cls._local.connection = None
@@ -0,0 +1,182 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from .embedding_service import EmbeddingService
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent embedding requests into one model call
+
+    A single thread owns the model: it takes the first waiting request, then keeps
+    collecting until max_batch texts are gathered or max_wait has passed since the
+    first one arrived, encodes everything at once and hands each caller its rows
+    """
+
+    def __init__(self, max_batch=32, max_wait=0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, texts):
+        """
+        Queue texts for the next batch
+        Args:
+            texts : list of text
+        Return:
+            Future : resolves to a (len(texts), dimension) float32 array
+        """
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+
+        return requests
+
+    def _run(self):
+        model = EmbeddingService.get_model()
+
+        while True:
+            requests = self._collect()
+            texts = [text for request_texts, _ in requests for text in request_texts]
+
+            try:
+                embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=False).astype(np.float32, copy=False)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future in requests:
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /embed  {"texts": [...]} -> raw little endian float32 rows
+                 (X-Embedding-Count / X-Embedding-Dim headers give the shape)
+    GET /health  -> model name and dimension
+    """
+
+    # Keep-alive, clients reuse one connection per thread
+    protocol_version = 'HTTP/1.1'
+
+    batcher = None
+    timeout_seconds = 30
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._send_json(404, {'error': 'Not found'})
+        self._send_json(200, {
+            'model': EmbeddingService.MODEL_NAME,
+            'backend': EmbeddingService.BACKEND,
+            'dimension': EmbeddingService.get_embedding_dimension(),
+        })
+
+    def do_POST(self):
+        if self.path != '/embed':
+            # The body is left unread, on a kept-alive connection the next request would be parsed from it
+            return self._send_json(404, {'error': 'Not found'}, close=True)
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            return self._send_json(400, {'error': 'Invalid Content-Length'}, close=True)
+
+        try:
+            texts = json.loads(self.rfile.read(length))['texts']
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("texts must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json(400, {'error': str(e)})
+
+        if not texts:
+            return self._send_vectors(np.empty((0, 0), dtype=np.float32))
+
+        try:
+            embeddings = self.batcher.submit(texts).result(timeout=self.timeout_seconds)
+        except Exception as e:
+            return self._send_json(500, {'error': str(e)})
+
+        self._send_vectors(embeddings)
+
+    def _send_vectors(self, embeddings):
+        body = np.ascontiguousarray(embeddings, dtype='<f4').tobytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Embedding-Count', str(embeddings.shape[0]))
+        self.send_header('X-Embedding-Dim', str(embeddings.shape[1] if embeddings.ndim == 2 else 0))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code, data, close=False):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if close:
+            # Also makes the handler close the connection after this response
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per request is too noisy for a hot path
+        pass
+
+
+class EmbeddingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Every web worker thread may connect at once, the default backlog of 5 resets them
+    request_queue_size = 128
+
+
+def serve(host, port, max_batch, max_wait):
+    """
+    Load the model and serve embeddings until interrupted
+    Args:
+        host : Interface to bind (keep it local)
+        port : TCP port
+        max_batch : Most texts encoded in one model call
+        max_wait : Seconds a request may wait for others to join its batch
+    """
+    EmbeddingService.warm_up()
+
+    batcher = MicroBatcher(max_batch=max_batch, max_wait=max_wait)
+    batcher.start()
+    EmbeddingRequestHandler.batcher = batcher
+
+    server = EmbeddingHTTPServer((host, port), EmbeddingRequestHandler)
+    print(f"Embedding server listening on http://{host}:{port} (max batch {max_batch}, max wait {max_wait * 1000:.0f}ms)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
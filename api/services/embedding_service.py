@@ -1,13 +1,31 @@
+import atexit
+import os
+import threading
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from ..models import DocumentChunk
+from django.conf import settings
+from .embedding_cache import EmbeddingCache
+from .embedding_client import EmbeddingClient
 
 class EmbeddingService:
     """Servide for generating embeddings of text"""
 
     # Model
     MODEL_NAME = 'all-MiniLM-L6-v2' 
+    # 'torch' (SentenceTransformer on PyTorch) or 'onnx' (quantized ONNX Runtime export of the same model)
+    BACKEND = getattr(settings, 'EMBEDDING_BACKEND', 'torch')
+    ONNX_MODEL_PATH = getattr(settings, 'EMBEDDING_ONNX_MODEL_PATH', os.path.join(settings.BASE_DIR, 'models', 'all-MiniLM-L6-v2-onnx'))
+    ONNX_FILE_NAME = getattr(settings, 'EMBEDDING_ONNX_FILE', 'onnx/model_quint8_avx2.onnx')
     _model = None
+    _model_lock = threading.Lock()
+    _warm_up_thread = None
+
+    # Ingest encoding: texts per forward pass, and a process pool for large inputs (torch only)
+    BATCH_SIZE = getattr(settings, 'EMBEDDING_BATCH_SIZE', 64)
+    ENCODE_PROCESSES = getattr(settings, 'EMBEDDING_ENCODE_PROCESSES', 1)
+    MULTIPROCESS_MIN_TEXTS = getattr(settings, 'EMBEDDING_MULTIPROCESS_MIN_TEXTS', 1024)
+    _pool = None
+    _pool_lock = threading.Lock()
 
     @classmethod
     def get_model(cls):
@@ -18,10 +36,81 @@ class EmbeddingService:
             sentence transformer load model
         """
         if cls._model is None:
-            print(f"Loading embedding model : {cls.MODEL_NAME} ... ")
-            cls._model = SentenceTransformer(cls.MODEL_NAME)
-            print("Model load successfully! ")
+            # Threads of one process (warm up, requests) load the model only once
+            with cls._model_lock:
+                if cls._model is None:
+                    print(f"Loading embedding model : {cls.MODEL_NAME} ({cls.BACKEND}) ... ")
+                    cls._model = cls.load_backend(cls.BACKEND)
+                    print("Model load successfully! ")
         return cls._model
+
+    @classmethod
+    def load_backend(cls, backend):
+        """
+        Load the embedding model on a backend
+        Args:
+            backend : 'torch' or 'onnx'
+        Return:
+            SentenceTransformer : Loaded model
+        """
+        if backend == 'torch':
+            return SentenceTransformer(cls.MODEL_NAME)
+
+        if backend == 'onnx':
+            # Exported ahead of time with: python manage.py export_onnx_model
+            if not os.path.exists(os.path.join(cls.ONNX_MODEL_PATH, cls.ONNX_FILE_NAME)):
+                raise ValueError(
+                    f"ONNX model {cls.ONNX_FILE_NAME} not found in {cls.ONNX_MODEL_PATH}, "
+                    f"run python manage.py export_onnx_model first"
+                )
+            return SentenceTransformer(
+                cls.ONNX_MODEL_PATH,
+                backend='onnx',
+                model_kwargs={'file_name': cls.ONNX_FILE_NAME, 'provider': 'CPUExecutionProvider'},
+            )
+
+        raise ValueError(f"Unknown embedding backend : {backend}")
+
+    @classmethod
+    def cache_namespace(cls):
+        """
+        Model identifier of the embedding cache, quantized vectors differ slightly
+        from the PyTorch ones so every backend gets its own entries
+        """
+        if cls.BACKEND == 'torch':
+            return cls.MODEL_NAME
+        return f"{cls.MODEL_NAME}:{cls.BACKEND}:{cls.ONNX_FILE_NAME}"
+
+    @classmethod
+    def is_loaded(cls):
+        """Check if the model is in memory (used by the readiness probe)"""
+        return cls._model is not None
+
+    @classmethod
+    def is_ready(cls):
+        """Check queries can be embedded without loading the model first"""
+        return cls.is_loaded() or EmbeddingClient.is_healthy()
+
+    @classmethod
+    def warm_up(cls, encode=True):
+        """
+        Load the model and tokenizer ahead of the first request
+        Args:
+            encode : Also run a tiny encode so lazy buffers are allocated,
+                     skip it before forking (thread pools don't survive fork)
+        """
+        model = cls.get_model()
+        if encode:
+            model.encode(["warm up"], convert_to_numpy=True, show_progress_bar=False)
+
+    @classmethod
+    def warm_up_in_background(cls):
+        """Start loading the model in a thread if nobody did yet"""
+        with cls._model_lock:
+            if cls._model is not None or (cls._warm_up_thread is not None and cls._warm_up_thread.is_alive()):
+                return
+            cls._warm_up_thread = threading.Thread(target=cls.warm_up, name='embedding-warm-up', daemon=True)
+            cls._warm_up_thread.start()
     
     @staticmethod
     def generate_embedding(text):
@@ -32,10 +121,21 @@ class EmbeddingService:
         Return:
             list : embedding vectors
         """
-        model = EmbeddingService.get_model()
-        
-        # Generate embeddings
-        embeddings = model.encode(text, convert_to_numpy=True)
+        # Look up previously embedded text first
+        cached = EmbeddingCache.get_many(EmbeddingService.cache_namespace(), [text])
+        if cached:
+            return cached[0].tolist()
+
+        # Shared embedding server batches concurrent queries, fall back to the local model
+        served = EmbeddingClient.embed([text])
+        if served is not None:
+            embeddings = served[0]
+        else:
+            model = EmbeddingService.get_model()
+
+            # Generate embeddings
+            embeddings = model.encode(text, convert_to_numpy=True)
+        EmbeddingCache.set_many(EmbeddingService.cache_namespace(), [text], [embeddings])
 
         # Convert to json list and return
         return embeddings.tolist()
@@ -50,43 +150,140 @@ class EmbeddingService:
         Return:
             list : list of embedding vectors
         """
+        return EmbeddingService.generate_embeddings_array(texts).tolist()
+    
 
-        model = EmbeddingService.get_model()
-        
-        # Generate embeddings of multiple text at once
-        embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+    @staticmethod
+    def generate_embeddings_array(texts):
+        """
+        Generate embeddings of multiple text at once as one float32 matrix
+        Args:
+            texts : list of text
+        Return:
+            numpy.ndarray : (len(texts), dimension) float32 array
+        """
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # Serve cache hits, only send misses to the model
+        cached = EmbeddingCache.get_many(EmbeddingService.cache_namespace(), texts)
+        misses = [index for index in range(len(texts)) if index not in cached]
+
+        encoded = None
+        if misses:
+            model = EmbeddingService.get_model()
+            miss_texts = [texts[index] for index in misses]
+
+            # Generate embeddings of multiple text at once
+            encoded = EmbeddingService.encode_texts(model, miss_texts)
+            EmbeddingCache.set_many(EmbeddingService.cache_namespace(), miss_texts, encoded)
+
+        print(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
 
-        return [emb.tolist() for emb in embeddings]
+        dimension = encoded.shape[1] if encoded is not None else next(iter(cached.values())).shape[0]
+        embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+        for index, emb in cached.items():
+            embeddings[index] = emb
+        if misses:
+            embeddings[misses] = encoded
+        return embeddings
     
 
     @staticmethod
-    def embed_document_chunks(document):
+    def encode_texts(model, texts):
         """
-        Generate embeddings of all chunks of document
+        Encode many texts with little padding. encode() already sorts each call by
+        length, large inputs spread over the process pool are sorted by token length
+        first so every worker gets texts of similar length
         Args:
-            document : Document instance
+            model : Loaded SentenceTransformer
+            texts : list of text
         Return:
-            int : Number of chunk embended        
+            numpy.ndarray : (len(texts), dimension) float32 array in the order of texts
         """
-        # Get all chunks without embeddings
-        chunks = document.chunks.all()
+        batch_size = EmbeddingService.BATCH_SIZE
 
-        if not chunks.exists():
-            raise ValueError("No chunk found for this document")
-        
-        # Find exact chunk from the document
-        texts = [chunk.content for chunk in chunks]
+        pool = EmbeddingService._get_pool(model) if len(texts) >= EmbeddingService.MULTIPROCESS_MIN_TEXTS else None
+        if pool is None:
+            encoded = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+            return encoded.astype(np.float32, copy=False)
+
+        order = np.argsort(EmbeddingService._token_lengths(model, texts), kind='stable')
+        sorted_texts = [texts[index] for index in order]
+
+        # The pool has one input/output queue pair, one caller at a time
+        with EmbeddingService._pool_lock:
+            encoded = model.encode(
+                sorted_texts,
+                pool=pool,
+                batch_size=batch_size,
+                chunk_size=batch_size * 4,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+
+        # Undo the length sort
+        embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        embeddings[order] = encoded
+        return embeddings
+
+    @staticmethod
+    def _token_lengths(model, texts):
+        # Real token counts when the model has a fast tokenizer, characters otherwise
+        tokenizer = getattr(model, 'tokenizer', None)
+        if tokenizer is not None and getattr(tokenizer, 'is_fast', False):
+            encoded = tokenizer(texts, add_special_tokens=False, truncation=True, max_length=model.max_seq_length)
+            return [len(ids) for ids in encoded['input_ids']]
+        return [len(text) for text in texts]
+
+    @classmethod
+    def multiprocess_enabled(cls):
+        """Check large encodes are spread over a process pool"""
+        return cls.ENCODE_PROCESSES > 1 and cls.BACKEND == 'torch'
 
-        # Generate embeddings in batch 
-        print(f"Generating embeddings for {len(texts)} chunks ... ")
-        embeddings = EmbeddingService.generate_embeddings_batch(texts)
+    @classmethod
+    def _get_pool(cls, model):
+        """
+        Start (once per process) the sentence-transformers multi-process pool
+        Return:
+            dict or None : Pool, None when multi-process encoding is off
+        """
+        if not cls.multiprocess_enabled():
+            return None
+
+        with cls._pool_lock:
+            if cls._pool is None:
+                print(f"Starting embedding pool with {cls.ENCODE_PROCESSES} processes ...")
+                cls._pool = model.start_multi_process_pool(target_devices=['cpu'] * cls.ENCODE_PROCESSES)
+                atexit.register(cls.stop_pool)
+        return cls._pool
+
+    @classmethod
+    def stop_pool(cls):
+        """Stop the multi-process pool if one was started"""
+        with cls._pool_lock:
+            if cls._pool is not None:
+                SentenceTransformer.stop_multi_process_pool(cls._pool)
+                cls._pool = None
+
+    @staticmethod
+    def embed_chunks(chunks):
+        """
+        Generate embeddings for a batch of (unsaved) chunks in place
+        Args:
+            chunks : list of DocumentChunk instances
+        Return:
+            int : Number of chunk embended
+        """
+        if not chunks:
+            return 0
+
+        embeddings = EmbeddingService.generate_embeddings_array([chunk.content for chunk in chunks])
 
-        # Update chunks with embeddings
         for chunk, embedding in zip(chunks, embeddings):
             chunk.embedding = embedding
-            chunk.save()
-        
-        print(f"Successfully embedded {len(chunks)} chunks!")
+
         return len(chunks)
     
 
@@ -0,0 +1,275 @@
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils import timezone
+from .pdf_service import PDFservice
+from .chunking_service import ChunkingService
+from .embedding_service import EmbeddingService
+from .vector_db_service import VectorDBService
+from .dedup_service import DeduplicationService
+from ..models import DocumentChunk, IngestionJob
+
+
+class IngestionService:
+    """
+    Service for queueing uploaded documents and processing them in the background
+    """
+
+    # Chunks embedded and written together
+    BATCH_SIZE = getattr(settings, 'INGEST_BATCH_SIZE', 64)
+
+    @staticmethod
+    def process_document(document):
+        """
+        Run the pipeline (extract -> chunk -> embed -> index) for a document as a stream:
+        pages feed the chunker and every batch of chunks is embedded and written to
+        SQL and Chroma before more pages are read, so memory stays flat with page count
+        Args:
+            document : Document instance
+        Return:
+            dict : page, chunk and embedding counts
+        """
+        # Documents uploaded before hashing was added, the hash keys the page text cache
+        if not document.content_hash:
+            document.content_hash = DeduplicationService.hash_file(document.file)
+            document.save(update_fields=['content_hash'])
+
+        page_count = PDFservice.get_page_count(document.file.path, document.content_hash)
+
+        print(f"Streaming {page_count} pages through chunk -> embed -> index ...")
+        pages = PDFservice.iter_pages(document.file.path, document.content_hash, page_count)
+
+        return IngestionService.index_chunks(document, ChunkingService.iter_chunks(document, pages), page_count)
+
+    @staticmethod
+    def index_chunks(document, chunks, page_count):
+        """
+        Replace the chunks and vectors of a document, embedding and writing in batches
+        Args:
+            document : Document instance
+            chunks : Iterable of unsaved DocumentChunk instances (embedding set or None)
+            page_count : Number of pages in the pdf
+        Return:
+            dict : page, chunk and embedding counts
+        """
+        # Start from a clean state, the job may be a retry
+        document.mark_as_indexing()
+        DocumentChunk.objects.filter(document=document).delete()
+        collection = VectorDBService.create_collection(document.id)
+        user_collection = VectorDBService.get_or_create_user_collection(document.user_id)
+        VectorDBService.remove_from_user_collection(document.user_id, document.id, collection=user_collection)
+
+        chunk_count = 0
+        batch = []
+        # Batches must reach the pool threshold for the encode to be spread over processes
+        batch_size = IngestionService.BATCH_SIZE
+        if EmbeddingService.multiprocess_enabled():
+            batch_size = max(batch_size, EmbeddingService.MULTIPROCESS_MIN_TEXTS)
+
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                chunk_count += IngestionService._write_batch(document, collection, user_collection, batch)
+                batch = []
+
+        chunk_count += IngestionService._write_batch(document, collection, user_collection, batch)
+
+        if chunk_count == 0:
+            raise ValidationError("No text could be extract from the pdf")
+
+        if VectorDBService.uses_numpy(chunk_count):
+            VectorDBService.build_numpy_index(document.id, document.chunks.all())
+
+        if not document.mark_as_completed(page_count=page_count):
+            # Deleted meanwhile, vector_gc removes what was written
+            print(f"Document {document.id} was deleted while it was indexed")
+
+        print(f"Processing complete! {chunk_count} chunks indexed")
+        return {
+            'page_count': page_count,
+            'chunk_count': chunk_count,
+            'embedded_chunks': chunk_count,
+        }
+
+    @staticmethod
+    def _write_batch(document, collection, user_collection, chunks):
+        """
+        Embed a batch of chunks and persist it to the database and vector store
+        Args:
+            document : Document instance
+            collection : chromadb.Collection of the document
+            user_collection : chromadb.Collection of the document owner
+            chunks : list of unsaved DocumentChunk instances
+        Return:
+            int : Number of chunks written
+        """
+        if not chunks:
+            return 0
+
+        # Chunks may come embedded already (reindex workers)
+        EmbeddingService.embed_chunks([chunk for chunk in chunks if chunk.embedding is None])
+
+        # bulk_create sets primary keys, Chroma ids are derived from them
+        DocumentChunk.objects.bulk_create(chunks)
+        VectorDBService.upsert_chunks(document.id, chunks, collection=collection, user_collection=user_collection)
+
+        return len(chunks)
+
+    @staticmethod
+    def enqueue(document):
+        """
+        Queue a document for background processing
+        Args:
+            document : Document instance
+        Return:
+            IngestionJob : Created job
+        """
+        return IngestionJob.objects.create(
+            document=document,
+            max_attempts=settings.INGEST_MAX_ATTEMPTS,
+        )
+
+    @staticmethod
+    def claim_next_job(worker_id, visibility_timeout=None):
+        """
+        Atomically claim the oldest queued job for a worker
+        Args:
+            worker_id : Identifier of the claiming worker
+            visibility_timeout : Seconds before an unfinished claim is considered lost
+        Return:
+            IngestionJob or None : Claimed job
+        """
+        visibility_timeout = visibility_timeout or settings.INGEST_VISIBILITY_TIMEOUT
+        batch_concurrency = settings.INGEST_BATCH_CONCURRENCY
+
+        candidates = IngestionJob.objects.filter(status='queued').values_list('id', 'document__batch_id')[:50]
+        for job_id, batch_id in candidates:
+            # Cap how many documents of one bulk upload run at once so single uploads aren't starved
+            if batch_id is not None and batch_concurrency > 0:
+                running = IngestionJob.objects.filter(status='processing', document__batch_id=batch_id).count()
+                if running >= batch_concurrency:
+                    continue
+
+            now = timezone.now()
+
+            # Conditional update so two workers can never claim the same job
+            claimed = IngestionJob.objects.filter(id=job_id, status='queued').update(
+                status='processing',
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=visibility_timeout),
+                attempts=F('attempts') + 1,
+                started_at=now,
+            )
+            if claimed:
+                return IngestionJob.objects.select_related('document').get(id=job_id)
+        return None
+
+    @staticmethod
+    def extend_lease(job_ids, worker_id, visibility_timeout=None):
+        """
+        Push back the visibility timeout of jobs a worker is still processing
+        Args:
+            job_ids : IDs of in-flight jobs
+            worker_id : Identifier of the worker holding the jobs
+            visibility_timeout : Seconds to extend the claim by
+        Return:
+            int : Number of leases extended
+        """
+        visibility_timeout = visibility_timeout or settings.INGEST_VISIBILITY_TIMEOUT
+
+        return IngestionJob.objects.filter(
+            id__in=job_ids,
+            status='processing',
+            locked_by=worker_id,
+        ).update(locked_until=timezone.now() + timedelta(seconds=visibility_timeout))
+
+    @staticmethod
+    def run_job(job):
+        """
+        Process the document of a claimed job and record the outcome
+        Args:
+            job : Claimed IngestionJob instance
+        Return:
+            dict or None : Pipeline counts, None if processing failed
+        """
+        document = job.document
+
+        # Mark as processing
+        document.mark_as_processing()
+
+        try:
+            # Identical file already processed: copy its chunks and vectors instead. Uploads only,
+            # a reindex must not copy a duplicate still embedded with the previous model
+            result = DeduplicationService.reuse_processed(document)
+            if result is None:
+                result = IngestionService.process_document(document)
+        except Exception as e:
+            print(f"Error : {traceback.format_exc()}")
+            IngestionService._handle_failure(job, str(e))
+            return None
+
+        IngestionJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+            status='completed',
+            finished_at=timezone.now(),
+            locked_by=None,
+            locked_until=None,
+            last_error=None,
+        )
+        return result
+
+    @staticmethod
+    def recover_stale_jobs():
+        """
+        Requeue (or fail) jobs left in processing by a worker that crashed or hung
+        Return:
+            int : Number of jobs recovered
+        """
+        stale_jobs = IngestionJob.objects.filter(
+            status='processing',
+            locked_until__lt=timezone.now(),
+        ).select_related('document')
+
+        recovered = 0
+        for job in stale_jobs:
+            if IngestionService._handle_failure(job, f"Worker {job.locked_by} did not finish before visibility timeout"):
+                recovered += 1
+
+        if recovered:
+            print(f"Recovered {recovered} stale ingestion jobs")
+        return recovered
+
+    @staticmethod
+    def _handle_failure(job, error):
+        """
+        Retry the job if attempts remain, otherwise mark it and its document as failed
+        Args:
+            job : IngestionJob instance
+            error : Error message
+        Return:
+            bool : True if this call released the job
+        """
+        retry = job.attempts < job.max_attempts
+
+        # Only release the job if it is still held by the same claim
+        released = IngestionJob.objects.filter(
+            id=job.id,
+            status='processing',
+            locked_by=job.locked_by,
+        ).update(
+            status='queued' if retry else 'failed',
+            locked_by=None,
+            locked_until=None,
+            last_error=error,
+            finished_at=None if retry else timezone.now(),
+        )
+        if not released:
+            return False
+
+        if retry:
+            print(f"Retrying document {job.document_id} (attempt {job.attempts} of {job.max_attempts})")
+            job.document.mark_as_pending()
+        else:
+            job.document.mark_as_failed(error)
+        return True
@@ -0,0 +1,131 @@
+import re
+from django.db import connection
+
+
+class KeywordSearchService:
+    """
+    BM25 keyword search over chunk content with the SQLite FTS5 index (migration 0011)
+
+    Finds exact identifiers (clause numbers, SKUs, names) that embedding similarity misses.
+    The index is maintained by triggers on api_documentchunk, so nothing needs to be
+    written at ingest time
+    """
+
+    TABLE = 'api_documentchunk_fts'
+    # Sync triggers of migration 0011. Django rebuilds a SQLite table to alter or remove one
+    # of its columns and the triggers are lost with the old table, post_migrate puts them back
+    TRIGGERS = {
+        'api_documentchunk_fts_insert': """
+            CREATE TRIGGER IF NOT EXISTS api_documentchunk_fts_insert AFTER INSERT ON api_documentchunk BEGIN
+                INSERT INTO api_documentchunk_fts(rowid, content, document_id) VALUES (new.id, new.content, new.document_id);
+            END
+        """,
+        'api_documentchunk_fts_delete': """
+            CREATE TRIGGER IF NOT EXISTS api_documentchunk_fts_delete AFTER DELETE ON api_documentchunk BEGIN
+                INSERT INTO api_documentchunk_fts(api_documentchunk_fts, rowid, content, document_id) VALUES ('delete', old.id, old.content, old.document_id);
+            END
+        """,
+        'api_documentchunk_fts_update': """
+            CREATE TRIGGER IF NOT EXISTS api_documentchunk_fts_update AFTER UPDATE OF content, document_id ON api_documentchunk BEGIN
+                INSERT INTO api_documentchunk_fts(api_documentchunk_fts, rowid, content, document_id) VALUES ('delete', old.id, old.content, old.document_id);
+                INSERT INTO api_documentchunk_fts(rowid, content, document_id) VALUES (new.id, new.content, new.document_id);
+            END
+        """,
+    }
+    # Terms of a query sent to FTS5
+    MAX_TERMS = 32
+    # Words, keeping identifiers like 4.2.1, SKU-123 or A/B together
+    TERM_PATTERN = re.compile(r"\w+(?:[.\-/]\w+)*")
+    # Match nearly every chunk for close to zero BM25 weight, skipping them keeps queries fast
+    STOPWORDS = frozenset(
+        "a an and are as at be by can do does for from has have how i in is it its me my of on or "
+        "our so that the their there these this to was we were what when where which who why will "
+        "with you your".split()
+    )
+
+    _available = None
+
+    @classmethod
+    def is_available(cls):
+        """Check the database has the FTS5 index (SQLite only)"""
+        if cls._available is None:
+            if connection.vendor != 'sqlite':
+                cls._available = False
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [cls.TABLE])
+                    cls._available = cursor.fetchone() is not None
+        return cls._available
+
+    @staticmethod
+    def ensure_triggers(connection):
+        """
+        Recreate missing sync triggers and rebuild the index, writes made while they
+        were missing never reached it
+        Args:
+            connection : Database connection (SQLite with the FTS5 index)
+        Return:
+            list : names of the recreated triggers
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [KeywordSearchService.TABLE])
+            if cursor.fetchone() is None:
+                return []
+
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_documentchunk'")
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in KeywordSearchService.TRIGGERS if name not in existing]
+            if not missing:
+                return []
+
+            for name in missing:
+                cursor.execute(KeywordSearchService.TRIGGERS[name])
+            cursor.execute(f"INSERT INTO {KeywordSearchService.TABLE}({KeywordSearchService.TABLE}) VALUES ('rebuild')")
+
+        print(f"Recreated keyword index triggers : {', '.join(missing)}")
+        return missing
+
+    @staticmethod
+    def build_match_query(query):
+        """
+        Turn a user question into an FTS5 query matching any of its terms
+        Args:
+            query : User question
+        Return:
+            str : FTS5 MATCH expression, empty when the query has no terms
+        """
+        terms = []
+        for term in KeywordSearchService.TERM_PATTERN.findall(query.lower()):
+            if term not in terms and term not in KeywordSearchService.STOPWORDS:
+                terms.append(term)
+
+        # Quoted terms are phrases: "sku-123" matches the tokens sku followed by 123
+        return " OR ".join(f'"{term}"' for term in terms[:KeywordSearchService.MAX_TERMS])
+
+    @staticmethod
+    def search(document_id, query, top_k=5):
+        """
+        Rank the chunks of a document by BM25
+        Args:
+            document_id : Document ID
+            query : User question
+            top_k : Number of results to return
+        Return:
+            list : dicts with chunk_id and bm25_score (higher is better), best first
+        """
+        terms = KeywordSearchService.build_match_query(query)
+        if not terms or not KeywordSearchService.is_available():
+            return []
+
+        # Column weights: content 1, document_id 0 (it only restricts the match). The terms
+        # are limited to content, a term equal to the document id would match every chunk
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({KeywordSearchService.TABLE}, 1.0, 0.0) AS score "
+                f"FROM {KeywordSearchService.TABLE} WHERE {KeywordSearchService.TABLE} MATCH %s "
+                f"ORDER BY score LIMIT %s",
+                [f'document_id : "{int(document_id)}" AND content : ({terms})', top_k],
+            )
+            rows = cursor.fetchall()
+
+        return [{'chunk_id': chunk_id, 'bm25_score': -score} for chunk_id, score in rows]
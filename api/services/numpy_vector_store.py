@@ -0,0 +1,180 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+
+
+class NumpyVectorStore:
+    """
+    Exact search over the normalized embeddings of one document kept in a .npy file
+
+    A document is two files: document_{id}.npy, an (n, dim) float32 matrix of unit
+    vectors, and document_{id}.ids.npy, the matching int64 chunk ids. Files are
+    memory mapped, so the OS page cache shares them between workers, and a search
+    is one matrix-vector product plus argpartition. For the usual document (a few
+    hundred chunks) that is much cheaper than a Chroma round trip
+    """
+
+    STORE_PATH = getattr(settings, 'VECTOR_STORE_PATH', os.path.join(settings.BASE_DIR, 'vector_store'))
+    # Memory maps kept open per process
+    MAX_OPEN = 256
+
+    _open = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_paths(document_id):
+        """
+        Args:
+            document_id : Document ID
+        Return:
+            tuple : (vectors path, chunk ids path)
+        """
+        base = os.path.join(NumpyVectorStore.STORE_PATH, f"document_{document_id}")
+        return f"{base}.npy", f"{base}.ids.npy"
+
+    @staticmethod
+    def exists(document_id):
+        vectors_path, ids_path = NumpyVectorStore.get_paths(document_id)
+        return os.path.exists(vectors_path) and os.path.exists(ids_path)
+
+    @staticmethod
+    def write(document_id, chunk_ids, embeddings):
+        """
+        Replace the vectors of a document (each file is swapped in atomically)
+        Args:
+            document_id : Document ID
+            chunk_ids : list of chunk ids
+            embeddings : (n, dim) array aligned with chunk_ids
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+
+        os.makedirs(NumpyVectorStore.STORE_PATH, exist_ok=True)
+        vectors_path, ids_path = NumpyVectorStore.get_paths(document_id)
+
+        # Ids first, readers check both files have the same length
+        NumpyVectorStore._save(ids_path, np.asarray(chunk_ids, dtype=np.int64))
+        NumpyVectorStore._save(vectors_path, embeddings)
+
+    @staticmethod
+    def _save(path, array):
+        descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def delete(document_id):
+        """Remove the files of a document"""
+        for path in NumpyVectorStore.get_paths(document_id):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with NumpyVectorStore._lock:
+            NumpyVectorStore._open.pop(document_id, None)
+
+    @staticmethod
+    def load(document_id):
+        """
+        Memory map the vectors of a document, reopened when the files were replaced
+        Args:
+            document_id : Document ID
+        Return:
+            tuple or None : (chunk ids, vectors), None if the document has no (consistent) files
+        """
+        vectors_path, ids_path = NumpyVectorStore.get_paths(document_id)
+        try:
+            stat = os.stat(vectors_path)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with NumpyVectorStore._lock:
+            cached = NumpyVectorStore._open.get(document_id)
+            if cached is not None and cached[0] == version:
+                NumpyVectorStore._open.move_to_end(document_id)
+                return cached[1], cached[2]
+
+        try:
+            vectors = np.load(vectors_path, mmap_mode='r')
+            chunk_ids = np.load(ids_path)
+        except (FileNotFoundError, ValueError):
+            return None
+        if vectors.ndim != 2 or len(chunk_ids) != vectors.shape[0]:
+            # Caught between the two renames of a rewrite
+            return None
+
+        with NumpyVectorStore._lock:
+            NumpyVectorStore._open[document_id] = (version, chunk_ids, vectors)
+            NumpyVectorStore._open.move_to_end(document_id)
+            while len(NumpyVectorStore._open) > NumpyVectorStore.MAX_OPEN:
+                NumpyVectorStore._open.popitem(last=False)
+        return chunk_ids, vectors
+
+    @staticmethod
+    def search(document_id, query_embedding, top_k=5):
+        """
+        Exact top-k by cosine similarity
+        Args:
+            document_id : Document ID
+            query_embedding : Query embedding vector
+            top_k : Number of results to return
+        Return:
+            list or None : search results (chunk_id, document_id, similarity_score), None if the document isn't stored
+        """
+        results = NumpyVectorStore.search_many(document_id, [query_embedding], top_k)
+        return None if results is None else results[0]
+
+    @staticmethod
+    def search_many(document_id, query_embeddings, top_k=5):
+        """
+        Exact top-k of several queries with one matrix product
+        Args:
+            document_id : Document ID
+            query_embeddings : list of query embedding vectors
+            top_k : Number of results to return per query
+        Return:
+            list or None : one result list per query, None if the document isn't stored
+        """
+        loaded = NumpyVectorStore.load(document_id)
+        if loaded is None:
+            return None
+        chunk_ids, vectors = loaded
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        # (queries, chunks)
+        scores = queries @ vectors.T
+        top_k = min(top_k, scores.shape[1])
+        if top_k <= 0:
+            return [[] for _ in query_embeddings]
+
+        # Unordered top-k in O(n), then sort only those
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        # Same scale as the chroma backend: 1 / (1 + squared L2 distance), 2 - 2cos for unit vectors
+        return [
+            [
+                {
+                    'chunk_id': int(chunk_ids[index]),
+                    'document_id': document_id,
+                    'similarity_score': 1 / (1 + max(2.0 - 2.0 * float(score), 0.0)),
+                }
+                for index, score in zip(row, row_scores)
+            ]
+            for row, row_scores in zip(top, top_scores)
+        ]
@@ -0,0 +1,119 @@
+import zlib
+from django.conf import settings
+from ..models import ExtractedText, ExtractedPage
+
+
+class PageTextCache:
+    """
+    Persistent cache of extracted page texts
+
+    Pages are stored zlib compressed, one row per page, keyed by the file's
+    SHA-256 and the extractor version, so re-chunking or retrying a document
+    never has to parse the pdf again
+    """
+
+    ENABLED = getattr(settings, 'PAGE_TEXT_CACHE_ENABLED', True)
+
+    # Pages written per insert / read per query
+    BATCH_SIZE = 64
+    COMPRESSION_LEVEL = 6
+
+    @staticmethod
+    def get(content_hash, extractor_version):
+        """
+        Find the complete cache entry of a file
+        Args:
+            content_hash : SHA-256 hex digest of the pdf
+            extractor_version : Version of the extraction code
+        Return:
+            ExtractedText or None : Cached entry
+        """
+        if not PageTextCache.ENABLED or not content_hash:
+            return None
+        return ExtractedText.objects.filter(
+            content_hash=content_hash,
+            extractor_version=extractor_version,
+            complete=True,
+        ).first()
+
+    @staticmethod
+    def iter_pages(entry, start=None, end=None):
+        """
+        Yield cached pages in page order
+        Args:
+            entry : ExtractedText instance
+            start : Optional first page number
+            end : Optional last page number
+        Yield:
+            dict : page number and text of every page with text
+        """
+        pages = entry.pages.order_by('page_number')
+        if start is not None:
+            pages = pages.filter(page_number__gte=start)
+        if end is not None:
+            pages = pages.filter(page_number__lte=end)
+
+        for page in pages.iterator(chunk_size=PageTextCache.BATCH_SIZE):
+            yield {
+                "page_number":page.page_number,
+                "text":zlib.decompress(page.text).decode('utf-8'),
+            }
+
+    @staticmethod
+    def write_through(content_hash, extractor_version, page_count, pages):
+        """
+        Pass pages through while storing them, the entry is marked complete only
+        once every page was written
+        Args:
+            content_hash : SHA-256 hex digest of the pdf
+            extractor_version : Version of the extraction code
+            page_count : Number of pages in the pdf
+            pages : Iterator of page dicts
+        Yield:
+            dict : The same pages
+        """
+        entry = None
+        if PageTextCache.ENABLED and content_hash:
+            try:
+                # Left over from an interrupted run
+                ExtractedText.objects.filter(
+                    content_hash=content_hash,
+                    extractor_version=extractor_version,
+                    complete=False,
+                ).delete()
+                entry = ExtractedText.objects.create(
+                    content_hash=content_hash,
+                    extractor_version=extractor_version,
+                    page_count=page_count,
+                )
+            except Exception as e:
+                # Another worker is writing the same file, just extract
+                print(f"Page text cache skipped: {e}")
+
+        batch = []
+        for page in pages:
+            if entry is not None:
+                batch.append(ExtractedPage(
+                    extracted=entry,
+                    page_number=page['page_number'],
+                    text=zlib.compress(page['text'].encode('utf-8'), PageTextCache.COMPRESSION_LEVEL),
+                    char_count=len(page['text']),
+                ))
+                if len(batch) >= PageTextCache.BATCH_SIZE:
+                    entry = PageTextCache._write_batch(entry, batch)
+                    batch = []
+            yield page
+
+        if entry is not None and PageTextCache._write_batch(entry, batch) is not None:
+            ExtractedText.objects.filter(id=entry.id).update(complete=True)
+            print(f"Cached text of {page_count} pages ({content_hash[:12]})")
+
+    @staticmethod
+    def _write_batch(entry, batch):
+        # A failed write only disables caching for this run, extraction goes on
+        try:
+            ExtractedPage.objects.bulk_create(batch)
+            return entry
+        except Exception as e:
+            print(f"Page text cache write failed: {e}")
+            return None
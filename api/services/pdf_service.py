@@ -1,101 +1,188 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pdfplumber
 import PyPDF2
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
+# No model imports at module level (the page text cache is imported where used):
+# spawned extraction workers import this module before Django apps are loaded
+
+
+def _iter_page_range(file_path, start, end):
+    """
+    Yield the text of pages [start, end) one page at a time with pdfplumber
+    Args:
+        file_path : Path of the pdf file
+        start : Index of the first page (0 based)
+        end : Index after the last page
+    Yield:
+        dict : page number and text of every page with text
+    """
+    with pdfplumber.open(file_path) as pdf:
+        for page_num in range(start, end):
+            page = pdf.pages[page_num]
+            text = page.extract_text()
+
+            # Drop the parsed layout objects, we only need the text
+            page.flush_cache()
+
+            if text:
+                yield {
+                    "page_number":page_num + 1,
+                    "text":text.strip(),
+                }
+
+
+def _extract_page_range(file_path, start, end):
+    """
+    Extract text of pages [start, end) with pdfplumber (runs in a worker process)
+    Args:
+        file_path : Path of the pdf file
+        start : Index of the first page (0 based)
+        end : Index after the last page
+    Return:
+        list : page dicts with page number and text
+    """
+    # Every worker opens the file itself, pdfplumber objects can't be shared between processes
+    return list(_iter_page_range(file_path, start, end))
+
+
 class PDFservice:
 
+    # Use the process pool only for pdfs with at least this many pages
+    PARALLEL_MIN_PAGES = getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 20)
+    # Number of worker processes for parallel extraction
+    MAX_WORKERS = getattr(settings, 'PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1))
+    # Pages per range handed to a worker process, with at most MAX_WORKERS ranges in
+    # flight the text held ahead of the consumer doesn't grow with the page count
+    RANGE_PAGES = getattr(settings, 'PDF_EXTRACT_RANGE_PAGES', 8)
+    # Key of the page text cache, bump the suffix when extraction output changes
+    EXTRACTOR_VERSION = f"pdfplumber-{pdfplumber.__version__}+pypdf2-{PyPDF2.__version__}/1"
+
     @staticmethod
-    def extract_text_from_pdf(file_path):
+    def iter_pages(file_path, content_hash=None, page_count=None):
+        """
+        Yield page texts one at a time so callers never hold the whole document,
+        served from the page text cache when the file was extracted before
+        Args:
+            file_path : Path of the pdf file
+            content_hash : SHA-256 of the file, enables the page text cache
+            page_count : Number of pages if the caller has it (get_page_count), saves opening the pdf again
+        Yield:
+            dict : page number and text of every page with text
+        """
+        if not content_hash:
+            yield from PDFservice._iter_pages_uncached(file_path, page_count)
+            return
+
+        from .page_cache import PageTextCache
+
+        cached = PageTextCache.get(content_hash, PDFservice.EXTRACTOR_VERSION)
+        if cached is not None:
+            print(f"Reading {cached.page_count} pages from the page text cache ...")
+            yield from PageTextCache.iter_pages(cached)
+            return
+
+        if page_count is None:
+            page_count = PDFservice.get_page_count(file_path)
+        yield from PageTextCache.write_through(
+            content_hash,
+            PDFservice.EXTRACTOR_VERSION,
+            page_count,
+            PDFservice._iter_pages_uncached(file_path, page_count),
+        )
+
+    @staticmethod
+    def _iter_pages_uncached(file_path, page_count=None):
+        # Stream pages with pdf plumber, falling back to PyPDF2
+        yielded = False
         try:
-            #trying pdf plumber to extract text form pdf
-            return PDFservice._extract_with_pdfplumber(file_path)
+            for page in PDFservice._iter_with_pdfplumber(file_path, page_count):
+                yielded = True
+                yield page
         except Exception as e:
+            # Pages already handed to the caller can't be taken back
+            if yielded:
+                raise
             print(f"pdf plumber failed: {e} trying pypdf2")
-            
-            try:
-                return PDFservice._extract_with_pypdf2(file_path)
-            except Exception as e:
-                raise(f"pdf plumber failed: {e} trying pypdf2")
+            yield from PDFservice._iter_with_pypdf2(file_path)
 
+    @staticmethod
+    def _iter_with_pdfplumber(file_path, page_count=None):
+        # Stream pages with pdf plumber
+        if page_count is None:
+            page_count = PDFservice.get_page_count(file_path)
 
+        if page_count == 0:
+            raise ValidationError("PDF has no pages")
 
-    @staticmethod
-    def _extract_with_pdfplumber(file_path):
-        # extracting using pdf plumber 
-        pages_data = []
-        full_text = ""
-
-        # open file 
-        with pdfplumber.open(file_path) as pdf:
-            page_count = len(pdf.pages)
-            
-            if page_count == 0:
-                raise ValidationError("PDF has no pages")
-            
-            for page_num, page in enumerate(pdf.pages, start=1):
-                # Extract text from page
-                text = page.extract_text()
+        if page_count < PDFservice.PARALLEL_MIN_PAGES or PDFservice.MAX_WORKERS <= 1:
+            yield from _iter_page_range(file_path, 0, page_count)
+            return
 
-                if text:
-                    text = text.strip()
-                    pages_data.append({
-                        "page_number":page_num,
-                        "text":text,
-                    })
-                    full_text += f"\n\n---- page {page_num} ----\n\n{text}"
-            if not full_text.strip():
-                raise ValidationError("No text could be extract from the pdf")
-            return {
-                "text":full_text.strip(),
-                "page_count":page_count,
-                "pages":pages_data,
-                
-            }
-        
-    # using PYPDF2 to exract text
-    @staticmethod
-    def _extract_with_pypdf2(file_path):
-        pages_data = []
-        full_text = ""
+        workers = min(PDFservice.MAX_WORKERS, -(-page_count // PDFservice.RANGE_PAGES))
+        ranges = PDFservice._split_page_ranges(page_count, PDFservice.RANGE_PAGES)
+
+        print(f"Streaming {page_count} pages with {workers} processes, {PDFservice.RANGE_PAGES} pages per range ...")
+
+        # One range per worker in flight: the next range is only submitted once the
+        # consumer has taken the oldest, so at most workers * RANGE_PAGES pages are held
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            pending = deque()
+            for start, end in ranges:
+                if len(pending) >= workers:
+                    yield from pending.popleft().result()
+                pending.append(executor.submit(_extract_page_range, file_path, start, end))
+            while pending:
+                yield from pending.popleft().result()
 
-        # open file 
+    @staticmethod
+    def _iter_with_pypdf2(file_path):
+        # Stream pages with PyPDF2
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
             page_count = len(pdf_reader.pages)
-            
+
             if page_count == 0:
                 raise ValidationError("PDF has no pages")
-            
+
             # Check if pdf is enscrypted
             if pdf_reader.is_encrypted:
                 raise ValidationError("PDF is password protected")
-            
-            
+
             for page_num in range(page_count):
-                # Extract text from page
-                page = pdf_reader.pages[page_num]
-                text = page.extract_text()
+                text = pdf_reader.pages[page_num].extract_text()
 
                 if text:
-                    text = text.strip()
-                    pages_data.append({
+                    yield {
                         "page_number":page_num + 1,
-                        "text":text,
-                    })
-                    full_text += f"\n\n---- page {page_num + 1} ----\n\n{text}"
-            if not full_text.strip():
-                raise ValidationError("No text could be extract from the pdf")
-            return {
-                "text":full_text.strip(),
-                "page_count":page_count,
-                "pages":pages_data,
-                
-            }
+                        "text":text.strip(),
+                    }
 
+    @staticmethod
+    def _split_page_ranges(page_count, range_pages):
+        """
+        Split pages into contiguous fixed size ranges for the worker processes
+        Args:
+            page_count : Number of pages in the pdf
+            range_pages : Pages per range
+        Return:
+            list : (start, end) page index ranges
+        """
+        return [(start, min(start + range_pages, page_count)) for start in range(0, page_count, range_pages)]
 
     @staticmethod
-    def get_page_count(file_path):
+    def get_page_count(file_path, content_hash=None):
         # Get number of pages in the file
+        from .page_cache import PageTextCache
+
+        cached = PageTextCache.get(content_hash, PDFservice.EXTRACTOR_VERSION)
+        if cached is not None:
+            return cached.page_count
+
         try:
             with pdfplumber.open(file_path) as pdf:
                 return len(pdf.pages)
@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from .embedding_cache import EmbeddingCache
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded in memory LRU of query embeddings
+
+    Users repeat the same questions and the frontend retries, a hit skips the model
+    (and the embedding server / SQLite cache) entirely. Keys are built from the model
+    identifier and the whitespace normalized query. With QUERY_EMBEDDING_CACHE_ALIAS
+    set, entries live in that Django cache instead, shared by every worker
+    """
+
+    MAX_ENTRIES = getattr(settings, 'QUERY_EMBEDDING_CACHE_SIZE', 1024)
+    # Django cache alias (e.g. 'default'), empty keeps the LRU in process
+    CACHE_ALIAS = getattr(settings, 'QUERY_EMBEDDING_CACHE_ALIAS', '')
+    TIMEOUT = getattr(settings, 'QUERY_EMBEDDING_CACHE_TIMEOUT', 24 * 3600)
+
+    _entries = OrderedDict()
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def make_key(model_name, query):
+        """
+        Build the cache key of a query
+        Args:
+            model_name : Embedding model identifier
+            query : User question
+        Return:
+            str : hex digest
+        """
+        return f"query-embedding:{EmbeddingCache.make_key(model_name, query.strip()).hex()}"
+
+    @classmethod
+    def get(cls, model_name, query):
+        """
+        Look up the embedding of a query
+        Args:
+            model_name : Embedding model identifier
+            query : User question
+        Return:
+            list or None : embedding vector, None on a miss
+        """
+        if cls.MAX_ENTRIES <= 0:
+            return None
+
+        key = cls.make_key(model_name, query)
+        if cls.CACHE_ALIAS:
+            embedding = caches[cls.CACHE_ALIAS].get(key)
+        else:
+            with cls._lock:
+                embedding = cls._entries.get(key)
+                if embedding is not None:
+                    cls._entries.move_to_end(key)
+
+        with cls._lock:
+            if embedding is None:
+                cls.misses += 1
+            else:
+                cls.hits += 1
+        return embedding
+
+    @classmethod
+    def set(cls, model_name, query, embedding):
+        """
+        Store the embedding of a query, evicting the least recently used one over the limit
+        Args:
+            model_name : Embedding model identifier
+            query : User question
+            embedding : list embedding vector
+        """
+        if cls.MAX_ENTRIES <= 0:
+            return
+
+        key = cls.make_key(model_name, query)
+        if cls.CACHE_ALIAS:
+            caches[cls.CACHE_ALIAS].set(key, embedding, cls.TIMEOUT)
+            return
+
+        with cls._lock:
+            cls._entries[key] = embedding
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > cls.MAX_ENTRIES:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def stats(cls):
+        """
+        Hit / miss counters of this process
+        Return:
+            dict : hits, misses, hit_rate and size (in process LRU only)
+        """
+        with cls._lock:
+            lookups = cls.hits + cls.misses
+            return {
+                'backend': f"django:{cls.CACHE_ALIAS}" if cls.CACHE_ALIAS else 'memory',
+                'hits': cls.hits,
+                'misses': cls.misses,
+                'hit_rate': round(cls.hits / lookups, 4) if lookups else 0.0,
+                'size': None if cls.CACHE_ALIAS else len(cls._entries),
+            }
+
+    @classmethod
+    def clear(cls):
+        """Drop the in process entries and reset the counters"""
+        with cls._lock:
+            cls._entries.clear()
+            cls.hits = 0
+            cls.misses = 0
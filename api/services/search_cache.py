@@ -0,0 +1,75 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+
+
+class SearchResultCache:
+    """
+    Cache of document search results in a Django cache
+
+    Keys hold the document id and its index_version, so reindexing a document
+    (which bumps the version) makes its old entries unreachable, and a deleted
+    document can't be searched in the first place. Entries of older versions
+    simply expire
+    """
+
+    ENABLED = getattr(settings, 'SEARCH_CACHE_ENABLED', True)
+    CACHE_ALIAS = getattr(settings, 'SEARCH_CACHE_ALIAS', 'default')
+    TIMEOUT = getattr(settings, 'SEARCH_CACHE_TIMEOUT', 600)
+
+    @staticmethod
+    def make_key(document, query, top_k, mode, model_name):
+        """
+        Build the cache key of a search
+        Args:
+            document : Searched Document
+            query : User question (whitespace normalized)
+            top_k : Number of results
+            mode : Search mode
+            model_name : Embedding model identifier
+        Return:
+            str : cache key
+        """
+        normalized = " ".join(query.split())
+        digest = hashlib.sha256(f"{model_name}\0{mode}\0{normalized}".encode('utf-8')).hexdigest()
+        return f"search:{document.id}:{document.index_version}:{top_k}:{digest}"
+
+    @classmethod
+    def get_many(cls, document, queries, top_k, mode, model_name):
+        """
+        Look up cached results
+        Args:
+            document : Searched Document
+            queries : list of user questions
+            top_k : Number of results
+            mode : Search mode
+            model_name : Embedding model identifier
+        Return:
+            dict : index in queries -> cached result, for hits only
+        """
+        if not cls.ENABLED:
+            return {}
+
+        keys = [cls.make_key(document, query, top_k, mode, model_name) for query in queries]
+        cached = caches[cls.CACHE_ALIAS].get_many(keys)
+        return {index: cached[key] for index, key in enumerate(keys) if key in cached}
+
+    @classmethod
+    def set_many(cls, document, queries, results, top_k, mode, model_name):
+        """
+        Store results
+        Args:
+            document : Searched Document
+            queries : list of user questions
+            results : matching list of results
+            top_k : Number of results
+            mode : Search mode
+            model_name : Embedding model identifier
+        """
+        if not cls.ENABLED or not queries:
+            return
+
+        caches[cls.CACHE_ALIAS].set_many(
+            {cls.make_key(document, query, top_k, mode, model_name): result for query, result in zip(queries, results)},
+            cls.TIMEOUT,
+        )
@@ -1,4 +1,11 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.conf import settings
 from .embedding_service import EmbeddingService
+from .keyword_search_service import KeywordSearchService
+from .query_embedding_cache import QueryEmbeddingCache
+from .search_cache import SearchResultCache
 from .vector_db_service import VectorDBService
 from ..models import Document, DocumentChunk
 
@@ -7,66 +14,372 @@ class SearchService:
     Service for similarity search in documents
     """
 
+    # 'vector' (embedding similarity) or 'hybrid' (vector + BM25 keyword, fused by rank)
+    MODES = ('vector', 'hybrid')
+    MODE = getattr(settings, 'SEARCH_MODE', 'vector')
+    # Results taken from each retriever before fusion, and the reciprocal rank fusion constant
+    HYBRID_CANDIDATES = getattr(settings, 'SEARCH_HYBRID_CANDIDATES', 10)
+    RRF_K = 60
+    # Queries accepted by one batch search request
+    BATCH_MAX_QUERIES = getattr(settings, 'SEARCH_BATCH_MAX_QUERIES', 50)
+
+    # Keyword queries run next to the vector query (sqlite and chroma release the GIL),
+    # the threads keep their database connection between searches
+    _keyword_executor = None
+    _keyword_executor_lock = threading.Lock()
+
     @staticmethod
-    def search_document(document_id, query, top_k=5):
+    def search_document(document_id, query, top_k=5, mode=None):
         """
         Docstring for search_document
         
         :param document_id: Document ID
         :param query: User question
         :param top_k: Number of returns to return
+        :param mode: 'vector' or 'hybrid', default SEARCH_MODE
 
         Return:
             dict : search reasult with chunks and metadata
         """
-        # Validate document exists and is ready
+        mode = SearchService.check_mode(mode)
+        document = SearchService.get_searchable_document(document_id)
+
+        chunks = SearchService._search_chunks(document, [query], top_k, mode)[0]
+        print(f'Found {len(chunks)} relevent chunks')
+
+        return {
+            'document_id' : document_id,
+            'document_title' : document.title,
+            'query' : query,
+            'mode' : mode,
+            'results_count' : len(chunks),
+            'chunks' : chunks,
+        }
+    
+
+    @staticmethod
+    def search_document_batch(document_id, queries, top_k=5, mode=None):
+        """
+        Search a document for many queries at once: one document lookup, one
+        embedding pass for the uncached queries and one multi-query vector search
+        
+        :param document_id: Document ID
+        :param queries: List of user questions
+        :param top_k: Number of results per query
+        :param mode: 'vector' or 'hybrid', default SEARCH_MODE
+
+        Return:
+            dict : document info and one search result per query, in order
+        """
+        mode = SearchService.check_mode(mode)
+        document = SearchService.get_searchable_document(document_id)
+
+        chunk_lists = SearchService._search_chunks(document, queries, top_k, mode)
+
+        return {
+            'document_id' : document_id,
+            'document_title' : document.title,
+            'mode' : mode,
+            'queries_count' : len(queries),
+            'results' : [
+                {
+                    'query' : query,
+                    'results_count' : len(chunks),
+                    'chunks' : chunks,
+                }
+                for query, chunks in zip(queries, chunk_lists)
+            ],
+        }
+
+    @staticmethod
+    def check_mode(mode):
+        """
+        Validate a search mode
+        
+        :param mode: 'vector', 'hybrid' or None for SEARCH_MODE
+
+        Return:
+            str : search mode
+        """
+        mode = mode or SearchService.MODE
+        if mode not in SearchService.MODES:
+            raise ValueError(f"Unknown search mode : {mode}, expected one of {', '.join(SearchService.MODES)}")
+        return mode
+
+    @staticmethod
+    def get_searchable_document(document_id):
+        """
+        Get a document that is ready to be searched
+        
+        :param document_id: Document ID
+
+        Return:
+            Document : completed document
+        """
         try:
-            document = Document.objects.get(id=document_id)
+            document = Document.objects.only('id', 'title', 'status', 'index_version').get(id=document_id)
         except Document.DoesNotExist:
             raise ValueError(f"Document with id : {document_id} did not found")
 
         if document.status != 'completed':
             raise ValueError(f"Document is not ready : {document.status}")
+        return document
+
+    @staticmethod
+    def _search_chunks(document, queries, top_k, mode):
+        """
+        Result chunks of each query: cached results first, then one embedding pass,
+        one vector query (plus keyword queries in hybrid mode) and one chunk lookup
+        for the rest
         
-        # 1 convert query to embedding
+        :param document: Completed Document
+        :param queries: List of user questions
+        :param top_k: Number of results per query
+        :param mode: Checked search mode
+
+        Return:
+            list : list of enriched chunk dicts per query, in order
+        """
+        model_name = EmbeddingService.cache_namespace()
+        chunk_lists = [None] * len(queries)
+        for index, chunks in SearchResultCache.get_many(document, queries, top_k, mode, model_name).items():
+            chunk_lists[index] = chunks
+
+        missing = [index for index, chunks in enumerate(chunk_lists) if chunks is None]
+        if not missing:
+            print(f"Search results served from cache")
+            return chunk_lists
+        miss_queries = [queries[index] for index in missing]
+
+        # 1 convert queries to embeddings
         print(f"Converting query to emeddings ... ")
-        query_embedding = EmbeddingService.generate_embedding(query)
+        query_embeddings = SearchService.get_query_embeddings(miss_queries)
 
-        # 2 Search in vector database
+        # 2 Search in vector database, keyword queries run meanwhile in hybrid mode
         print(f"Searching in vector database ... ")
-        results = VectorDBService.search_similar_chunks(
-            # perameters to this function
-            document_id=document_id,
+        hybrid = mode == 'hybrid' and KeywordSearchService.is_available()
+        depth = max(top_k, SearchService.HYBRID_CANDIDATES) if hybrid else top_k
+        if hybrid:
+            executor = SearchService._get_keyword_executor()
+            keyword_futures = [
+                executor.submit(KeywordSearchService.search, document.id, query, depth) for query in miss_queries
+            ]
+
+        results = VectorDBService.search_similar_chunks_batch(document.id, query_embeddings, top_k=depth)
+
+        if hybrid:
+            results = [
+                SearchService.reciprocal_rank_fusion(vector_results, future.result(), top_k)
+                for vector_results, future in zip(results, keyword_futures)
+            ]
+
+        # 3 Enrich results with full chunk data from database, one query for all of them
+        chunks = DocumentChunk.objects.in_bulk({result['chunk_id'] for query_results in results for result in query_results})
+
+        computed = []
+        for query_embedding, query_results in zip(query_embeddings, results):
+            enriched_results = []
+            for result in query_results:
+                chunk = chunks.get(result['chunk_id'])
+                if chunk is None:
+                    print(f"Warning: Chunk {result['chunk_id']} not found in database")
+                    continue
+                enriched_results.append(SearchService.enrich_result(result, chunk, query_embedding))
+            computed.append(enriched_results)
+
+        SearchResultCache.set_many(document, miss_queries, computed, top_k, mode, model_name)
+        for index, enriched_results in zip(missing, computed):
+            chunk_lists[index] = enriched_results
+        return chunk_lists
+
+    @staticmethod
+    def enrich_result(result, chunk, query_embedding):
+        """
+        Result dict of a chunk returned by the vector / hybrid search
+        
+        :param result: Search result (chunk_id, similarity_score, optional rrf_score)
+        :param chunk: Matching DocumentChunk
+        :param query_embedding: Embedding of the question
+
+        Return:
+            dict : chunk data and scores
+        """
+        similarity_score = result['similarity_score']
+        if similarity_score is None:
+            # Keyword only match, score it against its stored embedding
+            similarity_score = SearchService.similarity_from_embedding(query_embedding, chunk.embedding)
+
+        enriched_result = {
+            'chunk_id' : chunk.id,
+            'chunk_index' : chunk.chunk_index,
+            'page_number' : chunk.page_number,
+            'page_start' : chunk.page_start,
+            'page_end' : chunk.page_end,
+            'content' : chunk.content,
+            'token_count' : chunk.token_count,
+            'similarity_score' : round(similarity_score, 4),
+        }
+        if 'rrf_score' in result:
+            enriched_result['rrf_score'] = round(result['rrf_score'], 6)
+        return enriched_result
+
+    @classmethod
+    def _get_keyword_executor(cls):
+        if cls._keyword_executor is None:
+            with cls._keyword_executor_lock:
+                if cls._keyword_executor is None:
+                    cls._keyword_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='keyword-search')
+        return cls._keyword_executor
+
+    @staticmethod
+    def reciprocal_rank_fusion(vector_results, keyword_results, top_k=5):
+        """
+        Score every chunk by the sum of 1 / (RRF_K + rank) over the lists it appears in
+        
+        :param vector_results: Vector results, best first
+        :param keyword_results: Keyword results, best first
+        :param top_k: Number of results to return
+
+        Return:
+            list : top_k fused results, best first
+        """
+        fused = {}
+        for results in (vector_results, keyword_results):
+            for rank, result in enumerate(results, start=1):
+                entry = fused.setdefault(result['chunk_id'], {
+                    'chunk_id': result['chunk_id'],
+                    'similarity_score': None,
+                    'rrf_score': 0.0,
+                })
+                entry['rrf_score'] += 1 / (SearchService.RRF_K + rank)
+                if 'similarity_score' in result:
+                    entry['similarity_score'] = result['similarity_score']
+
+        return sorted(fused.values(), key=lambda entry: entry['rrf_score'], reverse=True)[:top_k]
+
+    @staticmethod
+    def similarity_from_embedding(query_embedding, embedding):
+        """
+        Similarity on the vector search scale, 1 / (1 + squared L2) of the normalized vectors
+        
+        :param query_embedding: Query embedding vector
+        :param embedding: Stored chunk embedding
+
+        Return:
+            float : similarity score (0 to 1)
+        """
+        if embedding is None:
+            return 0.0
+        cosine = EmbeddingService.calculate_similarity(query_embedding, np.asarray(embedding, dtype=np.float32))
+        return 1 / (1 + max(2.0 - 2.0 * cosine, 0.0))
+
+
+    @staticmethod
+    def search_user_documents(user, query, top_k=5):
+        """
+        Search the chunks of all completed documents of a user with one vector query
+        Args:
+            user : Owner of the documents
+            query : User question
+            top_k : Number of chunks to return
+        Return:
+            dict : search result with chunks, each tagged with its document
+        """
+        titles = {}
+        index_versions = {}
+        for document_id, title, index_version in Document.objects.filter(
+            user=user, status='completed'
+        ).values_list('id', 'title', 'index_version'):
+            titles[document_id] = title
+            index_versions[document_id] = index_version
+        if not titles:
+            raise ValueError("No processed documents to search")
+
+        query_embedding = SearchService.get_query_embedding(query)
+        results = VectorDBService.search_user_chunks(
+            user_id=user.id,
+            index_versions=index_versions,
             query_embedding=query_embedding,
             top_k=top_k,
         )
 
-        # 3 Enrich results with full chunk data from database
+        # One query for every matched chunk
+        chunks = DocumentChunk.objects.in_bulk([result['chunk_id'] for result in results])
         enriched_results = []
         for result in results:
-            try:
-                chunk = DocumentChunk.objects.get(id=result['chunk_id'])
-                enriched_results.append({
-                    'chunk_id' : chunk.id,
-                    'chunk_index' : chunk.chunk_index,
-                    'page_number' : chunk.page_number,
-                    'content' : chunk.content,
-                    'token_count' : chunk.token_count,
-                    'similarity_score' : round(result['similarity_score'], 4),
-                })
-            except Document.DoesNotExist:
+            chunk = chunks.get(result['chunk_id'])
+            if chunk is None:
                 print(f"Warning: Chunk {result['chunk_id']} not found in database")
                 continue
-        print(f'Found {len(enriched_results)} relevent chunks')
+            enriched_results.append({
+                'document_id' : chunk.document_id,
+                'document_title' : titles.get(chunk.document_id),
+                'chunk_id' : chunk.id,
+                'chunk_index' : chunk.chunk_index,
+                'page_number' : chunk.page_number,
+                'page_start' : chunk.page_start,
+                'page_end' : chunk.page_end,
+                'content' : chunk.content,
+                'token_count' : chunk.token_count,
+                'similarity_score' : round(result['similarity_score'], 4),
+            })
+        print(f'Found {len(enriched_results)} relevent chunks in {len(titles)} documents')
 
         return {
-            'document_id' : document_id,
-            'document_title' : document.title,
             'query' : query,
+            'documents_searched' : len(titles),
             'results_count' : len(enriched_results),
             'chunks' : enriched_results,
         }
-    
+
+
+    @staticmethod
+    def get_query_embedding(query):
+        """
+        Embed a user question, repeated questions are served from the query LRU
+        Args:
+            query : User question
+        Return:
+            list : embedding vector
+        """
+        model_name = EmbeddingService.cache_namespace()
+        embedding = QueryEmbeddingCache.get(model_name, query)
+        if embedding is None:
+            embedding = EmbeddingService.generate_embedding(query)
+            QueryEmbeddingCache.set(model_name, query, embedding)
+        return embedding
+
+
+    @staticmethod
+    def get_query_embeddings(queries):
+        """
+        Embed many user questions, the ones not in the query LRU in a single model call
+        Args:
+            queries : list of user questions
+        Return:
+            list : one embedding vector per query
+        """
+        model_name = EmbeddingService.cache_namespace()
+        embeddings = [QueryEmbeddingCache.get(model_name, query) for query in queries]
+
+        misses = {}
+        for index, embedding in enumerate(embeddings):
+            if embedding is None:
+                misses.setdefault(queries[index], []).append(index)
+
+        if misses:
+            miss_queries = list(misses)
+            # A single question can go through the embedding server, many are encoded in one call here
+            if len(miss_queries) == 1:
+                encoded = [EmbeddingService.generate_embedding(miss_queries[0])]
+            else:
+                encoded = EmbeddingService.generate_embeddings_batch(miss_queries)
+            for query, embedding in zip(miss_queries, encoded):
+                QueryEmbeddingCache.set(model_name, query, embedding)
+                for index in misses[query]:
+                    embeddings[index] = embedding
+        return embeddings
+
 
     @staticmethod
     def build_context(search_results, max_token=2000):
@@ -90,7 +403,7 @@ class SearchService:
                 break
 
             # add chunk to context
-            chunk_header = f"\n\n--- Source {i} (page {chunk['page_number']}, Similarity : {chunk['similarity_score']}) ---\n"
+            chunk_header = f"\n\n--- Source {i} ({SearchService.format_pages(chunk)}, Similarity : {chunk['similarity_score']}) ---\n"
             context_part.append(chunk_header + chunk['content'])
             current_tokens += chunk['token_count']
 
@@ -99,6 +412,21 @@ class SearchService:
 
         return context
     
+    @staticmethod
+    def format_pages(chunk):
+        """
+        Page label of a chunk for the llm context
+        
+        :param chunk: Chunk dict from search_document()
+        Return:
+            str : "page N" or "pages N-M" for chunks spanning pages
+        """
+        page_start = chunk.get('page_start') or chunk['page_number']
+        page_end = chunk.get('page_end') or page_start
+        if page_end != page_start:
+            return f"pages {page_start}-{page_end}"
+        return f"page {page_start}"
+
     @staticmethod
     def get_source_references(search_results):
         """
@@ -113,6 +441,8 @@ class SearchService:
             sources.append({
                 'chunk_id': chunk['chunk_id'],
                 'page_number': chunk['page_number'],
+                'page_start': chunk.get('page_start'),
+                'page_end': chunk.get('page_end'),
                 'similarity_score': chunk['similarity_score'],
                 'preview': chunk['content'][:100] + '...' if len(chunk['content']) > 100 else chunk['content']
             })
@@ -0,0 +1,213 @@
+import hashlib
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from ..models import Document, UploadSession, UploadPart
+
+
+class ChunkedUploadService:
+    """
+    Service for resumable uploads: parts are written at their offset in a staging
+    file next to the documents, so large files never sit in memory and the finished
+    file is moved (not copied) into place
+    """
+
+    PART_SIZE = getattr(settings, 'UPLOAD_PART_SIZE', 8 * 1024 * 1024)
+    MAX_SIZE = getattr(settings, 'MAX_UPLOAD_SIZE', 250 * 1024 * 1024)
+    SESSION_TTL = getattr(settings, 'UPLOAD_SESSION_TTL', 24)  # hours
+
+    # Bytes read from the request / file per step
+    STREAM_CHUNK = 64 * 1024
+
+    @staticmethod
+    def staging_path(session):
+        return default_storage.path(f'documents/uploads/{session.id}.part')
+
+    @staticmethod
+    def create_session(user, filename, total_size, expected_hash=None):
+        """
+        Start an upload and reserve its staging file
+        Args:
+            user : Owner of the upload
+            filename : Original file name (.pdf)
+            total_size : File size in bytes
+            expected_hash : Optional SHA-256 of the whole file, checked on completion
+        Return:
+            UploadSession : New session
+        """
+        session = UploadSession.objects.create(
+            user=user,
+            filename=os.path.basename(filename),
+            total_size=total_size,
+            part_size=ChunkedUploadService.PART_SIZE,
+            expected_hash=expected_hash.lower() if expected_hash else None,
+            expires_at=timezone.now() + timedelta(hours=ChunkedUploadService.SESSION_TTL),
+        )
+
+        # Sparse file of the final size, parts can then arrive in any order
+        path = ChunkedUploadService.staging_path(session)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as staging:
+            staging.truncate(total_size)
+
+        print(f"Upload {session.id} started: {session.filename}, {total_size} bytes in {session.part_count} parts")
+        return session
+
+    @staticmethod
+    def write_part(session, part_number, stream, expected_hash=None):
+        """
+        Stream one part from the request into the staging file, hashing as it is written
+        Args:
+            session : Active UploadSession
+            part_number : Part number, starting at 1
+            stream : File-like object with the raw part bytes (request stream)
+            expected_hash : Optional SHA-256 of the part sent by the client
+        Return:
+            UploadPart : Stored part
+        """
+        ChunkedUploadService._check_active(session)
+
+        if not 1 <= part_number <= session.part_count:
+            raise ValueError(f"Part number must be between 1 and {session.part_count}")
+        if stream is None:
+            raise ValueError("Part body is empty")
+
+        offset, length = session.part_range(part_number)
+        digest = hashlib.sha256()
+        written = 0
+
+        with open(ChunkedUploadService.staging_path(session), 'r+b') as staging:
+            staging.seek(offset)
+            while written < length:
+                data = stream.read(min(ChunkedUploadService.STREAM_CHUNK, length - written))
+                if not data:
+                    break
+                digest.update(data)
+                staging.write(data)
+                written += len(data)
+
+        if written != length or stream.read(1):
+            raise ValueError(f"Part {part_number} must be exactly {length} bytes")
+
+        sha256 = digest.hexdigest()
+        if expected_hash and expected_hash.lower() != sha256:
+            raise ValueError(f"Part {part_number} checksum mismatch, expected {expected_hash} got {sha256}")
+
+        part, _ = UploadPart.objects.update_or_create(
+            session=session,
+            part_number=part_number,
+            defaults={'size': written, 'sha256': sha256},
+        )
+        return part
+
+    @staticmethod
+    def complete(session):
+        """
+        Check all parts arrived, move the file into document storage and create the Document
+        Args:
+            session : Active UploadSession
+        Return:
+            Document : New pending document
+        """
+        ChunkedUploadService._check_active(session)
+
+        received = set(session.parts.values_list('part_number', flat=True))
+        missing = [number for number in range(1, session.part_count + 1) if number not in received]
+        if missing:
+            raise ValueError(f"Missing parts : {missing[:20]}")
+
+        # Claim the completion so concurrent complete calls can't create two documents
+        if not UploadSession.objects.filter(id=session.id, status='active').update(status='completed'):
+            raise ValueError("Upload is not active")
+        session.status = 'completed'
+
+        try:
+            staging_path = ChunkedUploadService.staging_path(session)
+            content_hash = ChunkedUploadService._hash_file(staging_path)
+            if session.expected_hash and session.expected_hash != content_hash:
+                raise ValueError(f"File checksum mismatch, expected {session.expected_hash} got {content_hash}")
+
+            with transaction.atomic():
+                document = Document(
+                    user=session.user,
+                    title=session.filename.rsplit('.', 1)[0],
+                    file_size=session.total_size,
+                    content_hash=content_hash,
+                    status='pending',
+                )
+
+                # Same name the FileField would generate for a regular upload
+                name = document.file.field.generate_filename(document, session.filename)
+                name = default_storage.get_available_name(name)
+                document.file.name = name
+                document.save()
+
+                session.document = document
+                session.save(update_fields=['document'])
+                session.parts.all().delete()
+
+                # Last step, a failure before it rolls the rows back and keeps the staging file
+                path = default_storage.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(staging_path, path)
+        except Exception:
+            UploadSession.objects.filter(id=session.id).update(status='active')
+            session.status = 'active'
+            raise
+
+        print(f"Upload {session.id} completed as document {document.id}")
+        return document
+
+    @staticmethod
+    def abort(session):
+        """
+        Cancel an upload and delete its staging file
+        Args:
+            session : UploadSession
+        """
+        if session.status != 'active':
+            raise ValueError("Upload is not active")
+
+        session.status = 'aborted'
+        session.save(update_fields=['status'])
+        session.parts.all().delete()
+
+        path = ChunkedUploadService.staging_path(session)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def purge_expired():
+        """
+        Abort active uploads past their expiry and free their disk space
+        Return:
+            int : Number of uploads aborted
+        """
+        expired = UploadSession.objects.filter(status='active', expires_at__lt=timezone.now())
+
+        purged = 0
+        for session in expired:
+            ChunkedUploadService.abort(session)
+            purged += 1
+
+        if purged:
+            print(f"Purged {purged} expired uploads")
+        return purged
+
+    @staticmethod
+    def _check_active(session):
+        if session.status != 'active':
+            raise ValueError(f"Upload is {session.status}")
+        if session.expires_at < timezone.now():
+            raise ValueError("Upload has expired")
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for data in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(data)
+        return digest.hexdigest()
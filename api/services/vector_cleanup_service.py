@@ -0,0 +1,262 @@
+import os
+import re
+import shutil
+import sqlite3
+import time
+from django.conf import settings
+from django.db.models import F
+from chromadb.errors import NotFoundError
+from ..models import Document, VectorCleanupTask
+from .numpy_vector_store import NumpyVectorStore
+from .vector_db_service import VectorDBService
+
+
+class VectorCleanupService:
+    """
+    Removal of the vectors of deleted documents and garbage collection of the vector stores
+
+    Deleting a Document queues a VectorCleanupTask (api/signals.py) that the ingest
+    worker processes when idle. The vector_gc command also reconciles every stored
+    collection and .npy file against the live documents, which catches anything deleted
+    before the queue existed or while a job was still indexing it, and compacts storage
+    """
+
+    MAX_ATTEMPTS = getattr(settings, 'VECTOR_CLEANUP_MAX_ATTEMPTS', 5)
+    # Segment directories younger than this may belong to a collection being created
+    SEGMENT_GRACE_PERIOD = getattr(settings, 'VECTOR_GC_SEGMENT_GRACE_PERIOD', 600)
+    # Vectors read per page when sweeping a user collection
+    PAGE_SIZE = 1000
+    # Seconds compaction waits for a lock on the chroma database
+    LOCK_TIMEOUT = 30
+
+    DOCUMENT_COLLECTION = re.compile(r"^document_(\d+)$")
+    USER_COLLECTION = re.compile(r"^user_(\d+)$")
+    NUMPY_FILE = re.compile(r"^document_(\d+)(?:\.ids)?\.npy$")
+    SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+    @staticmethod
+    def process_pending(limit=50):
+        """
+        Remove the vectors of deleted documents queued by VectorCleanupTask
+        Args:
+            limit : Maximum number of tasks processed, None for all
+        Return:
+            int : Number of documents cleaned up
+        """
+        tasks = VectorCleanupTask.objects.filter(attempts__lt=VectorCleanupService.MAX_ATTEMPTS)
+        if limit is not None:
+            tasks = tasks[:limit]
+
+        cleaned = 0
+        for task in list(tasks):
+            try:
+                VectorCleanupService.remove_document_vectors(task.document_id, task.user_id)
+            except Exception as e:
+                print(f"Vector cleanup of document {task.document_id} failed : {e}")
+                VectorCleanupTask.objects.filter(id=task.id).update(attempts=F('attempts') + 1, last_error=str(e))
+                continue
+            task.delete()
+            cleaned += 1
+
+        if cleaned:
+            print(f"Cleaned up vectors of {cleaned} deleted documents")
+        return cleaned
+
+    @staticmethod
+    def remove_document_vectors(document_id, user_id):
+        """
+        Delete the collection, numpy files and user collection entries of a deleted document
+        Args:
+            document_id : Document ID
+            user_id : ID of the document owner
+        """
+        VectorDBService.delete_collection(document_id)
+
+        if not Document.objects.filter(user_id=user_id).exists():
+            # Last document of the user (or the account was deleted)
+            VectorDBService.delete_user_collection(user_id)
+            return
+
+        try:
+            collection = VectorDBService.get_cached_collection(VectorDBService.get_user_collection_name(user_id))
+        except NotFoundError:
+            return
+        VectorDBService.remove_from_user_collection(user_id, document_id, collection=collection)
+
+    @staticmethod
+    def collect_garbage(dry_run=False):
+        """
+        Delete the collections, user collection entries and numpy files of documents that no longer exist
+        Args:
+            dry_run : Only report what would be deleted
+        Return:
+            dict : collections, user_vectors and numpy_files removed
+        """
+        live_documents = set(Document.objects.values_list('id', flat=True))
+        live_users = set(Document.objects.values_list('user_id', flat=True).distinct())
+        removed = {'collections': 0, 'user_vectors': 0, 'numpy_files': 0}
+
+        client = VectorDBService.get_client()
+        for collection in client.list_collections():
+            name = collection.name
+
+            match = VectorCleanupService.DOCUMENT_COLLECTION.match(name)
+            if match:
+                if not VectorCleanupService._document_is_live(int(match.group(1)), live_documents):
+                    print(f"Orphan collection : {name}")
+                    removed['collections'] += 1
+                    if not dry_run:
+                        VectorDBService.forget_collection(name)
+                        client.delete_collection(name=name)
+                continue
+
+            match = VectorCleanupService.USER_COLLECTION.match(name)
+            if not match:
+                continue
+            user_id = int(match.group(1))
+            if user_id not in live_users and not Document.objects.filter(user_id=user_id).exists():
+                print(f"Orphan collection : {name}")
+                removed['collections'] += 1
+                if not dry_run:
+                    VectorDBService.delete_user_collection(user_id)
+                continue
+
+            dead = VectorCleanupService._find_dead_documents(collection, live_documents)
+            for document_id, count in dead.items():
+                if Document.objects.filter(id=document_id).exists():
+                    continue
+                print(f"Orphan vectors of document {document_id} in {name} : {count}")
+                removed['user_vectors'] += count
+                if not dry_run:
+                    collection.delete(where={'document_id': document_id})
+
+        for document_id, paths in VectorCleanupService._numpy_files().items():
+            if VectorCleanupService._document_is_live(document_id, live_documents):
+                continue
+            removed['numpy_files'] += len(paths)
+            print(f"Orphan numpy files of document {document_id} : {len(paths)}")
+            if not dry_run:
+                NumpyVectorStore.delete(document_id)
+
+        return removed
+
+    @staticmethod
+    def _document_is_live(document_id, live_documents):
+        # Checked again before deleting, the document may have been uploaded since the snapshot
+        return document_id in live_documents or Document.objects.filter(id=document_id).exists()
+
+    @staticmethod
+    def _find_dead_documents(collection, live_documents):
+        """
+        Page through the metadata of a user collection
+        Return:
+            dict : document id -> number of vectors, for documents that no longer exist
+        """
+        dead = {}
+        offset = 0
+        while True:
+            page = collection.get(include=['metadatas'], limit=VectorCleanupService.PAGE_SIZE, offset=offset)
+            metadatas = page['metadatas'] or []
+            for metadata in metadatas:
+                document_id = (metadata or {}).get('document_id')
+                if document_id is not None and document_id not in live_documents:
+                    dead[document_id] = dead.get(document_id, 0) + 1
+            if len(metadatas) < VectorCleanupService.PAGE_SIZE:
+                return dead
+            offset += len(metadatas)
+
+    @staticmethod
+    def _numpy_files():
+        """
+        Return:
+            dict : document id -> paths of its files in the numpy store
+        """
+        files = {}
+        try:
+            names = os.listdir(NumpyVectorStore.STORE_PATH)
+        except FileNotFoundError:
+            return files
+        for name in names:
+            match = VectorCleanupService.NUMPY_FILE.match(name)
+            if match:
+                files.setdefault(int(match.group(1)), []).append(os.path.join(NumpyVectorStore.STORE_PATH, name))
+        return files
+
+    @staticmethod
+    def compact(dry_run=False):
+        """
+        Reclaim disk space: chroma keeps the HNSW directory of a deleted collection and
+        never shrinks its sqlite file, and interrupted numpy writes leave .tmp files.
+        Web and ingest processes must be stopped first, their chroma clients hold the
+        database and may still have a removed segment directory open
+        Args:
+            dry_run : Only report what would be deleted
+        Return:
+            dict : segment_dirs and temp_files removed, vacuumed, errors (list of messages)
+        """
+        removed = {'segment_dirs': 0, 'temp_files': 0, 'vacuumed': False, 'errors': []}
+        cutoff = time.time() - VectorCleanupService.SEGMENT_GRACE_PERIOD
+
+        database_path = os.path.join(VectorDBService.CHROMA_DB_PATH, 'chroma.sqlite3')
+        if os.path.exists(database_path):
+            try:
+                VectorCleanupService._compact_chroma(database_path, cutoff, dry_run, removed)
+            except sqlite3.OperationalError as e:
+                # "database is locked": another process is writing to chroma
+                removed['errors'].append(f"Chroma compaction skipped, {e} (stop the web and ingest processes first)")
+
+        if os.path.isdir(NumpyVectorStore.STORE_PATH):
+            for name in os.listdir(NumpyVectorStore.STORE_PATH):
+                path = os.path.join(NumpyVectorStore.STORE_PATH, name)
+                if name.endswith('.tmp') and os.path.getmtime(path) <= cutoff:
+                    removed['temp_files'] += 1
+                    if not dry_run:
+                        os.unlink(path)
+
+        return removed
+
+    @staticmethod
+    def _compact_chroma(database_path, cutoff, dry_run, removed):
+        db = sqlite3.connect(database_path, timeout=VectorCleanupService.LOCK_TIMEOUT, isolation_level=None)
+        try:
+            live_segments = {row[0] for row in db.execute("SELECT id FROM segments")}
+
+            for name in os.listdir(VectorDBService.CHROMA_DB_PATH):
+                path = os.path.join(VectorDBService.CHROMA_DB_PATH, name)
+                if (
+                    not VectorCleanupService.SEGMENT_DIR.match(name)
+                    or name in live_segments
+                    or not os.path.isdir(path)
+                    or os.path.getmtime(path) > cutoff
+                ):
+                    continue
+                print(f"Orphan segment directory : {name}")
+                removed['segment_dirs'] += 1
+                if not dry_run:
+                    try:
+                        shutil.rmtree(path)
+                    except OSError as e:
+                        removed['errors'].append(f"Could not remove segment directory {name} : {e}")
+
+            if not dry_run:
+                db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                db.execute("VACUUM")
+                removed['vacuumed'] = True
+        finally:
+            db.close()
+
+    @staticmethod
+    def storage_size():
+        """
+        Return:
+            int : Bytes used by the chroma directory and the numpy store
+        """
+        total = 0
+        for base in (VectorDBService.CHROMA_DB_PATH, NumpyVectorStore.STORE_PATH):
+            for root, dirs, files in os.walk(base):
+                for name in files:
+                    try:
+                        total += os.path.getsize(os.path.join(root, name))
+                    except FileNotFoundError:
+                        pass
+        return total
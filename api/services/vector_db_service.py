@@ -1,7 +1,13 @@
 import chromadb
 from chromadb.config import Settings
+from chromadb.errors import NotFoundError
 import os
+import threading
+from collections import OrderedDict
+import numpy as np
 from django.conf import settings as django_settings
+from django.db.models import QuerySet
+from .numpy_vector_store import NumpyVectorStore
 
 class VectorDBService:
     """
@@ -10,10 +16,28 @@ class VectorDBService:
 
     # ChromaDB client (singleton)
     _client = None
+    _client_lock = threading.Lock()
+
+    # Collection handles by name, so queries skip the metadata read of get_collection
+    COLLECTION_CACHE_SIZE = getattr(django_settings, 'VECTOR_DB_COLLECTION_CACHE_SIZE', 1024)
+    _collections = OrderedDict()
+    _collections_lock = threading.Lock()
+
+    # (document id, index_version) of the completed documents each user collection
+    # held when this process's client loaded it, see _check_user_collection
+    _user_collection_versions = {}
+
+    # Chunks sent to chroma per upsert request
+    BATCH_SIZE = getattr(django_settings, 'VECTOR_DB_BATCH_SIZE', 256)
 
     # Database path
     CHROMA_DB_PATH = os.path.join(django_settings.BASE_DIR, 'chromadb_data')
 
+    # Document searches: 'chroma', 'numpy' (exact search on .npy files) or 'auto'
+    # (numpy for documents up to NUMPY_MAX_CHUNKS chunks). Chroma is always written too
+    BACKEND = getattr(django_settings, 'VECTOR_DB_BACKEND', 'chroma')
+    NUMPY_MAX_CHUNKS = getattr(django_settings, 'VECTOR_DB_NUMPY_MAX_CHUNKS', 20000)
+
     
     @classmethod
     def get_client(cls):
@@ -23,21 +47,95 @@ class VectorDBService:
             chromadb.client : chromaDB client instance
         """
         if cls._client is None:
-            # Create directory if it does not exists
-            os.makedirs(cls.CHROMA_DB_PATH, exist_ok=True)
-
-            print(f"Initializing ChromaDB at: {cls.CHROMA_DB_PATH}")
-
-            #  Initialize client with persistent storage
-            cls._client = chromadb.PersistentClient(
-                path=cls.CHROMA_DB_PATH,
-                settings=Settings(
-                    anonymized_telemetry = False,
-                    allow_reset = True
-                )
-            )
-            print(f"ChromaDB initialized successfully!")
+            # Threads of one process share a single client
+            with cls._client_lock:
+                if cls._client is None:
+                    # Create directory if it does not exists
+                    os.makedirs(cls.CHROMA_DB_PATH, exist_ok=True)
+
+                    print(f"Initializing ChromaDB at: {cls.CHROMA_DB_PATH}")
+
+                    #  Initialize client with persistent storage
+                    cls._client = chromadb.PersistentClient(
+                        path=cls.CHROMA_DB_PATH,
+                        settings=Settings(
+                            anonymized_telemetry = False,
+                            allow_reset = True
+                        )
+                    )
+                    print(f"ChromaDB initialized successfully!")
         return cls._client
+
+    @classmethod
+    def _drop_client(cls):
+        """
+        Forget the client, its cached handles and loaded indexes (caller holds _client_lock).
+        Chroma shares one system per path inside a process, clearing it makes the next
+        client read the collections again from disk
+        """
+        if cls._client is not None:
+            cls._client.clear_system_cache()
+            cls._client = None
+        with cls._collections_lock:
+            cls._collections.clear()
+        cls._user_collection_versions = {}
+
+    @classmethod
+    def get_cached_collection(cls, name, fetch=None):
+        """
+        Get a collection handle from the handle cache, fetching it on a miss
+        Args:
+            name : Collection name
+            fetch : Callable returning the collection, default client.get_collection (NotFoundError if missing)
+        Return:
+            chromadb.Collection : Collection
+        """
+        with cls._collections_lock:
+            collection = cls._collections.get(name)
+            if collection is not None:
+                cls._collections.move_to_end(name)
+                return collection
+
+        if fetch is None:
+            collection = cls.get_client().get_collection(name=name)
+        else:
+            collection = fetch()
+        cls._remember_collection(name, collection)
+        return collection
+
+    @classmethod
+    def _remember_collection(cls, name, collection):
+        with cls._collections_lock:
+            cls._collections[name] = collection
+            cls._collections.move_to_end(name)
+            while len(cls._collections) > cls.COLLECTION_CACHE_SIZE:
+                cls._collections.popitem(last=False)
+
+    @classmethod
+    def forget_collection(cls, name):
+        """Drop a collection handle from the cache"""
+        with cls._collections_lock:
+            cls._collections.pop(name, None)
+
+    @classmethod
+    def _with_collection(cls, name, operation, fetch=None):
+        """
+        Run an operation on a cached collection handle. Another process (ingest worker)
+        may have deleted or recreated the collection since the handle was cached, the
+        handle then raises NotFoundError and is fetched again once
+        Args:
+            name : Collection name
+            operation : Callable taking the collection
+            fetch : See get_cached_collection
+        Return:
+            Return value of operation
+        """
+        collection = cls.get_cached_collection(name, fetch)
+        try:
+            return operation(collection)
+        except NotFoundError:
+            cls.forget_collection(name)
+            return operation(cls.get_cached_collection(name, fetch))
     
     @ staticmethod
     def get_collection_name(document_id):
@@ -64,64 +162,186 @@ class VectorDBService:
         collection_name = VectorDBService.get_collection_name(document_id)
 
         # Delete exixting collection if any exists
+        VectorDBService.forget_collection(collection_name)
         try:
             client.delete_collection(name = collection_name)
             print(f"Deleted existing collection : {collection_name}")
         except:
             pass
+        NumpyVectorStore.delete(document_id)
 
         # Create new collection
         collection = client.create_collection(
             name = collection_name,
             metadata = {'document_id':document_id}
         )
+        VectorDBService._remember_collection(collection_name, collection)
 
         print(f"Created collection : {collection_name}")
         return collection
     
     @staticmethod
-    def add_chunks_to_collection(document_id, chunks):
+    def get_or_create_collection(document_id):
         """
-        Docstring for add_chunks_to_collection
+        Get the collection of the document, creating it if needed (keeps existing vectors)
+        Args:
+            document_id : Document ID
+        return:
+            chromadb.Collection : Collection
+        """
+        client = VectorDBService.get_client()
+        return client.get_or_create_collection(
+            name = VectorDBService.get_collection_name(document_id),
+            metadata = {'document_id':document_id}
+        )
+    
+    @staticmethod
+    def get_user_collection_name(user_id):
+        """
+        Generate the name of the collection shared by all documents of a user
+        Args:
+            user_id : User ID
+        Returns:
+            str : Collection name
+        """
+        return f"user_{user_id}"
+
+    @staticmethod
+    def get_or_create_user_collection(user_id):
+        """
+        Get the collection holding the chunks of every document of a user (tagged with document_id)
+        Args:
+            user_id : User ID
+        return:
+            chromadb.Collection : Collection
+        """
+        client = VectorDBService.get_client()
+        return client.get_or_create_collection(
+            name = VectorDBService.get_user_collection_name(user_id),
+            metadata = {'user_id':user_id}
+        )
+
+    @staticmethod
+    def remove_from_user_collection(user_id, document_id, collection=None):
+        """
+        Delete the vectors of a document from its user collection (before it's reindexed)
+        Args:
+            user_id : User ID
+            document_id : Document ID
+            collection : User collection, looked up / created when omitted
+        """
+        if collection is None:
+            collection = VectorDBService.get_or_create_user_collection(user_id)
+        collection.delete(where={'document_id': document_id})
+
+    @staticmethod
+    def delete_user_collection(user_id):
+        """
+        Delete the collection of a user (all of their documents are gone)
+        Args:
+            user_id : User ID
+        """
+        collection_name = VectorDBService.get_user_collection_name(user_id)
+        VectorDBService.forget_collection(collection_name)
+        try:
+            VectorDBService.get_client().delete_collection(name=collection_name)
+            print(f"Deleted collection : {collection_name}")
+        except NotFoundError:
+            pass
+
+    @staticmethod
+    def upsert_chunks(document_id, chunks, embeddings=None, batch_size=None, on_progress=None, collection=None, user_collection=None):
+        """
+        Insert or update chunks in the document collection in fixed size batches.
+        Chunks are keyed by chunk id, so re-sending a chunk replaces it.
         
         :param document_id: Document ID
-        :param chunks: Queryset or list of DocumentChunk objects
+        :param chunks: Queryset, list or iterator of saved DocumentChunk objects
+        :param embeddings: Optional (n, dim) numpy array aligned with chunks,
+            defaults to each chunk's stored embedding
+        :param batch_size: Chunks sent per request (default VECTOR_DB_BATCH_SIZE)
+        :param on_progress: Optional callable(done, total), total is None for iterators
+        :param collection: Collection to write to, looked up / created when omitted
+        :param user_collection: Optional user collection written with the same vectors
 
         return:
-            int : Number of chunk added
+            int : Number of chunks upserted
         """
-        # Create collection
-        collection = VectorDBService.create_collection(document_id)
+        batch_size = batch_size or VectorDBService.BATCH_SIZE
+        if collection is None:
+            collection = VectorDBService.get_or_create_collection(document_id)
 
-        # Prepare data
-        ids = []
-        embeddings = []
-        documents = []
-        metadatas = []
+        if isinstance(chunks, QuerySet):
+            total = chunks.count()
+            chunks = chunks.iterator(chunk_size=batch_size)
+        else:
+            total = len(chunks) if hasattr(chunks, '__len__') else None
+
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
 
+        done = 0
+        batch = []
         for chunk in chunks:
-            ids.append(f"chunk : {chunk.id}")
-            embeddings.append(chunk.embedding)
-            documents.append(chunk.content)
-            metadatas.append(
-                {
-                "chunk_id": chunk.id,
-                "chunk_index": chunk.chunk_index,
-                "page_number": chunk.page_number or 0,
-                "token_count": chunk.token_count
-                }
-            )
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                done += VectorDBService._upsert_batch(document_id, collection, user_collection, batch, embeddings, done)
+                batch = []
+                if on_progress:
+                    on_progress(done, total)
+
+        if batch:
+            done += VectorDBService._upsert_batch(document_id, collection, user_collection, batch, embeddings, done)
+            if on_progress:
+                on_progress(done, total)
+
+        return done
+
+
+    @staticmethod
+    def _upsert_batch(document_id, collection, user_collection, chunks, embeddings, offset):
+        """
+        Send one batch to chroma
+        
+        :param document_id: Document ID
+        :param collection: chromadb.Collection
+        :param user_collection: chromadb.Collection of the user or None
+        :param chunks: List of DocumentChunk objects
+        :param embeddings: Optional numpy array for all chunks (sliced from offset)
+        :param offset: Position of the first chunk of the batch
 
-            # Add to collection in batch
-            collection.add(
+        return:
+            int : Number of chunks sent
+        """
+        if embeddings is not None:
+            batch_embeddings = embeddings[offset:offset + len(chunks)]
+        else:
+            batch_embeddings = np.stack([np.asarray(chunk.embedding, dtype=np.float32) for chunk in chunks])
+
+        ids = [f"chunk : {chunk.id}" for chunk in chunks]
+        documents = [chunk.content for chunk in chunks]
+        metadatas = [
+            {
+            "chunk_id": chunk.id,
+            "chunk_index": chunk.chunk_index,
+            "page_number": chunk.page_number or 0,
+            "page_start": chunk.page_start or 0,
+            "page_end": chunk.page_end or 0,
+            "token_count": chunk.token_count
+            }
+            for chunk in chunks
+        ]
+        collection.upsert(ids=ids, embeddings=batch_embeddings, documents=documents, metadatas=metadatas)
+
+        # Same vectors in the user collection, tagged so searches can filter by document
+        if user_collection is not None:
+            user_collection.upsert(
                 ids=ids,
-                embeddings=embeddings,
+                embeddings=batch_embeddings,
                 documents=documents,
-                metadatas=metadatas
+                metadatas=[dict(metadata, document_id=document_id) for metadata in metadatas],
             )
-
-        print(f"Added {len(ids)} chunks to ChromaDB collection")
-        return len(ids)
+        return len(chunks)
 
 
     @staticmethod
@@ -134,38 +354,177 @@ class VectorDBService:
         :param top_k: Number of results to return
 
         Return: 
-            dict : search results with chunks and store
+            list : search results with chunks and scores (the numpy backend only
+                   returns chunk_id, document_id and similarity_score)
         """
-        client = VectorDBService.get_client()
-        collection_name = VectorDBService.get_collection_name(document_id)
+        # Exact in process search when the document has numpy files
+        if VectorDBService.BACKEND != 'chroma':
+            results = NumpyVectorStore.search(document_id, query_embedding, top_k)
+            if results is not None:
+                return results
+
+        # Search for similar vector
+        try:
+            results = VectorDBService._with_collection(
+                VectorDBService.get_collection_name(document_id),
+                lambda collection: collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=top_k,
+                    include=["documents", "metadatas", "distances"],
+                ),
+            )
+        except NotFoundError:
+            raise ValueError(f"Collection not found : {document_id}")
+
+        return VectorDBService._format_results(results)
+
+    @staticmethod
+    def search_similar_chunks_batch(document_id, query_embeddings, top_k=5):
+        """
+        Search a document for several queries with a single vector query
+        
+        :param document_id: Document ID
+        :param query_embeddings: List of query embedding vectors
+        :param top_k: Number of results to return per query
+
+        Return:
+            list : one result list per query, in the order of query_embeddings
+        """
+        if VectorDBService.BACKEND != 'chroma':
+            results = NumpyVectorStore.search_many(document_id, query_embeddings, top_k)
+            if results is not None:
+                return results
 
         try:
-            collection = client.get_collection(name=collection_name)
-        except:
+            results = VectorDBService._with_collection(
+                VectorDBService.get_collection_name(document_id),
+                lambda collection: collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=top_k,
+                    include=["documents", "metadatas", "distances"],
+                ),
+            )
+        except NotFoundError:
             raise ValueError(f"Collection not found : {document_id}")
 
-        # Search for similar vector
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"],
+        return [VectorDBService._format_results(results, index) for index in range(len(query_embeddings))]
+
+    @staticmethod
+    def uses_numpy(chunk_count):
+        """Check documents of this size get an exact numpy index"""
+        if VectorDBService.BACKEND == 'numpy':
+            return True
+        return VectorDBService.BACKEND == 'auto' and chunk_count <= VectorDBService.NUMPY_MAX_CHUNKS
+
+    @staticmethod
+    def build_numpy_index(document_id, chunks):
+        """
+        Write the numpy files of a document from its stored chunk embeddings
+        
+        :param document_id: Document ID
+        :param chunks: Queryset of the DocumentChunk objects of the document
+
+        return:
+            int : Number of vectors written
+        """
+        chunk_ids = []
+        embeddings = []
+        for chunk_id, embedding in chunks.exclude(embedding=None).order_by('id').values_list('id', 'embedding').iterator(chunk_size=2000):
+            chunk_ids.append(chunk_id)
+            embeddings.append(embedding)
+
+        if not chunk_ids:
+            NumpyVectorStore.delete(document_id)
+            return 0
+
+        NumpyVectorStore.write(document_id, chunk_ids, np.vstack(embeddings))
+        return len(chunk_ids)
+
+    @classmethod
+    def _check_user_collection(cls, user_id, index_versions):
+        """
+        Reopen chroma when a user collection may have been written by another process.
+        A client keeps the HNSW index of a collection in memory once loaded and never
+        sees upserts of the ingest worker: queries miss the new vectors or fail with
+        "Error finding id". The worker marks a document completed (bumping its
+        index_version) after writing its vectors, so a completed document this process
+        has not seen yet means the loaded index is stale
+        Args:
+            user_id : User ID
+            index_versions : dict document id -> index_version of the documents searched
+        """
+        current = set(index_versions.items())
+        with cls._client_lock:
+            loaded = cls._user_collection_versions.get(user_id)
+            if loaded is not None and not current <= loaded:
+                print(f"User collection {user_id} changed on disk, reopening ChromaDB")
+                cls._drop_client()
+                loaded = None
+            if loaded is None:
+                # Loaded by the query that follows, so it holds at least these versions
+                cls._user_collection_versions[user_id] = current
+
+    @staticmethod
+    def search_user_chunks(user_id, index_versions, query_embedding, top_k=5):
+        """
+        Search the chunks of several documents of a user with a single query on the user collection
+        
+        :param user_id: User ID
+        :param index_versions: dict document id -> index_version of the documents to search (completed ones)
+        :param query_embedding: Query embedding vector
+        :param top_k: Number of results to return
+
+        Return:
+            list : search results with chunks, document ids and scores
+        """
+        if not index_versions:
+            return []
+
+        VectorDBService._check_user_collection(user_id, index_versions)
+
+        # Vectors of documents being reindexed or deleted are filtered out
+        results = VectorDBService._with_collection(
+            VectorDBService.get_user_collection_name(user_id),
+            lambda collection: collection.query(
+                query_embeddings=[query_embedding],
+                n_results=top_k,
+                where={'document_id': {'$in': list(index_versions)}},
+                include=["documents", "metadatas", "distances"],
+            ),
+            fetch=lambda: VectorDBService.get_or_create_user_collection(user_id),
         )
 
-        # Format results
+        return VectorDBService._format_results(results)
+
+    @staticmethod
+    def _format_results(results, index=0):
+        """
+        Turn the chroma answer of one query into result dicts
+        
+        :param results: Return value of collection.query
+        :param index: Position of the query in query_embeddings
+
+        Return:
+            list : search results
+        """
         formatted_result = []
-        for i in range(len(results['ids'][0])):
+        for i in range(len(results['ids'][index])):
+            metadata = results['metadatas'][index][i]
 
             # Convert to similarity score (0-1 range)
-            distance = results['distances'][0][i]
+            distance = results['distances'][index][i]
         
             # Lower distance = higher similarity
             similarity_score = 1 / (1 + distance)  # Always between 0 and 1
 
             formatted_result.append({
-                'chunk_id': results['metadatas'][0][i]['chunk_id'],
-                'chunk_index': results['metadatas'][0][i]['chunk_index'],
-                'page_number': results['metadatas'][0][i]['page_number'],
-                'content': results['documents'][0][i],
+                'chunk_id': metadata['chunk_id'],
+                'document_id': metadata.get('document_id'),
+                'chunk_index': metadata['chunk_index'],
+                'page_number': metadata['page_number'],
+                'page_start': metadata.get('page_start'),
+                'page_end': metadata.get('page_end'),
+                'content': results['documents'][index][i],
                 'similarity_score': similarity_score # Convert distance to similarity
             })
 
@@ -180,12 +539,14 @@ class VectorDBService:
         """
         client = VectorDBService.get_client()
         collection_name = VectorDBService.get_collection_name(document_id)
+        VectorDBService.forget_collection(collection_name)
 
         try:
             client.delete_collection(name=collection_name)
             print(f"Deleted collection : {collection_name}")
         except:
             print(f"Collection did not found or already deleted : {collection_name}")
+        NumpyVectorStore.delete(document_id)
 
     @staticmethod
     def get_collection_stats(document_id):
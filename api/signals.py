@@ -0,0 +1,27 @@
+from django.db import connections
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Document, VectorCleanupTask
+
+
+@receiver(post_delete, sender=Document)
+def queue_vector_cleanup(sender, instance, **kwargs):
+    """
+    Queue the removal of a deleted document's vectors (collection, user collection
+    entries, numpy files). Runs for document deletes and for the cascade of an
+    account delete, the ingest worker does the work so the request doesn't wait on Chroma
+    """
+    VectorCleanupTask.objects.create(document_id=instance.id, user_id=instance.user_id)
+
+
+def restore_keyword_index(sender, using, **kwargs):
+    """
+    Connected to post_migrate in ApiConfig.ready: a migration altering DocumentChunk
+    rebuilds its SQLite table and drops the triggers syncing the FTS5 keyword index
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    from .services.keyword_search_service import KeywordSearchService
+    KeywordSearchService.ensure_triggers(connection)
@@ -1,3 +1,1404 @@
-from django.test import TestCase
+import hashlib
+import http.client
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import Future
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+import tiktoken
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Document, DocumentChunk, ExtractedText, IngestionJob, UploadBatch, UploadSession, VectorCleanupTask
+from .management.commands.reindex_documents import Command as ReindexCommand
+from .services.bulk_upload_service import BulkUploadService
+from .services.chunking_service import ChunkingService
+from .services.dedup_service import DeduplicationService
+from .services.embedding_cache import EmbeddingCache
+from .services.embedding_server import EmbeddingHTTPServer, EmbeddingRequestHandler
+from .services.embedding_service import EmbeddingService
+from .services.ingestion_service import IngestionService
+from .services.search_cache import SearchResultCache
+from .services.vector_cleanup_service import VectorCleanupService
+from .services.search_service import SearchService
+from .services.upload_service import ChunkedUploadService
+from .services.keyword_search_service import KeywordSearchService
+from .services.numpy_vector_store import NumpyVectorStore
+from .services.page_cache import PageTextCache
+from .services.pdf_service import PDFservice
+from .services.query_embedding_cache import QueryEmbeddingCache
+from .services.vector_db_service import VectorDBService
 
-# Create your tests here.
+
+def make_test_encoding():
+    """
+    Byte level BPE with the cl100k split pattern: every byte is a token apart from a
+    few merges, so tests don't need to download cl100k_base
+    """
+    ranks = {bytes([i]): i for i in range(256)}
+    for merge in [b"\n\n", b"--", b"----"]:
+        ranks[merge] = len(ranks)
+    return tiktoken.Encoding(
+        name='test_bytes',
+        pat_str=r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+""",
+        mergeable_ranks=ranks,
+        special_tokens={},
+    )
+
+
+class TokenChunkingTests(SimpleTestCase):
+
+    WORD = re.compile(r"p(\d+)w\d+")
+
+    def setUp(self):
+        self.encoding = make_test_encoding()
+        self.document = Document(id=1)
+
+    def make_pages(self, count):
+        # Words tagged with their page, paragraphs and sentences give the cutter boundaries
+        pages = []
+        for number in range(1, count + 1):
+            sentences = [
+                " ".join(f"p{number}w{i * 7 + j}" for j in range(7)) + "."
+                for i in range(3 + number % 5)
+            ]
+            text = " ".join(sentences[:2]) + "\n\n" + " ".join(sentences[2:])
+            pages.append({'page_number': number, 'text': text})
+        return pages
+
+    def chunk(self, pages, size=60, overlap=10):
+        with mock.patch.object(ChunkingService, 'CHUNK_TOKENS', size), \
+                mock.patch.object(ChunkingService, 'CHUNK_OVERLAP_TOKENS', overlap):
+            return list(ChunkingService.iter_token_chunks(self.document, pages, self.encoding))
+
+    def test_page_span_matches_the_pages_of_the_chunk_text(self):
+        chunks = self.chunk(self.make_pages(40))
+        self.assertGreater(len(chunks), 20)
+
+        for chunk in chunks:
+            pages = {int(page) for page in self.WORD.findall(chunk.content)}
+            if not pages:
+                # Only a page marker
+                continue
+            self.assertEqual(chunk.page_start, min(pages), chunk.content)
+            self.assertEqual(chunk.page_end, max(pages), chunk.content)
+            self.assertEqual(chunk.page_number, chunk.page_start)
+
+    def test_token_count_excludes_trimmed_whitespace(self):
+        for chunk in self.chunk(self.make_pages(15)):
+            self.assertEqual(chunk.content, chunk.content.strip())
+            self.assertEqual(chunk.token_count, len(self.encoding.encode_ordinary(chunk.content)), chunk.content)
+
+    def test_chunks_respect_size_and_cover_every_word(self):
+        pages = self.make_pages(12)
+        chunks = self.chunk(pages, size=50, overlap=10)
+
+        self.assertEqual([chunk.chunk_index for chunk in chunks], list(range(len(chunks))))
+        for chunk in chunks:
+            self.assertLessEqual(chunk.token_count, 50)
+
+        words = re.compile(r"p\d+w\d+")
+        chunked_words = set(words.findall(" ".join(chunk.content for chunk in chunks)))
+        expected_words = set(words.findall(" ".join(page['text'] for page in pages)))
+        self.assertEqual(chunked_words, expected_words)
+
+    def test_short_document_is_one_chunk(self):
+        chunks = self.chunk([{'page_number': 1, 'text': "Short page."}], size=250)
+
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].content, "---- page 1 ----\n\nShort page.")
+        self.assertEqual((chunks[0].page_start, chunks[0].page_end), (1, 1))
+
+    def test_page_span_ignores_next_page_marker(self):
+        # A chunk ending right after the marker of page 2 only holds text of page 1
+        span = ChunkingService._page_span(0, 30, page_starts=[0, 20], page_numbers=[1, 2], text_starts=[5, 32])
+        self.assertEqual(span, (1, 1))
+
+        span = ChunkingService._page_span(0, 33, page_starts=[0, 20], page_numbers=[1, 2], text_starts=[5, 32])
+        self.assertEqual(span, (1, 2))
+
+
+def make_document(user, **fields):
+    defaults = {'title': 'doc', 'file': 'documents/doc.pdf', 'file_size': 1, 'status': 'completed'}
+    defaults.update(fields)
+    return Document.objects.create(user=user, **defaults)
+
+
+class KeywordIndexTriggerTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.document = make_document(self.user)
+
+    def test_missing_triggers_are_recreated_and_index_rebuilt(self):
+        # What a table rebuild by a later migration does
+        with connection.cursor() as cursor:
+            for name in KeywordSearchService.TRIGGERS:
+                cursor.execute(f"DROP TRIGGER {name}")
+        chunk = DocumentChunk.objects.create(document=self.document, content="termination fee of SKU-4411", chunk_index=0)
+        self.assertEqual(KeywordSearchService.search(self.document.id, "SKU-4411"), [])
+
+        recreated = KeywordSearchService.ensure_triggers(connection)
+
+        self.assertEqual(sorted(recreated), sorted(KeywordSearchService.TRIGGERS))
+        self.assertEqual([r['chunk_id'] for r in KeywordSearchService.search(self.document.id, "SKU-4411")], [chunk.id])
+        self.assertEqual(KeywordSearchService.ensure_triggers(connection), [])
+
+        # Triggers keep the index in sync again
+        DocumentChunk.objects.filter(id=chunk.id).update(content="renewal clause")
+        self.assertEqual(KeywordSearchService.search(self.document.id, "SKU-4411"), [])
+
+
+class KeywordSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.document = make_document(self.user)
+        self.other = make_document(self.user)
+        for index, content in enumerate(["payment terms", "governing law", "termination fee of SKU-4411"]):
+            DocumentChunk.objects.create(document=self.document, content=content, chunk_index=index)
+        DocumentChunk.objects.create(document=self.other, content="termination fee of SKU-4411", chunk_index=0)
+
+    def test_ranks_only_chunks_of_the_document_containing_the_terms(self):
+        results = KeywordSearchService.search(self.document.id, "What is the SKU-4411 fee?")
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(DocumentChunk.objects.get(id=results[0]['chunk_id']).document_id, self.document.id)
+        self.assertGreater(results[0]['bm25_score'], 0)
+
+    def test_document_id_in_the_query_does_not_match_every_chunk(self):
+        self.assertEqual(KeywordSearchService.search(self.document.id, f"zzzqqq {self.document.id}", 10), [])
+
+        results = KeywordSearchService.search(self.document.id, f"governing {self.document.id}", 10)
+        self.assertEqual([DocumentChunk.objects.get(id=r['chunk_id']).content for r in results], ["governing law"])
+
+
+class SearchValidationTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.document = make_document(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_search_rejects_invalid_top_k_and_mode(self):
+        url = f'/api/documents/{self.document.id}/search/'
+        for body in [
+            {'query': 'fee', 'top_k': 'many'},
+            {'query': 'fee', 'top_k': 0},
+            {'query': 'fee', 'mode': 'fuzzy'},
+            {'query': ['fee']},
+        ]:
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_batch_search_rejects_unknown_mode(self):
+        response = self.client.post(
+            f'/api/documents/{self.document.id}/batch_search/', {'queries': ['fee'], 'mode': 'fuzzy'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FakeBatcher:
+
+    def submit(self, texts):
+        future = Future()
+        future.set_result(np.ones((len(texts), 3), dtype=np.float32))
+        return future
+
+
+class EmbeddingServerTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(EmbeddingRequestHandler, 'batcher', FakeBatcher())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.server = EmbeddingHTTPServer(('127.0.0.1', 0), EmbeddingRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=5)
+        self.addCleanup(self.connection.close)
+
+    def post(self, path, body):
+        self.connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+        response = self.connection.getresponse()
+        return response, response.read()
+
+    def test_embed_returns_float32_rows(self):
+        response, body = self.post('/embed', b'{"texts": ["a", "b"]}')
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('X-Embedding-Count'), '2')
+        self.assertEqual(np.frombuffer(body, dtype='<f4').reshape(2, 3).tolist(), [[1.0] * 3] * 2)
+
+    def test_unknown_path_does_not_break_the_next_request(self):
+        # The unread body must not be parsed as the next request of the connection
+        response, _ = self.post('/unknown', b'{"texts": ["GET / HTTP/1.1"]}')
+        self.assertEqual(response.status, 404)
+        self.assertEqual(response.getheader('Connection'), 'close')
+
+        response, _ = self.post('/embed', b'{"texts": ["a"]}')
+        self.assertEqual(response.status, 200)
+
+    def test_invalid_body_is_rejected_and_connection_reused(self):
+        response, _ = self.post('/embed', b'{"texts": "a"}')
+        self.assertEqual(response.status, 400)
+        self.assertIsNone(response.getheader('Connection'))
+
+        response, _ = self.post('/embed', b'{"texts": ["a"]}')
+        self.assertEqual(response.status, 200)
+
+
+class IngestionQueueTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+
+    def enqueue(self, **fields):
+        document = make_document(self.user, status='pending', **fields)
+        return IngestionService.enqueue(document)
+
+    def test_claim_takes_the_oldest_job_once(self):
+        first = self.enqueue()
+        second = self.enqueue()
+
+        claimed = IngestionService.claim_next_job('worker-a', visibility_timeout=60)
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), ('processing', 'worker-a', 1))
+        self.assertGreater(claimed.locked_until, timezone.now())
+
+        self.assertEqual(IngestionService.claim_next_job('worker-b', visibility_timeout=60).id, second.id)
+        self.assertIsNone(IngestionService.claim_next_job('worker-c', visibility_timeout=60))
+
+    @override_settings(INGEST_BATCH_CONCURRENCY=1)
+    def test_claim_caps_running_jobs_of_one_batch(self):
+        batch = UploadBatch.objects.create(user=self.user)
+        self.enqueue(batch=batch)
+        self.enqueue(batch=batch)
+        single = self.enqueue()
+
+        IngestionService.claim_next_job('worker-a')
+        # Second job of the batch is skipped, the single upload goes first
+        self.assertEqual(IngestionService.claim_next_job('worker-b').id, single.id)
+        self.assertIsNone(IngestionService.claim_next_job('worker-c'))
+
+    def test_failure_requeues_until_attempts_run_out(self):
+        job = self.enqueue()
+        job.max_attempts = 2
+        job.save()
+
+        claimed = IngestionService.claim_next_job('worker-a')
+        self.assertTrue(IngestionService._handle_failure(claimed, 'boom'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.last_error), ('queued', None, 'boom'))
+        self.assertEqual(job.document.status, 'pending')
+
+        claimed = IngestionService.claim_next_job('worker-a')
+        self.assertEqual(claimed.attempts, 2)
+        self.assertTrue(IngestionService._handle_failure(claimed, 'boom again'))
+        job.refresh_from_db()
+        job.document.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual((job.document.status, job.document.error_message), ('failed', 'boom again'))
+
+    def test_failure_of_a_lost_claim_is_ignored(self):
+        self.enqueue()
+        stale = IngestionService.claim_next_job('worker-a')
+        # Another worker took the job over meanwhile
+        IngestionJob.objects.filter(id=stale.id).update(locked_by='worker-b')
+
+        self.assertFalse(IngestionService._handle_failure(stale, 'late failure'))
+        job = IngestionJob.objects.get(id=stale.id)
+        self.assertEqual((job.status, job.locked_by), ('processing', 'worker-b'))
+
+    def test_recover_requeues_only_expired_claims(self):
+        expired = self.enqueue()
+        alive = self.enqueue()
+        IngestionService.claim_next_job('crashed', visibility_timeout=60)
+        IngestionService.claim_next_job('running', visibility_timeout=60)
+        IngestionJob.objects.filter(id=expired.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(IngestionService.recover_stale_jobs(), 1)
+
+        expired.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((expired.status, expired.locked_by), ('queued', None))
+        self.assertIn('crashed', expired.last_error)
+        self.assertEqual((alive.status, alive.locked_by), ('processing', 'running'))
+
+    def test_extend_lease_only_touches_own_claims(self):
+        self.enqueue()
+        job = IngestionService.claim_next_job('worker-a', visibility_timeout=1)
+
+        self.assertEqual(IngestionService.extend_lease([job.id], 'worker-b', 600), 0)
+        self.assertEqual(IngestionService.extend_lease([job.id], 'worker-a', 600), 1)
+        job.refresh_from_db()
+        self.assertGreater(job.locked_until, timezone.now() + timedelta(seconds=500))
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        patcher = mock.patch.object(ChunkedUploadService, 'PART_SIZE', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.data = b'%PDF-0123456789'  # 15 bytes, parts of 4 + 4 + 4 + 3
+
+    def start(self, **kwargs):
+        return ChunkedUploadService.create_session(self.user, 'report.pdf', len(self.data), **kwargs)
+
+    def send_all(self, session, order=None):
+        for number in order or range(1, session.part_count + 1):
+            offset, length = session.part_range(number)
+            ChunkedUploadService.write_part(session, number, io.BytesIO(self.data[offset:offset + length]))
+
+    def test_parts_in_any_order_complete_into_a_document(self):
+        session = self.start(expected_hash=hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(session.part_count, 4)
+        self.send_all(session, order=[3, 1, 4, 2])
+        # Sending a part again replaces it
+        ChunkedUploadService.write_part(session, 2, io.BytesIO(self.data[4:8]))
+
+        document = ChunkedUploadService.complete(session)
+
+        self.assertEqual((document.title, document.status, document.file_size), ('report', 'pending', len(self.data)))
+        self.assertEqual(document.content_hash, hashlib.sha256(self.data).hexdigest())
+        with open(document.file.path, 'rb') as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertFalse(os.path.exists(ChunkedUploadService.staging_path(session)))
+        self.assertEqual(session.parts.count(), 0)
+        with self.assertRaisesMessage(ValueError, 'Upload is completed'):
+            ChunkedUploadService.complete(session)
+
+    def test_invalid_parts_are_rejected(self):
+        session = self.start()
+
+        for number, body, message in [
+            (0, b'%PDF', 'Part number must be between 1 and 4'),
+            (5, b'%PDF', 'Part number must be between 1 and 4'),
+            (1, b'%PD', 'must be exactly 4 bytes'),
+            (1, b'%PDF-', 'must be exactly 4 bytes'),
+            (4, b'7890', 'must be exactly 3 bytes'),
+        ]:
+            with self.assertRaisesMessage(ValueError, message):
+                ChunkedUploadService.write_part(session, number, io.BytesIO(body))
+
+        with self.assertRaisesMessage(ValueError, 'checksum mismatch'):
+            ChunkedUploadService.write_part(session, 1, io.BytesIO(b'%PDF'), expected_hash='0' * 64)
+        self.assertEqual(session.parts.count(), 0)
+
+    def test_complete_needs_every_part(self):
+        session = self.start()
+        self.send_all(session, order=[1, 2, 4])
+
+        with self.assertRaisesMessage(ValueError, 'Missing parts : [3]'):
+            ChunkedUploadService.complete(session)
+
+    def test_file_checksum_mismatch_keeps_the_upload_resumable(self):
+        session = self.start(expected_hash='f' * 64)
+        self.send_all(session)
+
+        with self.assertRaisesMessage(ValueError, 'File checksum mismatch'):
+            ChunkedUploadService.complete(session)
+
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'active')
+        self.assertTrue(os.path.exists(ChunkedUploadService.staging_path(session)))
+        self.assertEqual(Document.objects.count(), 0)
+
+    def test_expired_uploads_are_rejected_and_purged(self):
+        session = self.start()
+        active = self.start()
+        UploadSession.objects.filter(id=session.id).update(expires_at=timezone.now() - timedelta(minutes=1))
+        session.refresh_from_db()
+
+        with self.assertRaisesMessage(ValueError, 'Upload has expired'):
+            ChunkedUploadService.write_part(session, 1, io.BytesIO(b'%PDF'))
+
+        self.assertEqual(ChunkedUploadService.purge_expired(), 1)
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'aborted')
+        self.assertFalse(os.path.exists(ChunkedUploadService.staging_path(session)))
+        self.assertTrue(os.path.exists(ChunkedUploadService.staging_path(active)))
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+
+    def test_chunks_found_by_both_retrievers_rank_first(self):
+        vector = [{'chunk_id': 1, 'similarity_score': 0.9}, {'chunk_id': 2, 'similarity_score': 0.8}]
+        keyword = [{'chunk_id': 3, 'bm25_score': 7.0}, {'chunk_id': 2, 'bm25_score': 5.0}]
+
+        fused = SearchService.reciprocal_rank_fusion(vector, keyword, top_k=5)
+
+        self.assertEqual([result['chunk_id'] for result in fused], [2, 1, 3])
+        k = SearchService.RRF_K
+        self.assertAlmostEqual(fused[0]['rrf_score'], 1 / (k + 2) + 1 / (k + 2))
+        self.assertAlmostEqual(fused[1]['rrf_score'], 1 / (k + 1))
+        # Keyword only results have no vector similarity
+        self.assertEqual(fused[0]['similarity_score'], 0.8)
+        self.assertIsNone(fused[2]['similarity_score'])
+
+    def test_top_k_and_empty_lists(self):
+        vector = [{'chunk_id': i, 'similarity_score': 1 / (i + 1)} for i in range(10)]
+
+        self.assertEqual([r['chunk_id'] for r in SearchService.reciprocal_rank_fusion(vector, [], top_k=3)], [0, 1, 2])
+        self.assertEqual(SearchService.reciprocal_rank_fusion([], [], top_k=3), [])
+
+
+def drop_chroma_client():
+    with VectorDBService._client_lock:
+        VectorDBService._drop_client()
+
+
+def use_temp_chroma(test):
+    """Point VectorDBService at an empty chroma directory for the duration of a test"""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    drop_chroma_client()
+    patcher = mock.patch.object(VectorDBService, 'CHROMA_DB_PATH', path)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    test.addCleanup(drop_chroma_client)
+    return path
+
+
+def make_vector_chunks(first_id, embeddings):
+    return [
+        SimpleNamespace(
+            id=first_id + i, content=f"chunk {first_id + i}", chunk_index=i, page_number=1, page_start=1, page_end=1,
+            token_count=2, embedding=embedding,
+        )
+        for i, embedding in enumerate(embeddings)
+    ]
+
+
+def unit_vectors(count, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+# Ingest worker stand in: writes the vectors of a document into a user collection from another process
+USER_COLLECTION_WRITER = """
+import sys
+from types import SimpleNamespace
+import django
+import numpy as np
+django.setup()
+from api.services.vector_db_service import VectorDBService
+
+path, user_id, document_id, first_id, seed = sys.argv[1], *map(int, sys.argv[2:])
+VectorDBService.CHROMA_DB_PATH = path
+embeddings = np.random.default_rng(seed).standard_normal((5, 8)).astype(np.float32)
+embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+chunks = [
+    SimpleNamespace(id=first_id + i, content='', chunk_index=i, page_number=1, page_start=1, page_end=1, token_count=0)
+    for i in range(5)
+]
+VectorDBService.upsert_chunks(
+    document_id, chunks, embeddings=embeddings,
+    user_collection=VectorDBService.get_or_create_user_collection(user_id),
+)
+"""
+
+
+class UserCollectionSearchTests(SimpleTestCase):
+
+    def setUp(self):
+        self.path = use_temp_chroma(self)
+
+    def write(self, document_id, chunks):
+        VectorDBService.upsert_chunks(
+            document_id, chunks, user_collection=VectorDBService.get_or_create_user_collection(7),
+        )
+
+    def write_from_other_process(self, document_id, first_id, seed):
+        subprocess.run(
+            [sys.executable, '-c', USER_COLLECTION_WRITER, self.path, '7', str(document_id), str(first_id), str(seed)],
+            cwd=settings.BASE_DIR, env=dict(os.environ, DJANGO_SETTINGS_MODULE='documind.settings'),
+            check=True, capture_output=True,
+        )
+
+    def test_one_query_ranks_chunks_of_every_document(self):
+        first = unit_vectors(5, seed=1)
+        second = unit_vectors(5, seed=2)
+        self.write(1, make_vector_chunks(100, first))
+        self.write(2, make_vector_chunks(200, second))
+
+        results = VectorDBService.search_user_chunks(7, {1: 1, 2: 1}, second[3].tolist(), top_k=10)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual((results[0]['chunk_id'], results[0]['document_id']), (203, 2))
+        self.assertEqual({r['document_id'] for r in results}, {1, 2})
+        scores = [r['similarity_score'] for r in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        # Only the documents asked for are searched
+        results = VectorDBService.search_user_chunks(7, {1: 1}, second[3].tolist(), top_k=10)
+        self.assertEqual({r['document_id'] for r in results}, {1})
+        self.assertEqual(len(results), 5)
+
+    def test_sees_vectors_written_by_another_process(self):
+        self.write(1, make_vector_chunks(100, unit_vectors(5, seed=1)))
+        self.assertEqual(len(VectorDBService.search_user_chunks(7, {1: 1}, unit_vectors(1)[0].tolist(), top_k=10)), 5)
+        client = VectorDBService.get_client()
+
+        # Unchanged versions keep the loaded collection
+        VectorDBService.search_user_chunks(7, {1: 1}, unit_vectors(1)[0].tolist(), top_k=10)
+        self.assertIs(VectorDBService.get_client(), client)
+
+        # The worker indexes document 2, then marks it completed with version 1
+        self.write_from_other_process(2, 200, seed=2)
+        query = unit_vectors(5, seed=2)[0].tolist()
+        results = VectorDBService.search_user_chunks(7, {1: 1, 2: 1}, query, top_k=10)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results[0]['chunk_id'], 200)
+        results = VectorDBService.search_user_chunks(7, {2: 1}, query, top_k=10)
+        self.assertEqual(sorted(r['chunk_id'] for r in results), list(range(200, 205)))
+
+        # Reindexed from the other process: same chunk ids, new vectors and version
+        self.write_from_other_process(2, 200, seed=3)
+        query = unit_vectors(5, seed=3)[4].tolist()
+        self.assertEqual(VectorDBService.search_user_chunks(7, {2: 2}, query, top_k=1)[0]['chunk_id'], 204)
+
+
+class FakeExecutor:
+    """Runs submitted ranges in process and records the order of submissions"""
+
+    def __init__(self, max_workers, mp_context=None):
+        self.max_workers = max_workers
+        self.submitted = []
+
+    def __enter__(self):
+        FakeExecutor.last = self
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, function, file_path, start, end):
+        self.submitted.append((start, end))
+        future = Future()
+        future.set_result([{'page_number': number + 1, 'text': f"page {number + 1}"} for number in range(start, end)])
+        return future
+
+
+class StreamingExtractionTests(SimpleTestCase):
+
+    def test_fixed_ranges_with_one_range_per_worker_in_flight(self):
+        with mock.patch('api.services.pdf_service.ProcessPoolExecutor', FakeExecutor), \
+                mock.patch.object(PDFservice, 'MAX_WORKERS', 3), \
+                mock.patch.object(PDFservice, 'RANGE_PAGES', 8), \
+                mock.patch.object(PDFservice, 'get_page_count') as get_page_count:
+            pages = PDFservice._iter_with_pdfplumber('doc.pdf', page_count=1000)
+            page_numbers = []
+            for page in pages:
+                page_numbers.append(page['page_number'])
+                # Ranges submitted beyond the one being read
+                ahead = len(FakeExecutor.last.submitted) - (page['page_number'] - 1) // 8 - 1
+                self.assertLessEqual(ahead, 2)
+
+        get_page_count.assert_not_called()
+        self.assertEqual(page_numbers, list(range(1, 1001)))
+        self.assertEqual(len(FakeExecutor.last.submitted), 125)
+        self.assertEqual(FakeExecutor.last.submitted[-1], (992, 1000))
+        self.assertEqual(FakeExecutor.last.max_workers, 3)
+
+
+def use_temp_media(test):
+    """Store uploaded files in an empty MEDIA_ROOT for the duration of a test"""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    media = override_settings(MEDIA_ROOT=path)
+    media.enable()
+    test.addCleanup(media.disable)
+    return path
+
+
+class DeduplicationTests(TestCase):
+
+    def setUp(self):
+        use_temp_media(self)
+        use_temp_chroma(self)
+        User = get_user_model()
+        self.user = User.objects.create_user(username='u', email='u@example.com', password='p')
+        self.other_user = User.objects.create_user(username='o', email='o@example.com', password='p')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = b'%PDF-1.4 ' + bytes(range(256)) * 64
+
+    def upload(self):
+        with mock.patch.object(DeduplicationService, 'hash_file', side_effect=AssertionError("file read again")):
+            file = io.BytesIO(self.data)
+            file.name = 'report.pdf'
+            response = self.client.post('/api/documents/upload/', {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, 202, response.data)
+        return Document.objects.get(id=response.data['id'])
+
+    def test_upload_is_hashed_while_it_streams_in(self):
+        for memory_size in (len(self.data) * 2, 100):
+            # Kept in memory, then spooled to a temporary file
+            with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=memory_size):
+                document = self.upload()
+            self.assertEqual(document.content_hash, hashlib.sha256(self.data).hexdigest())
+            with document.file.open('rb') as file:
+                self.assertEqual(file.read(), self.data)
+
+    def test_duplicates_are_only_reused_from_the_same_user(self):
+        content_hash = hashlib.sha256(self.data).hexdigest()
+        source = make_document(self.user, content_hash=content_hash, page_count=2)
+        vectors = unit_vectors(3)
+        for index, vector in enumerate(vectors):
+            DocumentChunk.objects.create(
+                document=source, content=f"chunk {index}", chunk_index=index, page_number=1, page_start=1,
+                page_end=2, token_count=2, embedding=vector,
+            )
+
+        foreign = make_document(self.other_user, status='pending', content_hash=content_hash)
+        self.assertIsNone(DeduplicationService.reuse_processed(foreign))
+        self.assertEqual(foreign.chunks.count(), 0)
+
+        document = make_document(self.user, status='pending', content_hash=content_hash)
+        self.assertEqual(
+            DeduplicationService.reuse_processed(document),
+            {'page_count': 2, 'chunk_count': 3, 'embedded_chunks': 0},
+        )
+        document.refresh_from_db()
+        self.assertEqual((document.status, document.page_count), ('completed', 2))
+        self.assertEqual(list(document.chunks.order_by('chunk_index').values_list('content', flat=True)),
+                         ["chunk 0", "chunk 1", "chunk 2"])
+        results = VectorDBService.search_similar_chunks(document.id, vectors[1].tolist(), top_k=1)
+        self.assertEqual(results[0]['chunk_id'], document.chunks.get(chunk_index=1).id)
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        for name, value in [
+            ('CACHE_PATH', os.path.join(path, 'cache.sqlite3')),
+            ('_local', threading.local()),
+            ('_touched', {}),
+            ('_inserted_since_check', 0),
+        ]:
+            patcher = mock.patch.object(EmbeddingCache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: EmbeddingCache.get_connection().close())
+
+        self.statements = []
+        EmbeddingCache.get_connection().set_trace_callback(self.statements.append)
+
+    def writes(self):
+        return [sql for sql in self.statements if sql.startswith(('UPDATE', 'INSERT', 'DELETE'))]
+
+    def test_hits_are_served_without_writing(self):
+        texts = [f"text {i}" for i in range(3)]
+        EmbeddingCache.set_many('model', texts, unit_vectors(3))
+        self.statements.clear()
+
+        with mock.patch.object(EmbeddingCache, 'TOUCH_BATCH', 10):
+            for _ in range(3):
+                hits = EmbeddingCache.get_many('model', ["text  0", "text 2", "unknown"])
+                self.assertEqual(sorted(hits), [0, 1])
+                np.testing.assert_array_equal(hits[1], unit_vectors(3)[2])
+            self.assertEqual(self.writes(), [])
+
+        # A full buffer is written in one batch, one UPDATE per key
+        with mock.patch.object(EmbeddingCache, 'TOUCH_BATCH', 3):
+            EmbeddingCache.get_many('model', ["text 1"])
+        self.assertEqual(len(self.writes()), 3)
+        self.assertTrue(all(sql.startswith('UPDATE') for sql in self.writes()))
+        self.assertEqual(EmbeddingCache._touched, {})
+
+    def test_size_is_checked_every_interval_and_recent_hits_survive_eviction(self):
+        with mock.patch.object(EmbeddingCache, 'MAX_ENTRIES', 4), \
+                mock.patch.object(EmbeddingCache, 'EVICT_CHECK_INTERVAL', 3):
+            for i in range(4):
+                EmbeddingCache.set_many('model', [f"text {i}"], unit_vectors(1, seed=i))
+            counts = [sql for sql in self.statements if 'COUNT' in sql]
+            self.assertEqual(len(counts), 1)
+
+            # The oldest entry was just used, the second oldest goes first
+            EmbeddingCache.get_many('model', ["text 0"])
+            EmbeddingCache.set_many('model', ["text 4", "text 5"], unit_vectors(2))
+
+        cached = EmbeddingCache.get_many('model', [f"text {i}" for i in range(6)])
+        self.assertEqual(sorted(cached), [0, 3, 4, 5])
+
+
+class ReindexThrottleTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.command = ReindexCommand(stdout=io.StringIO())
+        self.options = {'pause': 0, 'ignore_queue': False, 'max_queue_wait': 600}
+        patcher = mock.patch('api.management.commands.reindex_documents.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def claim(self, lease):
+        IngestionService.enqueue(make_document(self.user, status='pending'))
+        return IngestionService.claim_next_job('worker-a', visibility_timeout=lease)
+
+    def test_job_with_an_expired_lease_does_not_block(self):
+        job = self.claim(60)
+        IngestionJob.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.command._throttle(self.options)
+
+        self.sleep.assert_not_called()
+
+    def test_waits_for_running_jobs_at_most_max_queue_wait(self):
+        self.claim(60)
+        clock = iter(range(0, 10000, 30))
+        with mock.patch('api.management.commands.reindex_documents.time.monotonic', side_effect=lambda: next(clock)):
+            self.command._throttle(dict(self.options, max_queue_wait=100))
+
+        self.assertEqual(self.sleep.call_count, 3)
+        self.assertIn("still busy after 100s", self.command.stdout.getvalue())
+
+
+class VectorFieldTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.document = make_document(self.user)
+
+    def create_chunk(self, embedding):
+        chunk = DocumentChunk.objects.create(
+            document=self.document, content="text", chunk_index=DocumentChunk.objects.count(), embedding=embedding,
+        )
+        return DocumentChunk.objects.get(id=chunk.id)
+
+    def test_round_trip_as_float32(self):
+        vector = unit_vectors(1, dim=384)[0]
+
+        for value in (vector, vector.tolist()):
+            embedding = self.create_chunk(value).embedding
+            self.assertIsInstance(embedding, np.ndarray)
+            self.assertEqual((embedding.dtype, embedding.shape), (np.dtype('<f4'), (384,)))
+            np.testing.assert_array_equal(embedding, vector)
+
+        self.assertIsNone(self.create_chunk(None).embedding)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT length(embedding) FROM api_documentchunk WHERE embedding IS NOT NULL LIMIT 1")
+            self.assertEqual(cursor.fetchone()[0], 4 + 384 * 4)
+
+    @override_settings(EMBEDDING_STORAGE_DTYPE='float16')
+    def test_float16_storage(self):
+        vector = unit_vectors(1, dim=384)[0]
+
+        embedding = self.create_chunk(vector).embedding
+
+        self.assertEqual(embedding.dtype, np.dtype('<f2'))
+        np.testing.assert_allclose(embedding, vector, atol=1e-3)
+
+    def test_serialization_round_trip(self):
+        chunk = self.create_chunk(unit_vectors(1)[0])
+
+        data = serializers.serialize('json', [chunk])
+        restored = next(serializers.deserialize('json', data)).object
+
+        np.testing.assert_array_equal(restored.embedding, chunk.embedding)
+
+
+class VectorFieldMigrationTests(TransactionTestCase):
+
+    BEFORE = [('api', '0005_document_content_hash')]
+    AFTER = [('api', '0006_documentchunk_binary_embedding')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_json_embeddings_are_converted_both_ways(self):
+        apps = self.migrate(self.BEFORE)
+        user = apps.get_model(settings.AUTH_USER_MODEL).objects.create(username='u', email='u@example.com')
+        document = apps.get_model('api', 'Document').objects.create(
+            user=user, title='doc', file='documents/doc.pdf', file_size=1,
+        )
+        DocumentChunk_ = apps.get_model('api', 'DocumentChunk')
+        vector = [0.25, -0.5, 1.0]
+        DocumentChunk_.objects.create(document=document, content="a", chunk_index=0, embedding=vector)
+        DocumentChunk_.objects.create(document=document, content="b", chunk_index=1, embedding=None)
+
+        apps = self.migrate(self.AFTER)
+        chunks = apps.get_model('api', 'DocumentChunk').objects.order_by('chunk_index')
+        self.assertEqual(chunks[0].embedding.dtype, np.dtype('<f4'))
+        self.assertEqual(chunks[0].embedding.tolist(), vector)
+        self.assertIsNone(chunks[1].embedding)
+
+        apps = self.migrate(self.BEFORE)
+        chunks = apps.get_model('api', 'DocumentChunk').objects.order_by('chunk_index')
+        self.assertEqual([chunk.embedding for chunk in chunks], [vector, None])
+
+
+class UpsertChunksTests(SimpleTestCase):
+
+    def setUp(self):
+        use_temp_chroma(self)
+
+    def test_sends_fixed_size_batches(self):
+        chunks = make_vector_chunks(100, unit_vectors(10))
+        collection = VectorDBService.get_or_create_collection(1)
+        progress = []
+
+        with mock.patch.object(type(collection), 'upsert', autospec=True, side_effect=type(collection).upsert) as upsert:
+            done = VectorDBService.upsert_chunks(
+                1, chunks, batch_size=4, on_progress=lambda done, total: progress.append((done, total)),
+            )
+
+        self.assertEqual(done, 10)
+        self.assertEqual([len(call.kwargs['ids']) for call in upsert.call_args_list], [4, 4, 2])
+        self.assertEqual(progress, [(4, 10), (8, 10), (10, 10)])
+        self.assertEqual(collection.count(), 10)
+
+        # Iterators have no known total
+        progress.clear()
+        VectorDBService.upsert_chunks(1, iter(chunks), batch_size=6, on_progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(progress, [(6, None), (10, None)])
+
+    def test_resending_chunks_replaces_them(self):
+        chunks = make_vector_chunks(100, unit_vectors(6, seed=1))
+        VectorDBService.upsert_chunks(1, chunks, batch_size=4)
+
+        replaced = unit_vectors(6, seed=2)
+        VectorDBService.upsert_chunks(1, chunks, embeddings=replaced, batch_size=4)
+
+        collection = VectorDBService.get_or_create_collection(1)
+        self.assertEqual(collection.count(), 6)
+        stored = collection.get(ids=["chunk : 103"], include=['embeddings'])['embeddings'][0]
+        np.testing.assert_allclose(stored, replaced[3], atol=1e-6)
+
+    def test_user_collection_vectors_are_tagged_with_the_document(self):
+        user_collection = VectorDBService.get_or_create_user_collection(7)
+
+        VectorDBService.upsert_chunks(3, make_vector_chunks(100, unit_vectors(5)), batch_size=2, user_collection=user_collection)
+
+        metadatas = user_collection.get(include=['metadatas'])['metadatas']
+        self.assertEqual(len(metadatas), 5)
+        self.assertEqual({metadata['document_id'] for metadata in metadatas}, {3})
+        self.assertEqual(VectorDBService.get_or_create_collection(3).count(), 5)
+
+
+class BulkUploadTests(TestCase):
+
+    def setUp(self):
+        use_temp_media(self)
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_archive(self, members):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            for name, data in members.items():
+                zip_file.writestr(name, data)
+        archive.seek(0)
+        archive.name = 'documents.zip'
+        return archive
+
+    def post(self, **data):
+        return self.client.post('/api/documents/bulk_upload/', data, format='multipart')
+
+    def test_archive_members_and_files_are_queued_in_one_batch(self):
+        members = {
+            'reports/a.pdf': b'%PDF-1.4 a' * 100,
+            'b.pdf': b'%PDF-1.4 b' * 100,
+            '__MACOSX/reports/._a.pdf': b'resource fork',
+            'reports/.hidden.pdf': b'%PDF-1.4 hidden',
+            'notes.txt': b'not a pdf',
+        }
+        single = io.BytesIO(b'%PDF-1.4 c')
+        single.name = 'c.pdf'
+
+        response = self.post(files=[single], archive=self.make_archive(members))
+
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['file_count'], 3)
+        self.assertEqual([rejected['file'] for rejected in response.data['rejected']], ['notes.txt'])
+        batch = UploadBatch.objects.get(id=response.data['batch_id'])
+        contents = {'c': single.getvalue(), 'a': members['reports/a.pdf'], 'b': members['b.pdf']}
+        for document in batch.documents.all():
+            data = contents.pop(document.title)
+            self.assertEqual(document.content_hash, hashlib.sha256(data).hexdigest())
+            self.assertEqual(document.file_size, len(data))
+            with document.file.open('rb') as file:
+                self.assertEqual(file.read(), data)
+        self.assertEqual(contents, {})
+        self.assertEqual(IngestionJob.objects.filter(document__batch=batch).count(), 3)
+
+    def test_file_limit_is_checked_before_anything_is_stored(self):
+        archive = self.make_archive({f'{index}.pdf': b'%PDF-1.4' for index in range(3)})
+
+        with mock.patch.object(BulkUploadService, 'MAX_FILES', 2):
+            response = self.post(archive=archive)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 2 files', response.data['error'])
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(UploadBatch.objects.exists())
+
+    def test_rejects_invalid_archives(self):
+        archive = io.BytesIO(b'not a zip')
+        archive.name = 'documents.zip'
+        response = self.post(archive=archive)
+        self.assertEqual((response.status_code, response.data['error']), (400, "Archive is not a valid zip file"))
+
+        response = self.post(archive=self.make_archive({'notes.txt': b'not a pdf'}))
+        self.assertEqual((response.status_code, response.data['error']), (400, "No valid files provided"))
+        self.assertFalse(UploadBatch.objects.exists())
+
+
+class PageTextCacheTests(TestCase):
+
+    HASH = 'a' * 64
+
+    def setUp(self):
+        self.pages = [{'page_number': number, 'text': f"page {number} text é"} for number in (1, 2, 4, 5, 6)]
+        patcher = mock.patch.object(PageTextCache, 'BATCH_SIZE', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def extract(self, pages):
+        with mock.patch.object(PDFservice, '_iter_pages_uncached', return_value=iter(pages)) as uncached:
+            extracted = list(PDFservice.iter_pages('doc.pdf', content_hash=self.HASH, page_count=6))
+        return extracted, uncached
+
+    def test_second_extraction_is_served_from_the_cache(self):
+        extracted, uncached = self.extract(self.pages)
+        self.assertEqual(extracted, self.pages)
+        uncached.assert_called_once()
+
+        extracted, uncached = self.extract([])
+        self.assertEqual(extracted, self.pages)
+        uncached.assert_not_called()
+        with mock.patch('api.services.pdf_service.pdfplumber.open', side_effect=AssertionError("pdf opened")):
+            self.assertEqual(PDFservice.get_page_count('doc.pdf', content_hash=self.HASH), 6)
+
+        entry = PageTextCache.get(self.HASH, PDFservice.EXTRACTOR_VERSION)
+        self.assertEqual([page['page_number'] for page in PageTextCache.iter_pages(entry, start=2, end=5)], [2, 4, 5])
+        self.assertIsNone(PageTextCache.get(self.HASH, 'other-version'))
+
+    def test_interrupted_extraction_is_not_served(self):
+        pages = PageTextCache.write_through(self.HASH, PDFservice.EXTRACTOR_VERSION, 6, iter(self.pages))
+        for page in pages:
+            if page['page_number'] == 4:
+                break
+        pages.close()
+
+        self.assertIsNone(PageTextCache.get(self.HASH, PDFservice.EXTRACTOR_VERSION))
+
+        # The next extraction replaces the partial entry
+        extracted, uncached = self.extract(self.pages)
+        uncached.assert_called_once()
+        self.assertEqual(extracted, self.pages)
+        entry = ExtractedText.objects.get()
+        self.assertTrue(entry.complete)
+        self.assertEqual(entry.pages.count(), 5)
+
+
+class QueryEmbeddingCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        QueryEmbeddingCache.clear()
+        self.addCleanup(QueryEmbeddingCache.clear)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with mock.patch.object(QueryEmbeddingCache, 'MAX_ENTRIES', 2):
+            QueryEmbeddingCache.set('model', "first", [1.0])
+            QueryEmbeddingCache.set('model', "second", [2.0])
+            self.assertEqual(QueryEmbeddingCache.get('model', "first"), [1.0])
+            QueryEmbeddingCache.set('model', "third", [3.0])
+
+            self.assertIsNone(QueryEmbeddingCache.get('model', "second"))
+            self.assertEqual(QueryEmbeddingCache.get('model', "  first\n"), [1.0])
+            self.assertEqual(QueryEmbeddingCache.get('model', "third"), [3.0])
+            self.assertIsNone(QueryEmbeddingCache.get('other-model', "third"))
+
+        self.assertEqual(
+            QueryEmbeddingCache.stats(),
+            {'backend': 'memory', 'hits': 3, 'misses': 2, 'hit_rate': 0.6, 'size': 2},
+        )
+
+    def test_shared_django_cache(self):
+        with mock.patch.object(QueryEmbeddingCache, 'CACHE_ALIAS', 'default'):
+            QueryEmbeddingCache.set('model', "question", [1.0])
+            self.assertEqual(QueryEmbeddingCache.get('model', "question"), [1.0])
+            self.assertEqual(QueryEmbeddingCache.stats()['backend'], 'django:default')
+        self.assertIsNone(QueryEmbeddingCache.get('model', "question"))
+
+    def test_repeated_questions_skip_the_model(self):
+        with mock.patch.object(EmbeddingService, 'cache_namespace', return_value='model'), \
+                mock.patch.object(EmbeddingService, 'generate_embedding', return_value=[1.0]) as generate, \
+                mock.patch.object(EmbeddingService, 'generate_embeddings_batch', return_value=[[2.0], [3.0]]) as batch:
+            self.assertEqual(SearchService.get_query_embedding("question"), [1.0])
+            self.assertEqual(SearchService.get_query_embedding("question "), [1.0])
+            embeddings = SearchService.get_query_embeddings(["a", "question", "b", "a"])
+
+        generate.assert_called_once_with("question")
+        batch.assert_called_once_with(["a", "b"])
+        self.assertEqual(embeddings, [[2.0], [1.0], [3.0], [2.0]])
+
+
+def use_temp_numpy_store(test):
+    """Point NumpyVectorStore at an empty directory for the duration of a test"""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    patcher = mock.patch.object(NumpyVectorStore, 'STORE_PATH', path)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    NumpyVectorStore._open.clear()
+    test.addCleanup(NumpyVectorStore._open.clear)
+    return path
+
+
+class NumpyVectorStoreTests(TestCase):
+
+    def setUp(self):
+        use_temp_chroma(self)
+        use_temp_numpy_store(self)
+        self.vectors = unit_vectors(200, dim=32, seed=1)
+        self.queries = unit_vectors(5, dim=32, seed=2).tolist()
+        chunks = make_vector_chunks(1000, self.vectors)
+        VectorDBService.upsert_chunks(1, chunks)
+        NumpyVectorStore.write(1, [chunk.id for chunk in chunks], self.vectors)
+
+    def search(self, backend, query, top_k=10):
+        with mock.patch.object(VectorDBService, 'BACKEND', backend):
+            return VectorDBService.search_similar_chunks(1, query, top_k=top_k)
+
+    def assertSameRanking(self, numpy_results, chroma_results):
+        self.assertEqual([r['chunk_id'] for r in numpy_results], [r['chunk_id'] for r in chroma_results])
+        np.testing.assert_allclose(
+            [r['similarity_score'] for r in numpy_results], [r['similarity_score'] for r in chroma_results], atol=1e-4,
+        )
+
+    def test_ranks_like_chroma(self):
+        for query in self.queries:
+            self.assertSameRanking(self.search('numpy', query), self.search('chroma', query))
+
+        with mock.patch.object(VectorDBService, 'BACKEND', 'numpy'):
+            batches = VectorDBService.search_similar_chunks_batch(1, self.queries, top_k=10)
+        for query, results in zip(self.queries, batches):
+            self.assertSameRanking(results, self.search('numpy', query))
+
+        # Scaled vectors are normalized on write, more results than chunks are capped
+        NumpyVectorStore.write(1, list(range(1000, 1200)), self.vectors * 3)
+        self.assertSameRanking(self.search('numpy', self.queries[0], top_k=500), self.search('chroma', self.queries[0], top_k=500))
+
+    def test_rewritten_and_deleted_files_are_reloaded(self):
+        self.assertEqual(self.search('numpy', self.vectors[7].tolist(), top_k=1)[0]['chunk_id'], 1007)
+
+        NumpyVectorStore.write(1, [5000 + index for index in range(200)], self.vectors[::-1])
+        self.assertEqual(self.search('numpy', self.vectors[7].tolist(), top_k=1)[0]['chunk_id'], 5192)
+
+        # Without files the search falls back to chroma
+        NumpyVectorStore.delete(1)
+        self.assertIsNone(NumpyVectorStore.load(1))
+        self.assertEqual(self.search('numpy', self.vectors[7].tolist(), top_k=1)[0]['content'], "chunk 1007")
+
+    def test_index_is_built_from_stored_embeddings(self):
+        user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        document = make_document(user)
+        for index, vector in enumerate(self.vectors[:20]):
+            DocumentChunk.objects.create(document=document, content=f"chunk {index}", chunk_index=index, embedding=vector)
+        DocumentChunk.objects.create(document=document, content="not embedded", chunk_index=20, embedding=None)
+
+        self.assertEqual(VectorDBService.build_numpy_index(document.id, document.chunks.all()), 20)
+
+        results = NumpyVectorStore.search(document.id, self.vectors[4], top_k=1)
+        self.assertEqual(results[0]['chunk_id'], document.chunks.get(chunk_index=4).id)
+        self.assertAlmostEqual(results[0]['similarity_score'], 1.0, places=5)
+
+
+def index_document(document, vectors):
+    """Store chunks with the given embeddings for a document and write them to chroma"""
+    for index, vector in enumerate(vectors):
+        DocumentChunk.objects.create(
+            document=document, content=f"chunk {index}", chunk_index=index, page_number=1, page_start=1, page_end=1,
+            token_count=2, embedding=vector,
+        )
+    VectorDBService.upsert_chunks(document.id, document.chunks.order_by('id'))
+
+
+class SearchTestMixin:
+    """Completed document with 10 indexed chunks, query i is embedded as the vector of chunk i"""
+
+    def setUp(self):
+        use_temp_chroma(self)
+        QueryEmbeddingCache.clear()
+        self.addCleanup(QueryEmbeddingCache.clear)
+        caches[SearchResultCache.CACHE_ALIAS].clear()
+        self.addCleanup(caches[SearchResultCache.CACHE_ALIAS].clear)
+
+        self.user = get_user_model().objects.create_user(username='u', email='u@example.com', password='p')
+        self.document = make_document(self.user)
+        self.vectors = unit_vectors(10)
+        index_document(self.document, self.vectors)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        def embed(text):
+            return self.vectors[int(text.split()[-1])].tolist()
+
+        for name, side_effect in [
+            ('cache_namespace', lambda: 'test-model'),
+            ('generate_embedding', embed),
+            ('generate_embeddings_batch', lambda texts: [embed(text) for text in texts]),
+        ]:
+            patcher = mock.patch.object(EmbeddingService, name, side_effect=side_effect)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(
+            VectorDBService, 'search_similar_chunks_batch', side_effect=VectorDBService.search_similar_chunks_batch,
+        )
+        self.vector_search = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def batch_search(self, queries, **body):
+        return self.client.post(
+            f'/api/documents/{self.document.id}/batch_search/', dict(body, queries=queries, mode='vector'), format='json',
+        )
+
+
+class BatchSearchTests(SearchTestMixin, TestCase):
+
+    def test_queries_share_one_embedding_pass_and_vector_query(self):
+        with mock.patch.object(SearchResultCache, 'ENABLED', False):
+            response = self.batch_search(["chunk 3", "chunk 7", "chunk 3"], top_k=4)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['queries_count'], 3)
+        self.generate_embeddings_batch.assert_called_once_with(["chunk 3", "chunk 7"])
+        self.vector_search.assert_called_once()
+        results = response.data['results']
+        self.assertEqual([result['query'] for result in results], ["chunk 3", "chunk 7", "chunk 3"])
+        self.assertEqual([result['chunks'][0]['chunk_index'] for result in results], [3, 7, 3])
+        self.assertEqual([result['results_count'] for result in results], [4, 4, 4])
+
+        # Same chunks as searching each query alone
+        with mock.patch.object(SearchResultCache, 'ENABLED', False):
+            single = SearchService.search_document(self.document.id, "chunk 7", top_k=4, mode='vector')
+        self.assertEqual(results[1]['chunks'], single['chunks'])
+
+    def test_rejects_invalid_batches(self):
+        with mock.patch.object(SearchService, 'BATCH_MAX_QUERIES', 2):
+            self.assertEqual(self.batch_search(["chunk 1", "chunk 2", "chunk 3"]).status_code, 400)
+        for queries in ([], "chunk 1", ["chunk 1", "  "], ["chunk 1", 2]):
+            self.assertEqual(self.batch_search(queries).status_code, 400, queries)
+
+        Document.objects.filter(id=self.document.id).update(status='processing')
+        response = self.batch_search(["chunk 1"])
+        self.assertEqual((response.status_code, response.data['error']), (400, "Document is not ready : processing"))
+        self.vector_search.assert_not_called()
+
+
+class SearchResultCacheTests(SearchTestMixin, TestCase):
+
+    def search(self, query, top_k=3):
+        response = self.batch_search([query], top_k=top_k)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results'][0]['chunks']
+
+    def test_reindexing_invalidates_cached_results(self):
+        first = self.search("chunk 3")
+        self.assertEqual(first[0]['chunk_index'], 3)
+        self.assertEqual(self.search(" chunk  3 "), first)
+        self.assertEqual(self.vector_search.call_count, 1)
+
+        # Another top_k is another search
+        self.assertEqual(len(self.search("chunk 3", top_k=5)), 5)
+        self.assertEqual(self.vector_search.call_count, 2)
+
+        # Reindexed with the vectors in reverse order
+        self.assertTrue(self.document.mark_as_indexing())
+        self.assertEqual(self.batch_search(["chunk 3"]).status_code, 400)
+        self.document.chunks.all().delete()
+        VectorDBService.delete_collection(self.document.id)
+        index_document(self.document, self.vectors[::-1])
+        self.assertTrue(self.document.mark_as_completed())
+
+        results = self.search("chunk 3")
+        self.assertEqual(self.vector_search.call_count, 3)
+        self.assertEqual(results[0]['chunk_index'], 6)
+        self.assertEqual(self.search("chunk 3"), results)
+        self.assertEqual(self.vector_search.call_count, 3)
+
+
+class CollectionHandleCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        use_temp_chroma(self)
+        self.vectors = unit_vectors(5)
+        for document_id in (1, 2, 3):
+            VectorDBService.upsert_chunks(document_id, make_vector_chunks(document_id * 100, self.vectors))
+        client = VectorDBService.get_client()
+        patcher = mock.patch.object(
+            type(client), 'get_collection', autospec=True, side_effect=type(client).get_collection,
+        )
+        self.get_collection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, document_id):
+        return VectorDBService.search_similar_chunks(document_id, self.vectors[2].tolist(), top_k=1)[0]['chunk_id']
+
+    def test_handles_are_reused_and_least_recently_used_dropped(self):
+        with mock.patch.object(VectorDBService, 'COLLECTION_CACHE_SIZE', 2):
+            for document_id in (1, 1, 2, 1, 3, 2):
+                self.assertEqual(self.search(document_id), document_id * 100 + 2)
+
+        # 2 was evicted by 3, 1 was still recently used
+        self.assertEqual(
+            [call.kwargs['name'] for call in self.get_collection.call_args_list],
+            ['document_1', 'document_2', 'document_3', 'document_2'],
+        )
+
+    def test_collection_replaced_by_another_process_is_fetched_again(self):
+        self.assertEqual(self.search(1), 102)
+
+        # As the ingest worker does it, without going through this process's cache
+        client = VectorDBService.get_client()
+        client.delete_collection(name='document_1')
+        client.create_collection(name='document_1').upsert(
+            ids=["chunk : 900"], embeddings=[self.vectors[2]], documents=["new"],
+            metadatas=[{"chunk_id": 900, "chunk_index": 0, "page_number": 1}],
+        )
+
+        self.assertEqual(self.search(1), 900)
+        self.assertEqual(self.get_collection.call_count, 2)
+
+    def test_deleted_collection_is_forgotten(self):
+        self.assertEqual(self.search(1), 102)
+
+        VectorDBService.delete_collection(1)
+
+        with self.assertRaisesRegex(ValueError, "Collection not found : 1"):
+            self.search(1)
+        self.assertEqual(self.search(2), 202)
+
+
+class VectorCleanupTests(TestCase):
+
+    def setUp(self):
+        use_temp_chroma(self)
+        use_temp_numpy_store(self)
+        User = get_user_model()
+        self.user = User.objects.create_user(username='u', email='u@example.com', password='p')
+        self.other_user = User.objects.create_user(username='o', email='o@example.com', password='p')
+        self.first = self.index(self.user, seed=1)
+        self.second = self.index(self.user, seed=2)
+        self.foreign = self.index(self.other_user, seed=3)
+
+    def index(self, user, seed):
+        document = make_document(user)
+        index_document(document, unit_vectors(5, seed=seed))
+        chunks = document.chunks.order_by('id')
+        VectorDBService.upsert_chunks(
+            document.id, chunks, user_collection=VectorDBService.get_or_create_user_collection(user.id),
+        )
+        VectorDBService.build_numpy_index(document.id, chunks)
+        return document
+
+    def collection_names(self):
+        return {collection.name for collection in VectorDBService.get_client().list_collections()}
+
+    def user_vectors(self, user):
+        collection = VectorDBService.get_client().get_collection(name=VectorDBService.get_user_collection_name(user.id))
+        metadatas = collection.get(include=['metadatas'])['metadatas']
+        return sorted(metadata['document_id'] for metadata in metadatas)
+
+    def test_deleted_documents_are_cleaned_up_in_the_background(self):
+        first_id, foreign_id = self.first.id, self.foreign.id
+        self.first.delete()
+        self.foreign.delete()
+
+        self.assertEqual(
+            list(VectorCleanupTask.objects.values_list('document_id', 'user_id')),
+            [(first_id, self.user.id), (foreign_id, self.other_user.id)],
+        )
+        self.assertEqual(VectorCleanupService.process_pending(), 2)
+
+        self.assertFalse(VectorCleanupTask.objects.exists())
+        # The last document of the other user takes its user collection along
+        self.assertEqual(
+            self.collection_names(),
+            {f'document_{self.second.id}', f'user_{self.user.id}'},
+        )
+        self.assertEqual(self.user_vectors(self.user), [self.second.id] * 5)
+        self.assertFalse(NumpyVectorStore.exists(first_id))
+        self.assertTrue(NumpyVectorStore.exists(self.second.id))
+
+    def test_failed_cleanups_are_retried_a_limited_number_of_times(self):
+        self.first.delete()
+
+        with mock.patch.object(VectorCleanupService, 'remove_document_vectors', side_effect=RuntimeError("locked")):
+            for _ in range(VectorCleanupService.MAX_ATTEMPTS):
+                self.assertEqual(VectorCleanupService.process_pending(), 0)
+
+        task = VectorCleanupTask.objects.get()
+        self.assertEqual((task.attempts, task.last_error), (VectorCleanupService.MAX_ATTEMPTS, "locked"))
+        with mock.patch.object(VectorCleanupService, 'remove_document_vectors') as remove:
+            self.assertEqual(VectorCleanupService.process_pending(), 0)
+        remove.assert_not_called()
+
+    def test_garbage_collection_removes_orphans(self):
+        # Deleted while no cleanup task could be queued
+        Document.objects.filter(id__in=[self.first.id, self.foreign.id]).delete()
+        VectorCleanupTask.objects.all().delete()
+        names = self.collection_names()
+        expected = {'collections': 3, 'user_vectors': 5, 'numpy_files': 4}
+
+        output = io.StringIO()
+        call_command('vector_gc', '--dry-run', stdout=output)
+        self.assertIn("Orphans : 3 collections, 5 user collection vectors, 4 numpy files", output.getvalue())
+        self.assertEqual(self.collection_names(), names)
+        self.assertEqual(len(self.user_vectors(self.user)), 10)
+
+        self.assertEqual(VectorCleanupService.collect_garbage(), expected)
+
+        self.assertEqual(self.collection_names(), {f'document_{self.second.id}', f'user_{self.user.id}'})
+        self.assertEqual(self.user_vectors(self.user), [self.second.id] * 5)
+        self.assertEqual(
+            sorted(os.listdir(NumpyVectorStore.STORE_PATH)),
+            [f'document_{self.second.id}.ids.npy', f'document_{self.second.id}.npy'],
+        )
+        self.assertEqual(
+            VectorCleanupService.collect_garbage(), {'collections': 0, 'user_vectors': 0, 'numpy_files': 0},
+        )
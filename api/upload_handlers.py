@@ -0,0 +1,35 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingUploadMixin:
+    """
+    Compute the SHA-256 of an uploaded file while the request body streams in and set it
+    as content_hash on the file, so deduplication never reads the upload a second time
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Before super(): the memory handler ends new_file with StopFutureHandlers
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        # None means this handler kept the data (the memory handler passes it on when too big)
+        if passed_on is None:
+            self.digest.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.digest.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """Small uploads, kept in memory"""
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE, spooled to a temporary file"""
@@ -1,12 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DocumentViewSet
+from .views import DocumentViewSet, UploadBatchViewSet, UploadSessionViewSet, ReadinessView
 
 router = DefaultRouter()
 router.register('documents', DocumentViewSet)
+router.register('batches', UploadBatchViewSet)
+router.register('uploads', UploadSessionViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('health/ready/', ReadinessView.as_view(), name='readiness'),
 
    
 ]
\ No newline at end of file
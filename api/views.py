@@ -1,23 +1,25 @@
 from django.shortcuts import render
 from django.contrib.auth import get_user_model
-from rest_framework import viewsets, status, serializers
+from rest_framework import viewsets, mixins, status, serializers
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.views import APIView
 from rest_framework.decorators import action
 # Models
-from .models import Document
+from .models import Document, UploadBatch, UploadSession
 # Serializers
 from .serializers import (
-    DocumentSerializer, DocumentListSerializer, 
+    DocumentSerializer, DocumentListSerializer, UploadBatchSerializer, UploadSessionSerializer,
     ChatRequestSerializer, ChatResponseSerializer, ChatHistorySerializer
 )
 # Services
-from .services.pdf_service import PDFservice
-from .services.chunking_service import ChunkingService
-from .services.embedding_service import EmbeddingService
-from .services.vector_db_service import VectorDBService
+from .services.ingestion_service import IngestionService
+from .services.bulk_upload_service import BulkUploadService
+from .services.upload_service import ChunkedUploadService
 from .services.search_service import SearchService
 from .services.llm_service import LLMService
+from .services.embedding_service import EmbeddingService
+from .services.query_embedding_cache import QueryEmbeddingCache
 
 
 
@@ -53,61 +55,70 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             document = serializer.save()
 
-            # Mark as processing
-            document.mark_as_processing()
-            
-            try:
-                # extract text from pdf
-                print("Extracting text from pdf ...")
-                pdf_data = PDFservice.extract_text_from_pdf(document.file.path)
-
-                # Chunk the text
-                print("Chunking text ...")
-                chunk_count = ChunkingService.chunk_deocument(document, pdf_data)
-
-                # Generating embeddings
-                print("Generating embeddings ...")
-                embedded_count = EmbeddingService.embed_document_chunks(document)
-
-                # Add to vector database
-                print("Adding to vector database ...")
-                VectorDBService.add_chunks_to_collection(document.id, document.chunks.all())
-
-                # Update document
-                document.page_count = pdf_data['page_count']
-                document.mark_as_completed()
-
-                print("Processing complete!")
-
-                return Response({
-                    'id': document.id,
-                    'title': document.title,
-                    'status': document.status,
-                    'page_count': document.page_count,
-                    'chunk_count':chunk_count,
-                    'embedded_chunks': embedded_count,
-                    'message': 'Document uploaded and processed successfully successfully',
-
-                }, status=status.HTTP_201_CREATED)
-            
-            except Exception as e:
-                # Mark as failed if process failed
-                import traceback
-                error_detail = traceback.format_exc()
-                print (f"Error : {error_detail}")
-                document.mark_as_failed(str(e))
-
-                return Response({
-                    'id': document.id,
-                    'title': document.title,
-                    'status': 'failed',
-                    'error': str(e),
-                    'message': 'Document uploaded but process failed'
-                }, status=status.HTTP_400_BAD_REQUEST)
+            # Queue processing for the ingest worker (python manage.py run_ingest_worker),
+            # it reuses the chunks and vectors of an identical processed file when there is one
+            job = IngestionService.enqueue(document)
+
+            return Response({
+                'id': document.id,
+                'title': document.title,
+                'status': document.status,
+                'job_id': job.id,
+                'message': 'Document uploaded successfully, processing has been queued',
+            }, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+    # Upload many files at once (multipart "files" and/or a zip "archive")
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_upload(self, request):
+        files = request.FILES.getlist('files')
+        archive = request.FILES.get('archive')
+        if not files and not archive:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Count every file before any is stored, the archive from its directory
+        try:
+            file_count = len(files) + (BulkUploadService.count_archive_files(archive) if archive else 0)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if file_count > BulkUploadService.MAX_FILES:
+            return Response(
+                {'error': f'A bulk upload can contain at most {BulkUploadService.MAX_FILES} files'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def iter_files():
+            yield from files
+            if archive:
+                yield from BulkUploadService.iter_archive_files(archive)
+
+        try:
+            batch, rejected = BulkUploadService.create_batch(request, iter_files(), DocumentSerializer)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if batch is None:
+            return Response({
+                'error': 'No valid files provided',
+                'rejected': rejected,
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        documents = batch.documents.order_by('id')
+        return Response({
+            'batch_id': batch.id,
+            'file_count': batch.file_count,
+            'documents': [
+                {'id': document.id, 'title': document.title, 'status': document.status}
+                for document in documents
+            ],
+            'rejected': rejected,
+            'message': 'Documents uploaded successfully, processing has been queued',
+        }, status=status.HTTP_202_ACCEPTED)
+
+
     # Delete the selected document
     def destroy(self, request, pk=None):
         document = self.get_object()
@@ -147,22 +158,33 @@ class DocumentViewSet(viewsets.ModelViewSet):
         : Request body:
         {
             "query": "What is the user's experience?",
-            "top_k": 5  (optional, default: 5)
+            "top_k": 5,  (optional, default: 5)
+            "mode": "hybrid"  (optional, "vector" or "hybrid", default: SEARCH_MODE)
         }
         """
 
         document = self.get_object()
         query = request.data.get('query')
-        top_k = request.data.get('top_k', 5)
+        mode = request.data.get('mode')
 
-        if not query:
+        if not query or not isinstance(query, str):
             return Response({'error':'Query is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_k = int(request.data.get('top_k', 5))
+        except (TypeError, ValueError):
+            return Response({'error':'top_k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if top_k < 1:
+            return Response({'error':'top_k must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        if mode is not None and mode not in SearchService.MODES:
+            return Response({'error':f"mode must be one of {', '.join(SearchService.MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             # Search document 
             document_chunks = SearchService.search_document(
                 document_id=document.id,
                 query=query,
-                top_k=top_k
+                top_k=top_k,
+                mode=mode
             )
             # Context for ai 
             # context = SearchService.build_context(document_chunks)
@@ -179,6 +201,81 @@ class DocumentViewSet(viewsets.ModelViewSet):
             return Response({'error': f'Search failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    @action(detail=True, methods=['post'])
+    def batch_search(self, request, pk=None):
+        """
+        Search the document for many queries in one request
+        
+        : Request body:
+        {
+            "queries": ["What is the conclusion?", "Who are the authors?"],
+            "top_k": 5,  (optional, default: 5)
+            "mode": "vector"  (optional, "vector" or "hybrid", default: SEARCH_MODE)
+        }
+        """
+        document = self.get_object()
+        queries = request.data.get('queries')
+        mode = request.data.get('mode')
+
+        if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query.strip() for query in queries):
+            return Response({'error':'queries must be a non empty list of questions'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(queries) > SearchService.BATCH_MAX_QUERIES:
+            return Response(
+                {'error': f'A batch search can contain at most {SearchService.BATCH_MAX_QUERIES} queries'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            top_k = int(request.data.get('top_k', 5))
+        except (TypeError, ValueError):
+            return Response({'error':'top_k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if top_k < 1:
+            return Response({'error':'top_k must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        if mode is not None and mode not in SearchService.MODES:
+            return Response({'error':f"mode must be one of {', '.join(SearchService.MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = SearchService.search_document_batch(document.id, queries, top_k=top_k, mode=mode)
+            return Response(results, status=status.HTTP_200_OK)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            import traceback
+            print(traceback.format_exc())
+            return Response({'error': f'Search failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+    @action(detail=False, methods=['post'])
+    def search_all(self, request):
+        """
+        Search for relevent chunks across all processed documents of the user
+        
+        : Request body:
+        {
+            "query": "Which contracts mention a termination fee?",
+            "top_k": 10  (optional, default: 5)
+        }
+        """
+        query = request.data.get('query')
+        if not query:
+            return Response({'error':'Query is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_k = int(request.data.get('top_k', 5))
+        except (TypeError, ValueError):
+            return Response({'error':'top_k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if top_k < 1:
+            return Response({'error':'top_k must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = SearchService.search_user_documents(request.user, query, top_k=top_k)
+            return Response(results, status=status.HTTP_200_OK)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            import traceback
+            print(traceback.format_exc())
+            return Response({'error': f'Search failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
     @action(detail=True, methods=['post'])
     def chat(self, request, pk=None):
         """
@@ -267,3 +364,99 @@ class DocumentViewSet(viewsets.ModelViewSet):
             
         except ValueError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadBatchViewSet(viewsets.ReadOnlyModelViewSet):
+    """Progress of bulk uploads of the current user"""
+    queryset = UploadBatch.objects.all()
+    serializer_class = UploadBatchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadBatch.objects.filter(user=self.request.user).prefetch_related('documents')
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable upload of large files:
+    POST api/uploads/ -> PUT api/uploads/{id}/parts/{n}/ (raw bytes) -> POST api/uploads/{id}/complete/
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).prefetch_related('parts')
+
+    # Part body is read straight from the request stream, never parsed into memory
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<part_number>[0-9]+)')
+    def part(self, request, pk=None, part_number=None):
+        session = self.get_object()
+
+        try:
+            part = ChunkedUploadService.write_part(
+                session,
+                int(part_number),
+                request.stream,
+                expected_hash=request.headers.get('X-Content-SHA256'),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'part_number': part.part_number,
+            'size': part.size,
+            'sha256': part.sha256,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+
+        try:
+            document = ChunkedUploadService.complete(session)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = IngestionService.enqueue(document)
+
+        return Response({
+            'id': document.id,
+            'title': document.title,
+            'status': document.status,
+            'job_id': job.id,
+            'message': 'Document uploaded successfully, processing has been queued',
+        }, status=status.HTTP_202_ACCEPTED)
+
+    # Abort the upload and delete what was received
+    def destroy(self, request, pk=None):
+        session = self.get_object()
+
+        try:
+            ChunkedUploadService.abort(session)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'message': 'Upload aborted'}, status=status.HTTP_200_OK)
+
+
+class ReadinessView(APIView):
+    """
+    Readiness probe for the load balancer: 503 until this worker can embed queries
+    (model loaded, or the embedding server answering), so no request hits a cold worker
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        model_loaded = EmbeddingService.is_loaded()
+        if EmbeddingService.is_ready():
+            return Response({
+                'status': 'ready',
+                'model_loaded': model_loaded,
+                'query_embedding_cache': QueryEmbeddingCache.stats(),
+            }, status=status.HTTP_200_OK)
+
+        # Nothing preloaded the model (EMBEDDING_PRELOAD off, embedding server down), start loading it now
+        EmbeddingService.warm_up_in_background()
+        return Response({'status': 'loading', 'model_loaded': model_loaded}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -188,8 +188,77 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB, bigger uploads are spooled to a temp file
+FILE_UPLOAD_HANDLERS = [  # Django's handlers, also hashing the file as it arrives (deduplication)
+    'api.upload_handlers.HashingMemoryFileUploadHandler',
+    'api.upload_handlers.HashingTemporaryFileUploadHandler',
+]
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+MAX_UPLOAD_SIZE = config('MAX_UPLOAD_SIZE', default=250 * 1024 * 1024, cast=int)  # largest accepted pdf (bytes)
+UPLOAD_PART_SIZE = config('UPLOAD_PART_SIZE', default=8 * 1024 * 1024, cast=int)  # part size of resumable uploads (bytes)
+UPLOAD_SESSION_TTL = config('UPLOAD_SESSION_TTL', default=24, cast=int)  # hours before an unfinished upload expires
 
 # Gemini api 
-GEMINI_API_KEY = config('GEMINI_API_KEY')
\ No newline at end of file
+GEMINI_API_KEY = config('GEMINI_API_KEY')
+
+# Background ingestion worker (python manage.py run_ingest_worker)
+INGEST_WORKER_CONCURRENCY = config('INGEST_WORKER_CONCURRENCY', default=2, cast=int)
+INGEST_VISIBILITY_TIMEOUT = config('INGEST_VISIBILITY_TIMEOUT', default=600, cast=int)  # seconds
+INGEST_POLL_INTERVAL = config('INGEST_POLL_INTERVAL', default=2, cast=float)  # seconds
+INGEST_MAX_ATTEMPTS = config('INGEST_MAX_ATTEMPTS', default=3, cast=int)
+INGEST_BATCH_SIZE = config('INGEST_BATCH_SIZE', default=64, cast=int)  # chunks embedded and indexed per batch
+INGEST_BATCH_CONCURRENCY = config('INGEST_BATCH_CONCURRENCY', default=2, cast=int)  # documents of one bulk upload processed at once (0 = no cap)
+
+# PDF extraction
+PDF_PARALLEL_MIN_PAGES = config('PDF_PARALLEL_MIN_PAGES', default=20, cast=int)  # smaller pdfs use a single process
+PDF_EXTRACT_WORKERS = config('PDF_EXTRACT_WORKERS', default=min(4, os.cpu_count() or 1), cast=int)
+PDF_EXTRACT_RANGE_PAGES = config('PDF_EXTRACT_RANGE_PAGES', default=8, cast=int)  # pages per worker task, one task per worker in flight
+PAGE_TEXT_CACHE_ENABLED = config('PAGE_TEXT_CACHE_ENABLED', default=True, cast=bool)  # keep extracted page texts so re-chunking skips parsing
+
+# Persistent embedding cache (keyed by model name + normalized text)
+EMBEDDING_CACHE_ENABLED = config('EMBEDDING_CACHE_ENABLED', default=True, cast=bool)
+EMBEDDING_CACHE_PATH = config('EMBEDDING_CACHE_PATH', default=os.path.join(BASE_DIR, 'embedding_cache.sqlite3'))
+EMBEDDING_CACHE_MAX_ENTRIES = config('EMBEDDING_CACHE_MAX_ENTRIES', default=200000, cast=int)  # ~1.6KB each for 384 dims
+EMBEDDING_STORAGE_DTYPE = config('EMBEDDING_STORAGE_DTYPE', default='float32')  # float32 or float16 for DocumentChunk.embedding
+EMBEDDING_PRELOAD = config('EMBEDDING_PRELOAD', default=False, cast=bool)  # load the model at start up (gunicorn.conf.py turns it on)
+EMBEDDING_BACKEND = config('EMBEDDING_BACKEND', default='torch')  # torch or onnx (int8 quantized, CPU only)
+EMBEDDING_ONNX_MODEL_PATH = config('EMBEDDING_ONNX_MODEL_PATH', default=os.path.join(BASE_DIR, 'models', 'all-MiniLM-L6-v2-onnx'))
+EMBEDDING_ONNX_FILE = config('EMBEDDING_ONNX_FILE', default='onnx/model_quint8_avx2.onnx')  # written by manage.py export_onnx_model
+EMBEDDING_BATCH_SIZE = config('EMBEDDING_BATCH_SIZE', default=64, cast=int)  # texts of similar length encoded per forward pass
+EMBEDDING_ENCODE_PROCESSES = config('EMBEDDING_ENCODE_PROCESSES', default=1, cast=int)  # > 1 spreads large encodes over a process pool (torch backend)
+EMBEDDING_MULTIPROCESS_MIN_TEXTS = config('EMBEDDING_MULTIPROCESS_MIN_TEXTS', default=1024, cast=int)  # smaller encodes stay in process
+
+# Embedding server (python manage.py run_embedding_server), empty = encode queries in process
+EMBEDDING_SERVER_URL = config('EMBEDDING_SERVER_URL', default='')  # e.g. http://127.0.0.1:8765
+EMBEDDING_SERVER_TIMEOUT = config('EMBEDDING_SERVER_TIMEOUT', default=2, cast=float)  # seconds, then fall back to in process
+EMBEDDING_SERVER_MAX_BATCH = config('EMBEDDING_SERVER_MAX_BATCH', default=32, cast=int)
+EMBEDDING_SERVER_MAX_WAIT_MS = config('EMBEDDING_SERVER_MAX_WAIT_MS', default=5, cast=float)
+
+# Query embeddings (repeated questions skip the model)
+QUERY_EMBEDDING_CACHE_SIZE = config('QUERY_EMBEDDING_CACHE_SIZE', default=1024, cast=int)  # entries per process, 0 disables
+QUERY_EMBEDDING_CACHE_ALIAS = config('QUERY_EMBEDDING_CACHE_ALIAS', default='')  # Django cache alias to share entries across workers
+QUERY_EMBEDDING_CACHE_TIMEOUT = config('QUERY_EMBEDDING_CACHE_TIMEOUT', default=86400, cast=int)  # seconds, Django cache only
+
+# Vector database
+VECTOR_DB_BATCH_SIZE = config('VECTOR_DB_BATCH_SIZE', default=256, cast=int)  # chunks per chroma upsert
+VECTOR_DB_COLLECTION_CACHE_SIZE = config('VECTOR_DB_COLLECTION_CACHE_SIZE', default=1024, cast=int)  # chroma collection handles kept per process
+VECTOR_DB_BACKEND = config('VECTOR_DB_BACKEND', default='chroma')  # chroma, numpy (exact search on .npy files) or auto
+VECTOR_DB_NUMPY_MAX_CHUNKS = config('VECTOR_DB_NUMPY_MAX_CHUNKS', default=20000, cast=int)  # auto: larger documents stay on chroma
+VECTOR_STORE_PATH = config('VECTOR_STORE_PATH', default=os.path.join(BASE_DIR, 'vector_store'))
+VECTOR_CLEANUP_MAX_ATTEMPTS = config('VECTOR_CLEANUP_MAX_ATTEMPTS', default=5, cast=int)  # tries to remove the vectors of a deleted document
+VECTOR_GC_SEGMENT_GRACE_PERIOD = config('VECTOR_GC_SEGMENT_GRACE_PERIOD', default=600, cast=int)  # seconds, vector_gc keeps younger orphan chroma segment directories
+
+# Search
+SEARCH_MODE = config('SEARCH_MODE', default='vector')  # vector or hybrid (vector + BM25 keyword with reciprocal rank fusion, SQLite FTS5)
+SEARCH_HYBRID_CANDIDATES = config('SEARCH_HYBRID_CANDIDATES', default=10, cast=int)  # results of each retriever fused in hybrid mode
+SEARCH_BATCH_MAX_QUERIES = config('SEARCH_BATCH_MAX_QUERIES', default=50, cast=int)  # queries per batch_search request
+SEARCH_CACHE_ENABLED = config('SEARCH_CACHE_ENABLED', default=True, cast=bool)  # cache results per (document, index version, query, top_k)
+SEARCH_CACHE_ALIAS = config('SEARCH_CACHE_ALIAS', default='default')  # Django cache holding search results
+SEARCH_CACHE_TIMEOUT = config('SEARCH_CACHE_TIMEOUT', default=600, cast=int)  # seconds
+
+# Chunking (sizes in cl100k_base tokens)
+CHUNK_TOKENS = config('CHUNK_TOKENS', default=250, cast=int)
+CHUNK_OVERLAP_TOKENS = config('CHUNK_OVERLAP_TOKENS', default=50, cast=int)
+
+# Bulk upload
+BULK_UPLOAD_MAX_FILES = config('BULK_UPLOAD_MAX_FILES', default=500, cast=int)
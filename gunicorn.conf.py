@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for documind
+
+    gunicorn documind.wsgi
+
+The app (and with it the embedding model) is loaded once in the master before
+the workers are forked, so every worker shares the model weights copy-on-write
+instead of loading its own copy on its first request.
+"""
+import gc
+import os
+
+
+# Read by documind/settings.py -> ApiConfig.ready() loads the model during preload
+os.environ.setdefault('EMBEDDING_PRELOAD', 'True')
+# HF tokenizers refuse to use their thread pool after a fork, and warn about it
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+# Plain os.environ here, gunicorn reserves the name `config` in this file
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Objects created during preload are never collected, keeping the gc from
+    # writing to (and so copying) the shared pages in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Torch thread pools are not inherited across fork, build them in the worker
+    # with a tiny encode so the first real request isn't slower
+    from api.services.embedding_service import EmbeddingService
+    if EmbeddingService.is_loaded():
+        EmbeddingService.warm_up()